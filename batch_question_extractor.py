@@ -11,6 +11,10 @@ Features:
 - No S No column - completely removed
 - Subject/Topic/Subtopic naming convention
 - Dynamic output file naming
+- Byte-offset row index (built once, stored next to the CSV) so any batch
+  is read without parsing the rows before it
+- Multi-batch mode: one streaming pass over a range, Excel files written in
+  parallel worker processes
 """
 
 import pandas as pd
@@ -18,8 +22,12 @@ import os
 import sys
 import argparse
 import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from typing import Tuple, Optional
+from typing import List, Tuple, Optional
+
+from csv_row_index import CsvRowIndex
 
 # Setup logging
 logging.basicConfig(
@@ -29,6 +37,21 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def write_excel_file(df: pd.DataFrame, output_path: str) -> str:
+    """
+    Write one batch to Excel (module-level so it can run in a worker process)
+
+    Args:
+        df: DataFrame in Excel format
+        output_path: Destination file
+
+    Returns:
+        output_path
+    """
+    df.to_excel(output_path, index=False, engine='openpyxl')
+    return output_path
+
+
 class BatchQuestionExtractor:
     """
     Extracts batches of questions from main CSV and converts to Excel format
@@ -80,6 +103,24 @@ class BatchQuestionExtractor:
         # Initialize encoding to be detected during validation
         self.encoding = 'utf-8'
 
+        # Row offset index, loaded (or built on first use) by get_row_index()
+        self.row_index = None
+
+    def get_row_index(self) -> CsvRowIndex:
+        """
+        Load the CSV's row index, building it on first use
+
+        The index also stores the row count and detected encoding, so later
+        runs neither rescan the file nor retry encodings.
+
+        Returns:
+            CsvRowIndex for the input CSV
+        """
+        if self.row_index is None:
+            self.row_index = CsvRowIndex(self.input_csv_path).load_or_build()
+            self.encoding = self.row_index.encoding
+        return self.row_index
+
     def validate_input_file(self) -> bool:
         """
         Validate that the input CSV file exists and has correct structure
@@ -92,21 +133,8 @@ class BatchQuestionExtractor:
             return False
 
         try:
-            # Read just the header to check columns - try different encodings
-            encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-            header = None
-            
-            for encoding in encodings:
-                try:
-                    header = pd.read_csv(self.input_csv_path, nrows=0, encoding=encoding)
-                    self.encoding = encoding
-                    break
-                except UnicodeDecodeError:
-                    continue
-                    
-            if header is None:
-                logger.error("Could not read CSV with any standard encoding")
-                return False
+            # Read just the header to check columns, using the indexed encoding
+            header = pd.read_csv(self.input_csv_path, nrows=0, encoding=self.get_row_index().encoding)
                 
             required_columns = list(self.column_mapping.keys())
             
@@ -130,24 +158,8 @@ class BatchQuestionExtractor:
             Total row count
         """
         try:
-            # Count lines in file - try different encodings
-            encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-            total_lines = 0
-            
-            for encoding in encodings:
-                try:
-                    with open(self.input_csv_path, 'r', encoding=encoding) as f:
-                        total_lines = sum(1 for _ in f)
-                    break
-                except UnicodeDecodeError:
-                    continue
-            
-            if total_lines == 0:
-                logger.error("Could not count rows with any standard encoding")
-                return 0
-                
-            # Subtract 1 for header
-            return total_lines - 1
+            # Counted once when the row index is built (CSV records, not physical lines)
+            return self.get_row_index().total_rows
         except Exception as e:
             logger.error(f"Error counting rows: {e}")
             return 0
@@ -165,32 +177,11 @@ class BatchQuestionExtractor:
         """
         logger.info(f"Extracting rows {start_row} to {end_row} from {self.input_csv_path}")
         
-        # Convert to 0-based indexing for pandas
-        skip_rows = start_row - 1 if start_row > 1 else 0
-        num_rows = end_row - start_row + 1
-        
         try:
-            # Try different encodings for extraction
-            encodings = ['latin-1', 'cp1252', 'iso-8859-1', 'utf-8']
-            df = None
-            
-            for encoding in encodings:
-                try:
-                    logger.info(f"Trying encoding: {encoding}")
-                    df = pd.read_csv(
-                        self.input_csv_path,
-                        skiprows=range(1, skip_rows + 1),  # Skip header + rows before start
-                        nrows=num_rows,
-                        usecols=list(self.column_mapping.keys()),
-                        encoding=encoding
-                    )
-                    logger.info(f"Successfully used encoding: {encoding}")
-                    break
-                except UnicodeDecodeError:
-                    continue
-                    
-            if df is None:
-                raise Exception("Could not read CSV with any standard encoding")
+            # Seek straight to the first requested row and parse only this slice
+            row_index = self.get_row_index()
+            df = row_index.read_rows(start_row, end_row, usecols=list(self.column_mapping.keys()))
+            logger.info(f"Read with encoding: {row_index.encoding}")
             
             logger.info(f"Successfully extracted {len(df)} rows")
             
@@ -348,6 +339,64 @@ class BatchQuestionExtractor:
         return output_path
 
 
+    def extract_and_convert_batches(self, start_row: int, end_row: int, batch_size: int,
+                                    workers: Optional[int] = None) -> List[str]:
+        """
+        Split a row range into batch files with a single pass over the CSV
+
+        Rows are streamed in batch_size chunks; openpyxl serialization is
+        CPU-bound, so each batch is written by a pool of worker processes.
+
+        Args:
+            start_row: Starting row number (1-based)
+            end_row: Ending row number (1-based, inclusive)
+            batch_size: Rows per output file
+            workers: Worker processes for Excel writing (default: CPU count)
+
+        Returns:
+            Paths of the saved Excel files, in row order
+        """
+        if start_row < 1 or end_row < start_row:
+            raise ValueError("Invalid row range. start_row must be >= 1 and end_row >= start_row")
+        if batch_size < 1:
+            raise ValueError("batch_size must be >= 1")
+
+        total_rows = self.get_total_rows()
+        if end_row > total_rows:
+            logger.warning(f"Requested end_row ({end_row}) exceeds total rows ({total_rows}). Adjusting to {total_rows}")
+            end_row = total_rows
+
+        workers = max(1, workers or os.cpu_count() or 1)
+        num_batches = (end_row - start_row) // batch_size + 1
+        logger.info(f"Extracting rows {start_row:,} to {end_row:,} into {num_batches} files "
+                    f"of up to {batch_size:,} rows ({workers} writer processes)")
+
+        # Keep a bounded number of batches queued so memory stays flat on large ranges
+        window = workers * 2
+        pending = deque()
+        output_paths = []
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            batch_start = start_row
+            for df in self.get_row_index().iter_rows(start_row, end_row, batch_size,
+                                                     usecols=list(self.column_mapping.keys())):
+                batch_end = batch_start + len(df) - 1
+                excel_df = self.convert_to_excel_format(df.reset_index(drop=True), batch_start)
+                output_path = os.path.join(self.output_folder, f"questions_{batch_start}_{batch_end}.xlsx")
+                pending.append(executor.submit(write_excel_file, excel_df, output_path))
+                batch_start = batch_end + 1
+
+                while len(pending) >= window:
+                    output_paths.append(pending.popleft().result())
+                    logger.info(f"Saved {output_paths[-1]} ({len(output_paths)}/{num_batches})")
+
+            while pending:
+                output_paths.append(pending.popleft().result())
+                logger.info(f"Saved {output_paths[-1]} ({len(output_paths)}/{num_batches})")
+
+        return output_paths
+
+
 def main():
     """Main function for command-line usage"""
     parser = argparse.ArgumentParser(description='Extract batches of questions from main CSV')
@@ -355,6 +404,10 @@ def main():
     parser.add_argument('--end', type=int, required=True, help='Ending row number (1-based, inclusive)')
     parser.add_argument('--input', type=str, default='mainexcel/mate.csv', help='Input CSV file path')
     parser.add_argument('--output', type=str, default='input', help='Output folder path')
+    parser.add_argument('--batch-size', type=int,
+                        help='Split the range into files of this many rows in one pass')
+    parser.add_argument('--workers', type=int,
+                        help='Worker processes for writing batch files (default: CPU count)')
     
     args = parser.parse_args()
     
@@ -370,6 +423,17 @@ def main():
         total_rows = extractor.get_total_rows()
         logger.info(f"Total questions available: {total_rows:,}")
         
+        if args.batch_size:
+            output_paths = extractor.extract_and_convert_batches(
+                args.start, args.end, args.batch_size, args.workers
+            )
+            
+            print(f"\n🎉 SUCCESS!")
+            print(f"📊 Extracted rows {args.start:,} to {args.end:,} into {len(output_paths)} files")
+            for output_path in output_paths:
+                print(f"💾 {output_path}")
+            return
+        
         # Extract and convert
         output_path = extractor.extract_and_convert(args.start, args.end)
         
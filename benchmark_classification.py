@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Benchmark Classification Modes - Compare single-stage and hierarchical prompts
+
+Classifies the same questions from the separated workbook once per mode and
+reports requests, prompt/completion tokens, latency and how often each mode
+agrees with the full-list answer:
+- full: single-stage prompt listing every triplet of the exam
+- shortlist: single-stage prompt with the BM25 candidate shortlist (default setup)
+- hierarchical: subject picked locally, then only that subject's triplets
+- hierarchical-ai: subject picked with a tiny prompt, then only that subject's triplets
+
+The cache and rule-based classifier are disabled so every question reaches the
+model. "api" is the mean time per request and "wall" the time per question,
+subject pass included. Both include waits for the shared rate limiter, which
+earlier modes in the same run draw down; use --modes to time one mode per run.
+With --dry-run no API is called and prompt tokens are counted locally
+(hierarchical-ai is skipped since it needs the model's subject answer).
+
+Usage:
+    python benchmark_classification.py --exam TNPSC --limit 20
+    python benchmark_classification.py --exam SSC-Railways --dry-run
+    OPENAI_API_KEY=sk-stub OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python benchmark_classification.py
+"""
+
+import argparse
+import copy
+import logging
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from config import get_config
+from exam_specific_classifier import ExamSpecificClassifier
+from token_estimator import TokenEstimator
+
+MODES = ["full", "shortlist", "hierarchical", "hierarchical-ai"]
+
+
+def load_questions(input_file: str, exam_type: str, limit: int) -> List[Tuple[str, str]]:
+    """
+    Read (question, explanation) pairs from one tab of the separated workbook
+
+    Args:
+        input_file: Separated Excel file
+        exam_type: Tab to read
+        limit: Maximum number of questions
+
+    Returns:
+        List of (question, explanation) tuples
+    """
+    df = pd.read_excel(input_file, sheet_name=exam_type)
+    df = df[df['Questions'].notna()].head(limit)
+    explanations = df['Explanation'] if 'Explanation' in df.columns else [""] * len(df)
+    return [(str(q), "" if pd.isna(e) else str(e)) for q, e in zip(df['Questions'], explanations)]
+
+
+def mode_config(base_config: Dict, mode: str, dry_run: bool) -> Dict:
+    """Configuration for one benchmark mode"""
+    config = copy.deepcopy(base_config)
+    config["cache"]["enabled"] = False
+    config["rule_based"]["enabled"] = False
+    config["retrieval"]["enabled"] = mode == "shortlist"
+    config["hierarchical"]["enabled"] = mode.startswith("hierarchical")
+    config["hierarchical"]["subject_detection"] = "ai" if mode == "hierarchical-ai" else "local"
+    if dry_run:
+        config["provider"]["primary_provider"] = "none"
+        config["provider"]["fallback_provider"] = "none"
+    return config
+
+
+def run_mode(classifier: ExamSpecificClassifier,
+             questions: List[Tuple[str, str]]) -> Tuple[Dict, List[Optional[str]]]:
+    """
+    Classify every question with the API and collect token and latency figures
+
+    Returns:
+        Tuple of (result row, triplet per question or None)
+    """
+    # Leave out the connection test sent when the client was created
+    client = classifier.openai_client
+    baseline = dict(client.get_stats()) if client else {}
+
+    answers = []
+    latencies = []
+    for question, explanation in questions:
+        start = time.perf_counter()
+        result = classifier.classify_question(question, explanation)
+        latencies.append(time.perf_counter() - start)
+        answers.append(f"{result['subject']} > {result['topic']} > {result['subtopic']}" if result else None)
+
+    client_stats = client.get_stats() if client else {}
+    requests = client_stats.get("successful_requests", 0) - baseline.get("successful_requests", 0)
+    api_time = (client_stats.get("average_response_time", 0) * client_stats.get("successful_requests", 0) -
+                baseline.get("average_response_time", 0) * baseline.get("successful_requests", 0))
+
+    def delta(key: str) -> int:
+        return client_stats.get(key, 0) - baseline.get(key, 0)
+
+    row = {
+        "classified": sum(1 for a in answers if a),
+        "requests": delta("total_requests"),
+        "input_tokens": delta("total_input_tokens"),
+        "cached_tokens": delta("total_cached_tokens"),
+        "output_tokens": delta("total_output_tokens"),
+        "api_time": api_time / max(1, requests),
+        "latency": sum(latencies) / max(1, len(latencies))
+    }
+    return row, answers
+
+
+def run_dry(classifier: ExamSpecificClassifier, questions: List[Tuple[str, str]],
+            estimator: TokenEstimator) -> Dict:
+    """Count prompt tokens of every question's first request without calling the API"""
+    input_tokens = 0
+    start = time.perf_counter()
+    for question, explanation in questions:
+        prompt, _ = classifier.build_request(question, explanation)
+        input_tokens += estimator.count_tokens(prompt)
+    elapsed = time.perf_counter() - start
+    return {
+        "classified": len(questions),
+        "requests": len(questions),
+        "input_tokens": input_tokens,
+        "cached_tokens": 0,
+        "output_tokens": 0,
+        "api_time": 0.0,
+        "latency": elapsed / max(1, len(questions))
+    }
+
+
+def run_benchmark(exam_type: str, questions: List[Tuple[str, str]], modes: List[str], dry_run: bool):
+    """Run each mode over the same questions and print a table"""
+    base_config = get_config()
+    estimator = TokenEstimator(base_config.get("openai", {}).get("model", "gpt-4o-mini"))
+    reference = None
+
+    print(f"{'mode':>15} | {'ok':>5} | {'requests':>8} | {'input tok':>10} | {'cached':>8} | "
+          f"{'output tok':>10} | {'tok/question':>12} | {'api (s)':>7} | {'wall (s)':>8} | agreement")
+    print("-" * 120)
+
+    for mode in modes:
+        if dry_run and mode == "hierarchical-ai":
+            print(f"{mode:>15} | skipped (needs the API)")
+            continue
+
+        classifier = ExamSpecificClassifier(exam_type, mode_config(base_config, mode, dry_run))
+        if not dry_run and not classifier.openai_client and not classifier.ollama_client:
+            print(f"{mode:>15} | skipped (no AI provider available)")
+            continue
+
+        if dry_run:
+            row, answers = run_dry(classifier, questions, estimator), None
+        else:
+            row, answers = run_mode(classifier, questions)
+
+        # Agreement with the first mode that produced answers (the full list by default)
+        agreement = "-"
+        if answers is not None:
+            if reference is None:
+                reference = answers
+            matched = sum(1 for a, r in zip(answers, reference) if a and a == r)
+            agreement = f"{matched}/{sum(1 for r in reference if r)}"
+
+        per_question = (row["input_tokens"] + row["output_tokens"]) / max(1, len(questions))
+        print(f"{mode:>15} | {row['classified']:5d} | {row['requests']:8d} | {row['input_tokens']:10d} | "
+              f"{row['cached_tokens']:8d} | {row['output_tokens']:10d} | {per_question:12.0f} | "
+              f"{row['api_time']:7.3f} | {row['latency']:8.3f} | {agreement}")
+
+        stats = classifier.get_statistics()
+        logging.getLogger(__name__).debug(
+            f"{mode}: {stats['subject_sublist_prompts']} subject sublists, "
+            f"{stats['shortlisted_prompts']} shortlists, {stats['full_list_prompts']} full lists"
+        )
+
+
+def main():
+    """Main entry point"""
+    config = get_config()
+    parser = argparse.ArgumentParser(description='Benchmark single-stage and hierarchical classification')
+    parser.add_argument('--input', default=config["paths"]["separated_excel"],
+                        help='Separated Excel file with one tab per exam')
+    parser.add_argument('--exam', default='TNPSC', choices=['TNPSC', 'Banking', 'SSC-Railways'],
+                        help='Exam tab to benchmark')
+    parser.add_argument('--limit', type=int, default=20, help='Number of questions to classify per mode')
+    parser.add_argument('--modes', nargs='+', default=MODES, choices=MODES, help='Modes to compare')
+    parser.add_argument('--dry-run', action='store_true', help='Count prompt tokens locally without API calls')
+    args = parser.parse_args()
+
+    # Per-request logging would drown the table
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s - %(message)s')
+
+    try:
+        questions = load_questions(args.input, args.exam, args.limit)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Cannot read {args.exam} questions from {args.input}: {e}")
+        return 1
+    if not questions:
+        print(f"No {args.exam} questions in {args.input}")
+        return 1
+
+    print("CLASSIFICATION MODE BENCHMARK")
+    print("=" * 120)
+    print(f"{args.exam}: {len(questions)} questions{' (dry run)' if args.dry_run else ''}\n")
+    run_benchmark(args.exam, questions, args.modes, args.dry_run)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark Ollama Client Overhead - Compare per-call connections with the pooled session
+
+Starts an in-process Ollama stub server and measures the client-side cost of
+a request, which is all overhead since the stub answers instantly:
+- per-call: module-level requests.post per request (a new TCP connection each time)
+- pooled: OllamaClient.make_request over the keep-alive session
+- fallback per-call: /api/tags fetched before every fallback attempt, then the request
+- fallback pooled: OllamaClient._attempt_fallback_model with the cached model list
+
+Usage:
+    python benchmark_ollama_client.py
+    python benchmark_ollama_client.py --requests 500 --connection-delay 0.002
+"""
+
+import argparse
+import copy
+import logging
+import sys
+import threading
+import time
+from typing import Callable, Dict
+
+import requests
+
+from config import get_config
+from ollama_client import OllamaClient
+from ollama_stub_server import create_stub_server
+
+PROMPT = "Respond with exactly: 'ok'"
+
+
+def legacy_generate(host: str, payload: Dict) -> str:
+    """Previous request path: module-level requests.post"""
+    response = requests.post(f"{host}/api/generate", json=payload, timeout=30)
+    return response.json().get("response", "")
+
+
+def legacy_fallback(host: str, payload: Dict, model: str) -> str:
+    """Previous fallback path: fetch /api/tags, then send the request"""
+    response = requests.get(f"{host}/api/tags", timeout=5)
+    available_models = [m["name"] for m in response.json().get("models", [])]
+    if model not in available_models:
+        return ""
+    return legacy_generate(host, {**payload, "model": model})
+
+
+def time_calls(name: str, call: Callable[[], str], count: int, server) -> Dict:
+    """Run a call count times and report the mean latency and server-side counters"""
+    before = server.state.get_stats()
+    start = time.perf_counter()
+    for _ in range(count):
+        if call() != "ok":
+            raise RuntimeError(f"{name}: unexpected response")
+    elapsed = time.perf_counter() - start
+    after = server.state.get_stats()
+    return {
+        "name": name,
+        "ms_per_call": elapsed / count * 1000,
+        "connections": after["connections"] - before["connections"],
+        "tags": after["tags"] - before["tags"]
+    }
+
+
+def run_benchmark(count: int, connection_delay: float):
+    """Time each request path against the stub and print a table"""
+    server = create_stub_server(port=0, connection_delay=connection_delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host = f"http://127.0.0.1:{server.server_port}"
+
+    config = copy.deepcopy(get_config())
+    config["ollama"]["host"] = host
+    config["ollama"]["stream"] = False  # Same single-JSON response as the legacy path
+    client = OllamaClient(config)
+    logging.getLogger("ollama_client").setLevel(logging.WARNING)
+    payload = client._generate_payload(PROMPT)
+    fallback_model = config["fallback_models"][0]
+
+    # Warm both paths once so the table compares steady-state request costs
+    legacy_generate(host, payload)
+    client.make_request(PROMPT, max_retries=0)
+
+    rows = [
+        time_calls("per-call", lambda: legacy_generate(host, payload), count, server),
+        time_calls("pooled", lambda: client.make_request(PROMPT, max_retries=0), count, server),
+        time_calls("fallback per-call", lambda: legacy_fallback(host, payload, fallback_model), count, server),
+        time_calls("fallback pooled", lambda: client._attempt_fallback_model(PROMPT), count, server),
+    ]
+
+    print(f"{'path':>18} | {'ms/call':>8} | {'connections':>11} | {'/api/tags':>9}")
+    print("-" * 56)
+    for row in rows:
+        print(f"{row['name']:>18} | {row['ms_per_call']:8.3f} | {row['connections']:11d} | {row['tags']:9d}")
+
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description='Benchmark Ollama client request overhead')
+    parser.add_argument('--requests', type=int, default=200, help='Calls per request path')
+    parser.add_argument('--connection-delay', type=float, default=0.0,
+                        help='Seconds the stub adds to every new connection (mimics a remote host)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s - %(message)s')
+
+    print("OLLAMA CLIENT OVERHEAD BENCHMARK")
+    print("=" * 56)
+    print(f"{args.requests} calls per path, connection delay {args.connection_delay * 1000:.1f} ms\n")
+    run_benchmark(args.requests, args.connection_delay)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Benchmark Exam Separation - Compare row-by-row and vectorized separation
+
+Generates synthetic input with the same columns as the real workbook and a mix
+of OptionE values (TNPSC, Banking, SSC-Railways and edge cases), then times:
+- the previous iterrows + per-row pd.concat approach (small sizes only, it is quadratic)
+- ExamSeparator.separate_questions (vectorized)
+
+Results of both approaches are compared wherever both run.
+
+Usage:
+    python benchmark_separation.py
+    python benchmark_separation.py --sizes 1000 10000 100000 --legacy-max 5000
+"""
+
+import argparse
+import logging
+import random
+import sys
+import time
+from typing import Dict, List
+
+import pandas as pd
+
+from separate_by_exam import ExamSeparator
+
+# OptionE values and their weights: TNPSC, Banking, SSC-Railways (blank variants) and odd cases
+OPTION_E_VALUES = [
+    ("Answer not known", 40),
+    ("  Answer not known  ", 2),
+    ("answer not known", 1),
+    ("None of these", 15),
+    ("More than one of the above", 10),
+    (None, 20),
+    ("", 5),
+    ("   ", 3),
+    ("\t\n", 1),
+    (5, 1),
+    (0.0, 1),
+]
+
+
+def make_input(num_rows: int, seed: int = 42) -> pd.DataFrame:
+    """
+    Build a synthetic input DataFrame
+
+    Args:
+        num_rows: Number of question rows
+        seed: Random seed so runs are repeatable
+
+    Returns:
+        DataFrame with the expected input columns
+    """
+    rng = random.Random(seed)
+    values, weights = zip(*OPTION_E_VALUES)
+    option_e = rng.choices(values, weights=weights, k=num_rows)
+
+    return pd.DataFrame({
+        'Row No': range(1, num_rows + 1),
+        'Subject': [None] * num_rows,
+        'Topic': [None] * num_rows,
+        'Subtopic': [None] * num_rows,
+        'Questions': [f"Question {i} about topic {i % 97}?" for i in range(num_rows)],
+        'OptionA': ["Option A"] * num_rows,
+        'OptionB': ["Option B"] * num_rows,
+        'OptionC': ["Option C"] * num_rows,
+        'OptionD': ["Option D"] * num_rows,
+        'OptionE': option_e,
+        'Answer': ["A"] * num_rows,
+        'Explanation': [f"Explanation {i}" for i in range(num_rows)],
+    })
+
+
+def legacy_separate(separator: ExamSeparator) -> Dict[str, pd.DataFrame]:
+    """Previous implementation: classify_row per row and pd.concat each row onto its tab"""
+    separated = {
+        'tnpsc': pd.DataFrame(columns=separator.expected_columns),
+        'banking': pd.DataFrame(columns=separator.expected_columns),
+        'ssc_railways': pd.DataFrame(columns=separator.expected_columns)
+    }
+    for idx, row in separator.df.iterrows():
+        exam_type = separator.classify_row(row)
+        separated[exam_type] = pd.concat([separated[exam_type], row.to_frame().T], ignore_index=True)
+    return separated
+
+
+def frames_match(legacy: Dict[str, pd.DataFrame], vectorized: Dict[str, pd.DataFrame]) -> bool:
+    """Compare tab contents cell by cell (legacy frames are all-object dtype)"""
+    for exam_type, legacy_df in legacy.items():
+        new_df = vectorized[exam_type]
+        if list(legacy_df.columns) != list(new_df.columns) or len(legacy_df) != len(new_df):
+            return False
+        if not legacy_df.astype(object).equals(new_df.astype(object)):
+            return False
+    return True
+
+
+def run_benchmark(sizes: List[int], legacy_max: int):
+    """Time both approaches for each size and print a table"""
+    print(f"{'rows':>9} | {'legacy (s)':>10} | {'vectorized (s)':>14} | {'speedup':>8} | match")
+    print("-" * 60)
+
+    for size in sizes:
+        df = make_input(size)
+
+        separator = ExamSeparator()
+        separator.df = df
+        separator.stats['total_rows'] = size
+        start = time.perf_counter()
+        separator.separate_questions()
+        vectorized_time = time.perf_counter() - start
+
+        legacy_time = None
+        match = "-"
+        if size <= legacy_max:
+            start = time.perf_counter()
+            legacy = legacy_separate(separator)
+            legacy_time = time.perf_counter() - start
+            match = "yes" if frames_match(legacy, separator.separated_dfs) else "NO"
+
+        legacy_text = f"{legacy_time:10.3f}" if legacy_time is not None else f"{'skipped':>10}"
+        speedup = f"{legacy_time / vectorized_time:7.0f}x" if legacy_time else f"{'-':>8}"
+        print(f"{size:9d} | {legacy_text} | {vectorized_time:14.4f} | {speedup} | {match}")
+
+        counts = {k: separator.stats[f'{k}_count'] for k in separator.tab_names}
+        logging.getLogger(__name__).debug(f"{size} rows: {counts}")
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description='Benchmark exam separation')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 2000, 5000, 10000, 100000],
+                        help='Row counts to benchmark')
+    parser.add_argument('--legacy-max', type=int, default=10000,
+                        help='Largest row count to run the quadratic legacy approach on')
+    args = parser.parse_args()
+
+    # separate_by_exam logs every step at INFO; keep the table readable
+    logging.getLogger('separate_by_exam').setLevel(logging.WARNING)
+
+    print("EXAM SEPARATION BENCHMARK")
+    print("=" * 60)
+    run_benchmark(args.sizes, args.legacy_max)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Classification Cache - Persistent SQLite cache of validated classifications
+
+Stores the triplet chosen for each question so repeated questions (verbatim or
+differing only in case, spacing and punctuation) and rows re-processed after a
+crash are answered without an API round-trip.
+
+Entries are keyed by exam type, taxonomy version and a hash of the normalized
+question and explanation. The cache is bounded and evicts least recently used
+entries first.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, List, Optional
+
+
+def normalize_text(text) -> str:
+    """
+    Normalize question text so trivially different copies share a cache key
+
+    Args:
+        text: Question or explanation text
+
+    Returns:
+        Lowercase text with punctuation removed and whitespace collapsed
+    """
+    if text is None:
+        return ""
+    text = unicodedata.normalize("NFKC", str(text)).lower().strip()
+    if text == "nan":
+        return ""
+    return " ".join(re.findall(r"\w+", text))
+
+
+def taxonomy_version(triplets: List[str]) -> str:
+    """
+    Fingerprint a taxonomy so cached results are dropped when it changes
+
+    Args:
+        triplets: Triplets in "Subject > Topic > Subtopic" form
+
+    Returns:
+        Short hex digest of the triplet list
+    """
+    return hashlib.sha1("\n".join(triplets).encode("utf-8")).hexdigest()[:16]
+
+
+class ClassificationCache:
+    """
+    Disk-backed LRU cache of classifications
+
+    Features:
+    - SQLite file, safe to share between threads and processes (WAL mode)
+    - Size bound with least-recently-used eviction
+    - Hit/miss statistics
+    """
+
+    def __init__(self, db_path: str = "temp/classification_cache.sqlite", max_entries: int = 500000):
+        """
+        Open (or create) the cache database
+
+        Args:
+            db_path: SQLite database file
+            max_entries: Maximum number of cached classifications
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.logger = logging.getLogger(__name__)
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS classifications (
+                cache_key TEXT PRIMARY KEY,
+                exam_type TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                topic TEXT NOT NULL,
+                subtopic TEXT NOT NULL,
+                confidence REAL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON classifications(last_used)")
+        self._conn.commit()
+
+        self._size = self._conn.execute("SELECT COUNT(*) FROM classifications").fetchone()[0]
+
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0
+        }
+
+        self.logger.info(f"Classification cache opened: {db_path} ({self._size} entries)")
+
+    @staticmethod
+    def make_key(exam_type: str, version: str, question: str, explanation: str = "") -> str:
+        """
+        Build the cache key for a question
+
+        Args:
+            exam_type: Exam type
+            version: Taxonomy version from taxonomy_version()
+            question: Question text
+            explanation: Optional explanation text
+
+        Returns:
+            Hex digest identifying the question
+        """
+        raw = "\x1f".join([exam_type, version, normalize_text(question), normalize_text(explanation)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        Look up a classification and mark it as recently used
+
+        Args:
+            key: Cache key from make_key()
+
+        Returns:
+            Dictionary with subject, topic, subtopic, confidence or None on a miss
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT subject, topic, subtopic, confidence FROM classifications WHERE cache_key = ?",
+                (key,)
+            ).fetchone()
+
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+
+            self._conn.execute("UPDATE classifications SET last_used = ? WHERE cache_key = ?",
+                               (time.time(), key))
+            self._conn.commit()
+            self.stats["hits"] += 1
+
+        return {
+            "subject": row[0],
+            "topic": row[1],
+            "subtopic": row[2],
+            "confidence": row[3] if row[3] is not None else 0.0
+        }
+
+    def put(self, key: str, exam_type: str, classification: Dict):
+        """
+        Store a validated classification
+
+        Args:
+            key: Cache key from make_key()
+            exam_type: Exam type (kept for inspection and clearing)
+            classification: Dictionary with subject, topic, subtopic, confidence
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                """INSERT OR REPLACE INTO classifications
+                   (cache_key, exam_type, subject, topic, subtopic, confidence, created_at, last_used)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (key, exam_type, classification["subject"], classification["topic"],
+                 classification["subtopic"], classification.get("confidence"), now, now)
+            )
+            self._size += cursor.rowcount
+            self.stats["stores"] += 1
+
+            if self._size > self.max_entries:
+                self._evict()
+
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop the least recently used entries (caller holds the lock)"""
+        # Recount first - other processes may share the database
+        self._size = self._conn.execute("SELECT COUNT(*) FROM classifications").fetchone()[0]
+        excess = self._size - self.max_entries
+        if excess <= 0:
+            return
+
+        # Evict an extra 1% so eviction does not run on every insert
+        to_remove = excess + max(1, self.max_entries // 100)
+        self._conn.execute(
+            """DELETE FROM classifications WHERE cache_key IN (
+                   SELECT cache_key FROM classifications ORDER BY last_used LIMIT ?)""",
+            (to_remove,)
+        )
+        self._size = self._conn.execute("SELECT COUNT(*) FROM classifications").fetchone()[0]
+        self.stats["evictions"] += to_remove
+        self.logger.debug(f"Evicted {to_remove} cached classifications")
+
+    def clear(self, exam_type: Optional[str] = None):
+        """
+        Remove cached classifications
+
+        Args:
+            exam_type: Only clear this exam type (None clears everything)
+        """
+        with self._lock:
+            if exam_type:
+                self._conn.execute("DELETE FROM classifications WHERE exam_type = ?", (exam_type,))
+            else:
+                self._conn.execute("DELETE FROM classifications")
+            self._conn.commit()
+            self._size = self._conn.execute("SELECT COUNT(*) FROM classifications").fetchone()[0]
+
+    def get_stats(self) -> Dict:
+        """Get cache statistics"""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": self._size,
+            "max_entries": self.max_entries,
+            "hit_rate": round(self.stats["hits"] / lookups * 100, 2) if lookups else 0.0
+        }
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
+
+
+# Module testing
+if __name__ == "__main__":
+    import tempfile
+
+    print("CLASSIFICATION CACHE TESTING")
+    print("=" * 40)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ClassificationCache(os.path.join(tmp, "cache.sqlite"), max_entries=100)
+        version = taxonomy_version(["A > B > C"])
+
+        key = ClassificationCache.make_key("TNPSC", version, "Who wrote the Tirukkural?")
+        same = ClassificationCache.make_key("TNPSC", version, "  who WROTE the tirukkural ")
+        print(f"Normalized keys match: {key == same}")
+
+        print(f"Lookup before store: {cache.get(key)}")
+        cache.put(key, "TNPSC", {"subject": "A", "topic": "B", "subtopic": "C", "confidence": 0.9})
+        print(f"Lookup after store: {cache.get(same)}")
+
+        for i in range(150):
+            cache.put(ClassificationCache.make_key("TNPSC", version, f"question {i}"), "TNPSC",
+                      {"subject": "A", "topic": "B", "subtopic": "C", "confidence": 0.9})
+        print(f"Stats after 150 stores: {cache.get_stats()}")
+        cache.close()
+
+    print("\nClassification cache testing completed!")
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Concurrency Controller - AIMD limit on in-flight API requests
+
+Replaces a fixed number of concurrent classifications with a limit that
+follows the account's real capacity:
+- additive increase: +1 in-flight slot per full window of healthy responses
+- multiplicative decrease on 429s, on latency rising well above the observed
+  baseline, or when x-ratelimit-remaining-* headers show the quota running out
+
+One controller is shared by every client in the process that uses the same
+API and model, alongside the shared rate limiter.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Mapping, Optional, Tuple
+
+
+class ConcurrencyController:
+    """
+    Adaptive in-flight request limit (additive increase, multiplicative decrease)
+
+    Features:
+    - Blocking and asyncio slot acquisition
+    - Latency baseline from the fastest recent responses
+    - Quota headroom from response headers
+    - One decrease per cooldown so a single burst of 429s halves the limit once
+    """
+
+    def __init__(self, initial_limit: int = 5, min_limit: int = 1, max_limit: int = 32,
+                 decrease_factor: float = 0.5, latency_tolerance: float = 2.0,
+                 min_headroom: float = 0.05):
+        """
+        Initialize the controller
+
+        Args:
+            initial_limit: Starting number of in-flight requests
+            min_limit: Lowest limit
+            max_limit: Highest limit
+            decrease_factor: Multiplier applied to the limit on congestion
+            latency_tolerance: Congestion when average latency exceeds baseline by this factor
+            min_headroom: Congestion when remaining requests/tokens fall below this fraction
+        """
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.min_headroom = min_headroom
+        self.logger = logging.getLogger(__name__)
+
+        self.in_flight = 0
+        self._condition = threading.Condition()
+        self._latencies = deque(maxlen=50)
+        self._last_decrease = 0.0
+
+        self.stats = {
+            "increases": 0,
+            "decreases": 0,
+            "throttled": 0,
+            "latency_backoffs": 0,
+            "headroom_backoffs": 0,
+            "peak_limit": int(self.limit),
+            "peak_in_flight": 0
+        }
+
+    @property
+    def current_limit(self) -> int:
+        """Whole number of requests allowed in flight"""
+        return max(self.min_limit, int(self.limit))
+
+    def _try_enter(self) -> bool:
+        """Take a slot if one is free (caller holds the condition)"""
+        if self.in_flight < self.current_limit:
+            self.in_flight += 1
+            self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.in_flight)
+            return True
+        return False
+
+    def acquire(self):
+        """Block until an in-flight slot is free, then take it"""
+        with self._condition:
+            while not self._try_enter():
+                self._condition.wait()
+
+    async def acquire_async(self, poll_interval: float = 0.05):
+        """Await an in-flight slot without blocking the event loop"""
+        while True:
+            with self._condition:
+                if self._try_enter():
+                    return
+            await asyncio.sleep(poll_interval)
+
+    def release(self):
+        """Give back a slot taken by acquire()"""
+        with self._condition:
+            self.in_flight = max(0, self.in_flight - 1)
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """Hold an in-flight slot for the duration of a request"""
+        self.acquire()
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def _baseline_latency(self) -> Optional[Tuple[float, float]]:
+        """(baseline, recent average) latency once enough samples exist"""
+        if len(self._latencies) < 10:
+            return None
+        ordered = sorted(self._latencies)
+        baseline = sum(ordered[:5]) / 5
+        recent = list(self._latencies)[-10:]
+        return baseline, sum(recent) / len(recent)
+
+    def _headroom(self, headers: Optional[Mapping]) -> Optional[float]:
+        """Smallest remaining/limit fraction reported in the rate limit headers"""
+        if not headers:
+            return None
+        fractions = []
+        for kind in ("requests", "tokens"):
+            try:
+                limit = float(headers.get(f"x-ratelimit-limit-{kind}") or 0)
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                if limit > 0 and remaining is not None:
+                    fractions.append(float(remaining) / limit)
+            except (TypeError, ValueError):
+                continue
+        return min(fractions) if fractions else None
+
+    def _cooldown(self) -> float:
+        """One round trip: responses within it still reflect the old limit"""
+        recent = list(self._latencies)[-10:]
+        return sum(recent) / len(recent) if recent else 1.0
+
+    def _decrease(self, reason: str):
+        """Multiplicative decrease, at most once per cooldown (caller holds the condition)"""
+        now = time.monotonic()
+        if now - self._last_decrease < self._cooldown():
+            return
+        old = self.current_limit
+        self.limit = max(float(self.min_limit), self.limit * self.decrease_factor)
+        self._last_decrease = now
+        self.stats["decreases"] += 1
+        if self.current_limit != old:
+            self.logger.info(f"Concurrency {old} -> {self.current_limit} ({reason})")
+
+    def record_success(self, latency: float, headers: Optional[Mapping] = None):
+        """
+        Feed back a successful response
+
+        Args:
+            latency: Seconds the request took
+            headers: Response headers with x-ratelimit-* values
+        """
+        with self._condition:
+            self._latencies.append(latency)
+            headroom = self._headroom(headers)
+            latency_state = self._baseline_latency()
+
+            if headroom is not None and headroom < self.min_headroom:
+                self.stats["headroom_backoffs"] += 1
+                self._decrease(f"quota headroom {headroom:.0%}")
+            elif latency_state and latency_state[1] > latency_state[0] * self.latency_tolerance:
+                self.stats["latency_backoffs"] += 1
+                self._decrease(f"latency {latency_state[1]:.2f}s vs baseline {latency_state[0]:.2f}s")
+            elif ((headroom is None or headroom >= 2 * self.min_headroom) and
+                  time.monotonic() - self._last_decrease >= self._cooldown()):
+                # Additive increase: one more slot per window of healthy responses
+                old = self.current_limit
+                self.limit = min(float(self.max_limit), self.limit + 1.0 / self.current_limit)
+                if self.current_limit > old:
+                    self.stats["increases"] += 1
+                    self.stats["peak_limit"] = max(self.stats["peak_limit"], self.current_limit)
+                    self._condition.notify_all()
+
+    def record_throttled(self):
+        """Feed back a 429 response"""
+        with self._condition:
+            self.stats["throttled"] += 1
+            self._decrease("rate limited")
+
+    def get_stats(self) -> Dict:
+        """Get the current limit and adjustment counts"""
+        with self._condition:
+            latency_state = self._baseline_latency()
+            return {
+                **self.stats,
+                "limit": self.current_limit,
+                "in_flight": self.in_flight,
+                "baseline_latency": round(latency_state[0], 3) if latency_state else None,
+                "recent_latency": round(latency_state[1], 3) if latency_state else None
+            }
+
+
+# One controller per (API base URL, model) for the whole process
+_shared_controllers: Dict[Tuple[str, str], ConcurrencyController] = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_concurrency_controller(base_url: Optional[str], model: str,
+                                      **controller_kwargs) -> ConcurrencyController:
+    """
+    Get the process-wide controller for an API endpoint and model
+
+    Args:
+        base_url: API base URL (None for the SDK default)
+        model: Model name
+        **controller_kwargs: ConcurrencyController arguments (used by the first caller)
+
+    Returns:
+        Shared ConcurrencyController
+    """
+    key = (base_url or "default", model)
+    with _shared_lock:
+        if key not in _shared_controllers:
+            _shared_controllers[key] = ConcurrencyController(**controller_kwargs)
+        return _shared_controllers[key]
+
+
+# Module testing
+if __name__ == "__main__":
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+
+    print("CONCURRENCY CONTROLLER TESTING")
+    print("=" * 40)
+
+    controller = ConcurrencyController(initial_limit=2, max_limit=20)
+    capacity = 8  # Simulated server: slows down and throttles above 8 in flight
+
+    def simulated_request(_):
+        with controller.slot():
+            load = controller.in_flight
+            if load > capacity and random.random() < 0.5:
+                controller.record_throttled()
+                return
+            latency = 0.01 * (1 + max(0, load - capacity))
+            time.sleep(latency)
+            controller.record_success(latency)
+
+    with ThreadPoolExecutor(max_workers=20) as executor:
+        list(executor.map(simulated_request, range(600)))
+
+    print(f"Stats: {controller.get_stats()}")
+    print("\nConcurrency controller testing completed!")
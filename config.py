@@ -8,12 +8,28 @@ import os
 # Ollama Configuration - Using 20B+ model for maximum power
 OLLAMA_CONFIG = {
     "host": "http://localhost:11434",  # Local Ollama server 
+    "hosts": [],  # Several Ollama servers to balance requests across (least outstanding requests); empty = just "host"
+    "host_failure_threshold": 3,  # Consecutive failures that take a host out of rotation
+    "host_recovery_time": 30,  # Seconds an ejected host sits out (doubles on repeated ejection)
+    "host_max_recovery_time": 300,  # Longest ejection in seconds
     "model": "gemma2:9b",  # Fast 8B model - much better performance
     "timeout": 60,  # 1 minute timeout - should be plenty for 8B model
     "temperature": 0.02,  # Ultra-low temperature for maximum consistency
     "top_p": 0.7,  # More focused responses
     "max_retries": 3,  # Standard retries for 8B model
-    "retry_delay": 3  # seconds - shorter delay for faster model
+    "retry_delay": 3,  # seconds - shorter delay for faster model
+    "pool_maxsize": 32,  # Keep-alive connections kept open per Ollama host (matches max_concurrent_limit)
+    "models_ttl": 300,  # Seconds the /api/tags model list is reused before it is fetched again
+    "keep_alive": "30m",  # How long Ollama keeps a model loaded after each request ("-1" = until Ollama restarts)
+    "warm_up": True,  # Load models before their first request; pre-load the fallback model when the circuit breaker opens
+    "load_timeout": 120,  # Seconds allowed for loading a model into memory
+    "stream": True,  # Stream responses and stop generation once the answer's JSON is complete
+    "num_predict": 512,  # Generation token cap when the caller sets none
+    "early_stop_min_tokens": 64,  # Cut a stream at its JSON only if num_predict still allows more trailing tokens than this (cutting closes the pooled connection)
+    "num_ctx": 8192,  # Context window per request; the full triplet list is only forced when it fits (TNPSC needs ~24k)
+    "chat_prefix": True,  # Send each exam's static prompt prefix as an /api/chat system message so Ollama reuses its KV cache
+    "warm_prefix": True,  # Evaluate each prefix once per host before the first question (needs OLLAMA_NUM_PARALLEL slots per exam in flight)
+    "prefix_full_list": True  # With Ollama as primary, send the full list (cached) instead of a new shortlist when it fits num_ctx
 }
 
 # Alternative models to try if primary fails (in order of preference)
@@ -28,11 +44,24 @@ OPENAI_CONFIG = {
     "timeout": 30,  # 30 second timeout
     "max_retries": 3,  # Retry on failures
     "retry_delay": 2,  # Delay between retries in seconds
-    "requests_per_minute": 100,  # Rate limiting
+    "requests_per_minute": 100,  # Rate limiting (token bucket shared by all clients, corrected by x-ratelimit-* headers)
     "tokens_per_minute": 100000,  # Token rate limiting
     "budget_limit_usd": 10.0,  # Budget limit in USD
+    "cost_ledger_compact_every": 5000,  # Fold the cost ledger into a checkpoint every N records
+    "budget_reservation_ttl": 600,  # Seconds before an unsettled budget reservation lapses
     "enable_cost_tracking": True,  # Track costs and usage
-    "fallback_to_ollama": True  # Fallback to Ollama on failure/budget exceeded
+    "fallback_to_ollama": True,  # Fallback to Ollama on failure/budget exceeded
+    "prefix_full_list": True,  # Send the full triplet list when its cached price beats a shortlist (OpenAI caches only prefixes of 1024+ tokens, which a shortlist's shared instructions never reach)
+    "base_url": None  # API base URL (None = SDK default or OPENAI_BASE_URL)
+}
+
+# Batch API Configuration - Bulk classification at half the token price
+BATCH_CONFIG = {
+    "completion_window": "24h",  # Batch API completion window
+    "poll_interval": 60,  # Seconds between batch status checks
+    "max_wait_hours": 24,  # Give up polling after this long
+    "batch_folder": "temp/batches",  # Batch input files and submission state
+    "retry_failed_sync": True  # Re-classify failed batch results with the normal path
 }
 
 # Provider Configuration - Controls which AI provider to use
@@ -63,16 +92,19 @@ PATHS = {
     "backup_excel": "temp/SeparatedQuestions_backup.xlsx",  # Backup of separated file
     "progress_file": "temp/classification_progress.json",  # Processing progress state
     "error_log": "logs/processing_errors.log",  # Error logs
-    "cost_file": "logs/api_costs.json",  # Cost tracking file
+    "cost_file": "logs/api_costs.jsonl",  # Append-only cost ledger (old api_costs.json is imported once)
     "result_folder": "result"  # Folder for exam-specific result files
 }
 
 # Processing Configuration - Optimized for Excel processing
 PROCESSING_CONFIG = {
-    "batch_size": 1,  # Single question processing for accurate classification
-    "max_concurrent": 1,  # Sequential processing for consistency
-    "save_interval": 10,  # Save every 10 questions processed
-    "backup_interval": 25,  # Create timestamped backup every 25 questions
+    "batch_size": 1,  # Questions per classification request (1 = single question; 5-10 share one triplet list, failed items retried singly)
+    "batch_output_tokens_per_question": 150,  # Output token allowance per question in a batched request
+    "max_concurrent": 5,  # Classifications in flight per tab (1 = sequential); RPM/TPM limits still apply
+    "adaptive_concurrency": True,  # Grow/shrink in-flight OpenAI requests from 429s, latency and quota headers
+    "max_concurrent_limit": 32,  # Ceiling for adaptive concurrency (max_concurrent is the starting point)
+    "save_interval": 10,  # Sync the progress journal to disk every 10 questions (Excel is written at the end)
+    "backup_interval": 0,  # Full timestamped Excel snapshot every N questions (0 = off; rewrites every tab)
     "resume_enabled": True,  # Can resume from interrupted processing
     "backup_enabled": True,  # Automatic backup creation
     "use_question_and_explanation": True,  # Combine Question + Explanation for AI input
@@ -101,6 +133,41 @@ PROMPT_CONFIG = {
     "include_classification_guide": True  # Include domain-specific classification guidance
 }
 
+# Candidate Retrieval - Shortlist triplets locally instead of sending the full taxonomy
+RETRIEVAL_CONFIG = {
+    "enabled": True,  # Pre-select candidate triplets with a local BM25 index
+    "top_k": 40,  # Maximum candidate triplets per prompt
+    "min_top_score": 5.0,  # Best BM25 score needed to trust the shortlist
+    "min_matched_terms": 2,  # Question terms that must appear in the taxonomy
+    "min_candidates": 10,  # Smaller shortlists fall back to the full list
+    "full_list_on_last_retry": True  # Last validation retry sends the full taxonomy
+}
+
+# Hierarchical Classification - Pick the subject first, then list only its triplets
+HIERARCHICAL_CONFIG = {
+    "enabled": False,  # Two-pass mode: subject detection, then classification against that subject's sublist
+    "subject_detection": "local",  # "local" (BM25 subject scores, no API call) or "ai" (tiny subject-only prompt)
+    "min_subject_score": 5.0,  # Best local score needed to trust the detected subject
+    "subject_margin": 0.8,  # Subjects scoring within this fraction of the best are listed too
+    "max_subjects": 2,  # More close subjects than this falls back to the single-stage path
+    "min_subject_confidence": 0.6,  # AI subject answers below this confidence fall back to the single-stage path
+    "subject_max_tokens": 30  # Output token cap for the AI subject prompt
+}
+
+# Classification Cache - Reuse validated results for repeated questions
+CACHE_CONFIG = {
+    "enabled": True,  # Look up questions before calling any AI provider
+    "db_path": "temp/classification_cache.sqlite",  # SQLite cache file
+    "max_entries": 500000  # Least recently used entries are evicted beyond this
+}
+
+# Answer Format - Compact line-number answers and schema-constrained output
+STRUCTURED_OUTPUT_CONFIG = {
+    "answer_format": "line_number",  # "line_number" (number + confidence, resolved locally) or "full" (copied triplet text + reasoning)
+    "enabled": True,  # Constrain answers with a JSON schema limiting line_number to the listed lines (OpenAI json_schema / Ollama format)
+    "max_tokens": 40  # Output token cap per question for line_number answers
+}
+
 # Validation Rules - STRICT MODE ONLY
 VALIDATION_CONFIG = {
     "strict_matching": True,  # ALWAYS require exact matches in taxonomy
@@ -110,6 +177,9 @@ VALIDATION_CONFIG = {
     "skip_empty_questions": True,
     "reject_invalid_responses": True,  # Reject any response not in taxonomy
     "max_validation_retries": 3,  # Number of retries when validation fails
+    "fuzzy_repair": True,  # Map near-miss answers (typos, mixed-up subjects) to the closest triplet before retrying
+    "repair_min_similarity": 0.85,  # Weighted similarity (0-1) a repaired triplet must reach
+    "repair_min_margin": 0.03,  # Lead over the next closest triplet, otherwise re-prompt
     "enhanced_retry_prompts": True  # Add stricter instructions on retries
 }
 
@@ -223,6 +293,7 @@ def get_config():
     return {
         "ollama": OLLAMA_CONFIG,
         "openai": OPENAI_CONFIG,
+        "batch": BATCH_CONFIG,
         "provider": PROVIDER_CONFIG,
         "rule_based": RULE_BASED_CONFIG,
         "fallback_models": FALLBACK_MODELS,
@@ -230,6 +301,10 @@ def get_config():
         "processing": PROCESSING_CONFIG,
         "excel": EXCEL_CONFIG,
         "prompt": PROMPT_CONFIG,
+        "retrieval": RETRIEVAL_CONFIG,
+        "hierarchical": HIERARCHICAL_CONFIG,
+        "cache": CACHE_CONFIG,
+        "structured_output": STRUCTURED_OUTPUT_CONFIG,
         "validation": VALIDATION_CONFIG,
         "logging": LOGGING_CONFIG,
         "performance": PERFORMANCE_CONFIG,
@@ -276,6 +351,18 @@ def validate_config():
     if PROCESSING_CONFIG["batch_size"] < 1 or PROCESSING_CONFIG["batch_size"] > 10:
         errors.append("Batch size should be between 1 and 10 for Excel processing")
     
+    # Validate concurrency
+    if PROCESSING_CONFIG["max_concurrent"] < 1:
+        errors.append("max_concurrent should be at least 1")
+    if PROCESSING_CONFIG["max_concurrent_limit"] < PROCESSING_CONFIG["max_concurrent"]:
+        errors.append("max_concurrent_limit should be at least max_concurrent")
+    
+    # Validate answer format
+    if STRUCTURED_OUTPUT_CONFIG["answer_format"] not in ("line_number", "full"):
+        errors.append("answer_format should be 'line_number' or 'full'")
+    if HIERARCHICAL_CONFIG["subject_detection"] not in ("local", "ai"):
+        errors.append("subject_detection should be 'local' or 'ai'")
+    
     # Validate confidence threshold
     if not 0 <= PROMPT_CONFIG["confidence_threshold"] <= 1:
         errors.append("Confidence threshold should be between 0 and 1")
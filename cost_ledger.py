@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Cost Ledger - Append-only JSONL ledger of API usage with running totals
+
+Each API call is appended as one numbered JSON line; totals and per-day
+aggregates are kept up to date in memory, so budget checks never scan the
+history. Periodic compaction folds the appended records into a checkpoint
+line (totals, daily aggregates, last sequence number) and moves the raw
+records to an archive file, which keeps startup fast however long the
+ledger has been in use.
+
+The ledger can be shared by several threads and processes. Every read or
+write happens under a thread lock plus an exclusive lock on a sidecar lock
+file, after first folding in whatever other processes appended. Budget is
+claimed with reserve() before a request and settled by the usage record (or
+released) afterwards, so concurrent workers cannot overspend the limit.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+# Optional file locking backends (POSIX / Windows)
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+try:
+    import msvcrt
+    MSVCRT_AVAILABLE = True
+except ImportError:
+    MSVCRT_AVAILABLE = False
+
+TOTAL_FIELDS = ("requests", "input_tokens", "cached_input_tokens", "output_tokens", "cost_usd", "cost_inr")
+
+
+def empty_totals() -> Dict:
+    """Zeroed totals dictionary"""
+    totals = {field: 0 for field in TOTAL_FIELDS}
+    totals.update({"cost_usd": 0.0, "cost_inr": 0.0, "first_timestamp": None, "last_timestamp": None})
+    return totals
+
+
+def add_to_totals(totals: Dict, record: Dict):
+    """
+    Fold one usage record (or another totals dictionary) into totals
+
+    Args:
+        totals: Totals dictionary to update in place
+        record: Usage record with token counts and costs, or totals to merge
+    """
+    totals["requests"] += record.get("requests", 1)
+    for field in TOTAL_FIELDS[1:]:
+        totals[field] += record.get(field, 0) or 0
+
+    first = record.get("first_timestamp", record.get("timestamp"))
+    last = record.get("last_timestamp", record.get("timestamp"))
+    if first and (totals["first_timestamp"] is None or first < totals["first_timestamp"]):
+        totals["first_timestamp"] = first
+    if last and (totals["last_timestamp"] is None or last > totals["last_timestamp"]):
+        totals["last_timestamp"] = last
+
+
+class CostLedger:
+    """
+    Append-only usage ledger with O(1) totals and budget reservations
+
+    The first line is a checkpoint; every following line is a usage record,
+    a reservation or a release, each with a sequence number. Entries at or
+    below the checkpoint's sequence number are already folded into it and
+    are ignored on load.
+    """
+
+    def __init__(self, ledger_path: str, compact_every: int = 5000):
+        """
+        Initialize the ledger (nothing is read until open() is called)
+
+        Args:
+            ledger_path: JSONL ledger file
+            compact_every: Compact after this many records beyond the checkpoint
+        """
+        self.ledger_path = ledger_path
+        self.archive_path = f"{os.path.splitext(ledger_path)[0]}.archive.jsonl"
+        self.lock_path = f"{ledger_path}.lock"
+        self.compact_every = max(1, compact_every)
+        self.logger = logging.getLogger(__name__)
+
+        self._file = None
+        self._lock_file = None
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        self._file_id = None  # (device, inode) of the ledger file we have read
+        self._offset = 0      # Bytes of the ledger file folded in so far
+
+        self._reset()
+
+    def _reset(self):
+        """Forget everything read from the ledger file"""
+        self.meta: Dict = {}
+        self.seq = 0
+        self.checkpoint_seq = 0
+        self.totals = empty_totals()
+        self.daily: Dict[str, Dict] = {}
+        self.reservations: Dict[str, Dict] = {}
+        self.tail: List[Dict] = []  # Usage records appended since the last checkpoint
+
+    def open(self) -> List[Dict]:
+        """
+        Load the checkpoint and the records after it, then open for appending
+
+        Returns:
+            Usage records appended since the last checkpoint, oldest first
+        """
+        directory = os.path.dirname(self.ledger_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(self.lock_path, 'a+b')
+
+        with self.locked():
+            if not os.path.exists(self.ledger_path):
+                self._write_checkpoint()
+                self._catch_up()
+
+        self.logger.info(f"Cost ledger opened: {self.totals['requests']} requests, "
+                         f"${self.totals['cost_usd']:.4f} total ({len(self.tail)} since checkpoint)")
+        return list(self.tail)
+
+    @contextmanager
+    def locked(self):
+        """
+        Hold the ledger exclusively (threads and processes) with totals up to date
+
+        Re-entrant within a thread; the file lock is taken by the outermost call.
+        """
+        with self._lock:
+            if self._lock_depth == 0:
+                self._acquire_file_lock()
+            self._lock_depth += 1
+            try:
+                if self._lock_depth == 1:
+                    self._catch_up()
+                yield self
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    self._release_file_lock()
+
+    def _acquire_file_lock(self):
+        if self._lock_file is None:
+            raise RuntimeError("Cost ledger is not open")
+        if FCNTL_AVAILABLE:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        elif MSVCRT_AVAILABLE:
+            self._lock_file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue  # LK_LOCK gives up after ~10s; keep waiting
+
+    def _release_file_lock(self):
+        if FCNTL_AVAILABLE:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+        elif MSVCRT_AVAILABLE:
+            self._lock_file.seek(0)
+            msvcrt.locking(self._lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _catch_up(self):
+        """Fold in entries appended by other processes (caller holds the lock)"""
+        try:
+            stat = os.stat(self.ledger_path)
+        except FileNotFoundError:
+            return
+        file_id = (stat.st_dev, stat.st_ino)
+
+        if file_id != self._file_id or stat.st_size < self._offset:
+            # First read, or another process compacted the ledger: start over
+            self._reset()
+            self._offset = 0
+            self._file_id = file_id
+            if self._file is not None:
+                self._file.close()
+            self._file = open(self.ledger_path, 'ab')
+
+        if stat.st_size > self._offset:
+            self._read_from(self._offset)
+
+    def _read_from(self, offset: int):
+        """Fold complete lines from a byte offset to the end of the ledger"""
+        with open(self.ledger_path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Partial line from a crashed writer; not consumed
+                self._offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    self.logger.warning(f"Skipping damaged cost ledger line at byte {self._offset - len(line)}")
+                    continue
+
+                if entry.get("type") == "checkpoint":
+                    self._apply_checkpoint(entry)
+                elif entry.get("seq", 0) > self.checkpoint_seq:
+                    self._fold(entry)
+
+    def _apply_checkpoint(self, entry: Dict):
+        self.meta = entry.get("meta", {})
+        self.seq = self.checkpoint_seq = entry.get("seq", 0)
+        self.totals = {**empty_totals(), **entry.get("totals", {})}
+        self.daily = {day: {**empty_totals(), **totals} for day, totals in entry.get("daily", {}).items()}
+        self.reservations = dict(entry.get("reservations", {}))
+        self.tail = []
+
+    def _fold(self, entry: Dict):
+        """Apply one ledger entry to the in-memory state"""
+        self.seq = max(self.seq, entry.get("seq", self.seq + 1))
+        entry_type = entry.get("type", "usage")
+
+        if entry_type == "reserve":
+            self.reservations[entry["id"]] = {"amount_usd": entry["amount_usd"],
+                                              "expires_at": entry["expires_at"]}
+        elif entry_type == "release":
+            self.reservations.pop(entry["id"], None)
+        else:
+            if entry.get("reservation_id"):
+                self.reservations.pop(entry["reservation_id"], None)
+            add_to_totals(self.totals, entry)
+            day = entry["timestamp"][:10]
+            add_to_totals(self.daily.setdefault(day, empty_totals()), entry)
+            self.tail.append(entry)
+
+    def _write_entry(self, entry: Dict) -> Dict:
+        """Append an entry with the next sequence number (caller holds the lock)"""
+        entry = {"seq": self.seq + 1, **entry}
+        data = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        self._file.write(data)
+        self._file.flush()
+        self._offset += len(data)
+        self._fold(entry)
+        return entry
+
+    def append(self, record: Dict) -> Dict:
+        """
+        Append one usage record and update the running totals
+
+        Args:
+            record: Usage record (needs timestamp, token counts and costs);
+                a reservation_id settles that reservation
+
+        Returns:
+            The record as written, with its sequence number
+        """
+        with self.locked():
+            entry = self._write_entry({"type": "usage", **record})
+            if len(self.tail) >= self.compact_every:
+                self.compact()
+        return entry
+
+    def reserved_usd(self) -> float:
+        """Budget held by unexpired reservations (caller should hold the lock)"""
+        now = time.time()
+        return sum(r["amount_usd"] for r in self.reservations.values() if r["expires_at"] > now)
+
+    def reserve(self, amount_usd: float, limit_usd: float, ttl_seconds: float = 600) -> Optional[str]:
+        """
+        Atomically claim budget for a request that is about to be made
+
+        Args:
+            amount_usd: Worst-case cost of the request
+            limit_usd: Budget limit the spent plus reserved total must stay within
+            ttl_seconds: Reservation lapses after this long (covers crashed workers)
+
+        Returns:
+            Reservation ID, or None if the budget cannot cover the request
+        """
+        with self.locked():
+            if self.totals["cost_usd"] + self.reserved_usd() + amount_usd > limit_usd:
+                return None
+            reservation_id = uuid.uuid4().hex
+            self._write_entry({"type": "reserve", "id": reservation_id, "amount_usd": amount_usd,
+                               "expires_at": time.time() + ttl_seconds, "pid": os.getpid()})
+            return reservation_id
+
+    def release(self, reservation_id: str):
+        """
+        Give back a reservation whose request was never billed
+
+        Args:
+            reservation_id: ID returned by reserve()
+        """
+        with self.locked():
+            if reservation_id in self.reservations:
+                self._write_entry({"type": "release", "id": reservation_id})
+
+    def _write_checkpoint(self):
+        """Atomically replace the ledger with a checkpoint of the current state"""
+        now = time.time()
+        checkpoint = {
+            "type": "checkpoint",
+            "seq": self.seq,
+            "meta": self.meta,
+            "totals": self.totals,
+            "daily": self.daily,
+            "reservations": {k: v for k, v in self.reservations.items() if v["expires_at"] > now},
+            "written_at": datetime.now().isoformat()
+        }
+        tmp_path = f"{self.ledger_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(checkpoint, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.ledger_path)
+        self.checkpoint_seq = self.seq
+
+    def compact(self):
+        """Archive the records since the last checkpoint and fold them into a new one"""
+        with self.locked():
+            if self.tail:
+                # Archive first: a crash before the replace below only duplicates archive lines
+                with open(self.archive_path, 'a', encoding='utf-8') as archive:
+                    for record in self.tail:
+                        archive.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+            archived = len(self.tail)
+            self._write_checkpoint()
+            self.logger.info(f"Compacted cost ledger: {archived} records archived at seq {self.seq}")
+
+            # Re-read our own checkpoint so the file position and handle match the new file
+            self._file_id = None
+            self._catch_up()
+
+    def refresh(self):
+        """Fold in entries other processes appended since the last read"""
+        with self.locked():
+            pass
+
+    def summarize_since(self, since: date) -> Dict:
+        """
+        Combine the daily aggregates from a date onwards
+
+        Args:
+            since: First day to include
+
+        Returns:
+            Totals dictionary for the period
+        """
+        totals = empty_totals()
+        cutoff = since.isoformat()
+        with self.locked():
+            for day, day_totals in self.daily.items():
+                if day >= cutoff:
+                    add_to_totals(totals, day_totals)
+        return totals
+
+    def close(self):
+        """Flush and close the ledger"""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+
+def import_legacy_records(ledger: CostLedger, legacy_path: str) -> Optional[int]:
+    """
+    Load the records of an old whole-file JSON cost log into an empty ledger
+
+    Args:
+        ledger: Open ledger with no records yet
+        legacy_path: Old logs/api_costs.json style file
+
+    Returns:
+        Number of imported records, or None if there was nothing to import
+    """
+    with ledger.locked():
+        if ledger.seq or not os.path.exists(legacy_path):
+            return None
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        records = data.get("usage_records", [])
+        for record in records:
+            ledger.append(record)
+        ledger.meta.update({k: data[k] for k in ("budget_limit_usd", "usd_to_inr_rate") if k in data})
+        ledger.compact()
+    return len(records)
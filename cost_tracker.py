@@ -4,16 +4,23 @@ Cost Tracker - Monitor and track OpenAI API usage costs
 
 Provides detailed tracking of token usage, costs in USD and INR,
 and budget management for the question classification system.
+Usage is kept in an append-only ledger (see cost_ledger.py) with running
+totals, so budget checks cost the same however long the history gets.
+The ledger is shared safely by threads and processes; reserve_budget()
+claims budget before a request and record_usage() settles it afterwards.
 """
 
-import json
 import logging
 import os
+import threading
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, fields
 import requests
 
+from cost_ledger import CostLedger, import_legacy_records
+from token_estimator import TokenEstimator
+
 @dataclass
 class UsageRecord:
     """Record of a single API usage"""
@@ -25,6 +32,7 @@ class UsageRecord:
     cost_inr: float
     question_id: Optional[str] = None
     operation: Optional[str] = None  # "subject_detection" or "triplet_selection"
+    cached_input_tokens: int = 0  # Part of input_tokens served from the prompt cache
 
 @dataclass
 class CostSummary:
@@ -38,6 +46,7 @@ class CostSummary:
     average_cost_per_request_inr: float
     start_time: str
     end_time: str
+    total_cached_input_tokens: int = 0
 
 class CostTracker:
     """
@@ -50,22 +59,27 @@ class CostTracker:
     - Cost optimization suggestions
     """
     
-    def __init__(self, budget_limit_usd: float = 10.0, cost_file: str = "logs/api_costs.json"):
+    def __init__(self, budget_limit_usd: float = 10.0, cost_file: str = "logs/api_costs.jsonl",
+                 compact_every: int = 5000, reservation_ttl: float = 600):
         """
         Initialize cost tracker
 
         Args:
             budget_limit_usd: Maximum budget in USD
-            cost_file: File to store cost tracking data
+            cost_file: Append-only JSONL ledger of API usage
+            compact_every: Fold the ledger into a checkpoint after this many records
+            reservation_ttl: Seconds before an unsettled budget reservation lapses
         """
         self.budget_limit_usd = budget_limit_usd
         self.cost_file = cost_file
+        self.reservation_ttl = reservation_ttl
         self.logger = logging.getLogger(__name__)
         
         # Current session stats
         self.session_stats = {
             'requests': 0,
             'input_tokens': 0,
+            'cached_input_tokens': 0,
             'output_tokens': 0,
             'cost_usd': 0.0,
             'cost_inr': 0.0,
@@ -73,30 +87,43 @@ class CostTracker:
         }
         
         # Pricing for GPT-4o mini (per million tokens)
+        # cached_input applies to prompt prefix tokens served from OpenAI's prompt cache
         self.pricing = {
             'gpt-4o-mini': {
-                'input': 0.15,   # $0.15 per 1M tokens
-                'output': 0.60   # $0.60 per 1M tokens
+                'input': 0.15,          # $0.15 per 1M tokens
+                'cached_input': 0.075,  # $0.075 per 1M tokens
+                'output': 0.60          # $0.60 per 1M tokens
             },
             'gpt-4o': {
-                'input': 5.00,   # $5.00 per 1M tokens
-                'output': 20.00  # $20.00 per 1M tokens
+                'input': 5.00,          # $5.00 per 1M tokens
+                'cached_input': 2.50,   # $2.50 per 1M tokens
+                'output': 20.00         # $20.00 per 1M tokens
             }
         }
         
+        # Batch API requests are billed at half the standard token price
+        self.batch_discount = 0.5
+        
+        # Serializes record updates and file writes from concurrent requests
+        self._lock = threading.Lock()
+        
+        # Per-question token estimates, calibrated from actual usage by the API clients
+        self.token_estimator = TokenEstimator()
+        
         # Exchange rate (will be updated from API)
         self.usd_to_inr_rate = 85.79  # Default fallback rate
         
-        # Load existing data
+        # Ensure logs directory exists
+        os.makedirs('logs', exist_ok=True)
+        
+        # Load existing data (records since the last ledger checkpoint; older
+        # ones are folded into the ledger's totals and daily aggregates)
+        self.ledger = CostLedger(cost_file, compact_every)
         self.usage_records: List[UsageRecord] = []
         self.load_cost_data()
         
         # Update exchange rate
         self.update_exchange_rate()
-
-        # Ensure logs directory exists
-        os.makedirs('logs', exist_ok=True)
-        os.makedirs(os.path.dirname(self.cost_file), exist_ok=True)
     
     def update_exchange_rate(self) -> bool:
         """
@@ -123,14 +150,17 @@ class CostTracker:
         self.logger.info(f"Using fallback exchange rate: 1 USD = {self.usd_to_inr_rate:.2f} INR")
         return False
     
-    def calculate_cost(self, model: str, input_tokens: int, output_tokens: int) -> Tuple[float, float]:
+    def calculate_cost(self, model: str, input_tokens: int, output_tokens: int,
+                       batch: bool = False, cached_input_tokens: int = 0) -> Tuple[float, float]:
         """
         Calculate cost for token usage
         
         Args:
             model: Model name (e.g., 'gpt-4o-mini')
-            input_tokens: Number of input tokens
+            input_tokens: Number of input tokens (including cached ones)
             output_tokens: Number of output tokens
+            batch: Whether the tokens were billed through the Batch API
+            cached_input_tokens: Input tokens billed at the cached-input rate
         
         Returns:
             Tuple of (cost_usd, cost_inr)
@@ -142,17 +172,60 @@ class CostTracker:
         pricing = self.pricing[model]
         
         # Calculate cost in USD (pricing is per million tokens)
-        input_cost_usd = (input_tokens / 1_000_000) * pricing['input']
+        cached_input_tokens = min(cached_input_tokens, input_tokens)
+        input_cost_usd = (
+            ((input_tokens - cached_input_tokens) / 1_000_000) * pricing['input'] +
+            (cached_input_tokens / 1_000_000) * pricing.get('cached_input', pricing['input'])
+        )
         output_cost_usd = (output_tokens / 1_000_000) * pricing['output']
         total_cost_usd = input_cost_usd + output_cost_usd
+        if batch:
+            total_cost_usd *= self.batch_discount
         
         # Convert to INR
         total_cost_inr = total_cost_usd * self.usd_to_inr_rate
         
         return total_cost_usd, total_cost_inr
     
+    def reserve_budget(self, amount_usd: float, ttl_seconds: Optional[float] = None) -> Optional[str]:
+        """
+        Claim budget for a request before it is sent
+        
+        The claim is atomic across threads and processes sharing the cost file;
+        settle it with record_usage(reservation_id=...) or release_reservation().
+        
+        Args:
+            amount_usd: Worst-case cost of the request
+            ttl_seconds: Seconds before the claim lapses (default: reservation_ttl)
+        
+        Returns:
+            Reservation ID, or None if the remaining budget cannot cover it
+        """
+        reservation_id = self.ledger.reserve(amount_usd, self.budget_limit_usd,
+                                             ttl_seconds or self.reservation_ttl)
+        if reservation_id is None:
+            self.logger.warning(f"Budget reservation of ${amount_usd:.4f} refused "
+                                f"(limit ${self.budget_limit_usd:.2f})")
+        return reservation_id
+    
+    def release_reservation(self, reservation_id: str):
+        """
+        Return reserved budget for a request that was never billed
+        
+        Args:
+            reservation_id: ID from reserve_budget()
+        """
+        self.ledger.release(reservation_id)
+    
+    def get_reserved_usd(self) -> float:
+        """Get budget currently held by outstanding reservations (all processes)"""
+        with self.ledger.locked():
+            return self.ledger.reserved_usd()
+    
     def record_usage(self, model: str, input_tokens: int, output_tokens: int, 
-                    question_id: Optional[str] = None, operation: Optional[str] = None) -> UsageRecord:
+                    question_id: Optional[str] = None, operation: Optional[str] = None,
+                    batch: bool = False, cached_input_tokens: int = 0,
+                    reservation_id: Optional[str] = None) -> UsageRecord:
         """
         Record API usage and calculate costs
         
@@ -162,12 +235,16 @@ class CostTracker:
             output_tokens: Output tokens generated
             question_id: Optional question identifier
             operation: Optional operation type
+            batch: Whether the request went through the Batch API
+            cached_input_tokens: Input tokens served from the prompt cache
+            reservation_id: Reservation from reserve_budget() this usage settles
         
         Returns:
             UsageRecord with cost information
         """
         # Calculate costs
-        cost_usd, cost_inr = self.calculate_cost(model, input_tokens, output_tokens)
+        cost_usd, cost_inr = self.calculate_cost(model, input_tokens, output_tokens, batch,
+                                                 cached_input_tokens)
         
         # Create usage record
         record = UsageRecord(
@@ -178,26 +255,32 @@ class CostTracker:
             cost_usd=cost_usd,
             cost_inr=cost_inr,
             question_id=question_id,
-            operation=operation
+            operation=operation,
+            cached_input_tokens=cached_input_tokens
         )
         
-        # Add to records
-        self.usage_records.append(record)
-        
-        # Update session stats
-        self.session_stats['requests'] += 1
-        self.session_stats['input_tokens'] += input_tokens
-        self.session_stats['output_tokens'] += output_tokens
-        self.session_stats['cost_usd'] += cost_usd
-        self.session_stats['cost_inr'] += cost_inr
-        
-        # Save to file
-        self.save_cost_data()
+        with self._lock:
+            # Append to the ledger (updates the running totals, settles the reservation)
+            entry = dict(asdict(record), reservation_id=reservation_id) if reservation_id else asdict(record)
+            entry = self.ledger.append(entry)
+            self.usage_records.append(record)
+            if self.ledger.checkpoint_seq >= entry['seq']:
+                # The ledger just compacted; its records are in the checkpoint now
+                self.usage_records = []
+            
+            # Update session stats
+            self.session_stats['requests'] += 1
+            self.session_stats['input_tokens'] += input_tokens
+            self.session_stats['cached_input_tokens'] += cached_input_tokens
+            self.session_stats['output_tokens'] += output_tokens
+            self.session_stats['cost_usd'] += cost_usd
+            self.session_stats['cost_inr'] += cost_inr
         
         # Check budget
         self.check_budget_alert()
         
-        self.logger.info(f"API usage recorded: {input_tokens}+{output_tokens} tokens, "
+        cached_note = f" ({cached_input_tokens} cached)" if cached_input_tokens else ""
+        self.logger.info(f"API usage recorded: {input_tokens}+{output_tokens} tokens{cached_note}, "
                         f"${cost_usd:.4f} (Rs.{cost_inr:.2f})")
         
         return record
@@ -223,12 +306,14 @@ class CostTracker:
         return False
     
     def get_total_cost_usd(self) -> float:
-        """Get total cost in USD across all records"""
-        return sum(record.cost_usd for record in self.usage_records)
+        """Get total cost in USD across all records (all processes)"""
+        with self.ledger.locked():
+            return self.ledger.totals['cost_usd']
     
     def get_total_cost_inr(self) -> float:
-        """Get total cost in INR across all records"""
-        return sum(record.cost_inr for record in self.usage_records)
+        """Get total cost in INR across all records (all processes)"""
+        with self.ledger.locked():
+            return self.ledger.totals['cost_inr']
     
     def get_session_summary(self) -> Dict:
         """Get current session summary"""
@@ -239,6 +324,9 @@ class CostTracker:
                 (self.session_stats['input_tokens'] + self.session_stats['output_tokens']) / 
                 max(1, self.session_stats['requests'])
             ),
+            'cache_hit_rate': (
+                self.session_stats['cached_input_tokens'] / max(1, self.session_stats['input_tokens']) * 100
+            ),
             'budget_used_percentage': (self.get_total_cost_usd() / self.budget_limit_usd) * 100,
             'remaining_budget_usd': self.budget_limit_usd - self.get_total_cost_usd()
         }
@@ -248,37 +336,29 @@ class CostTracker:
         Get cost summary for specified period
         
         Args:
-            days_back: Number of days to include in summary
+            days_back: Number of days to include in summary (whole calendar days,
+                from the ledger's daily aggregates)
         
         Returns:
             CostSummary object
         """
-        cutoff_date = datetime.now() - timedelta(days=days_back)
+        cutoff_date = (datetime.now() - timedelta(days=days_back)).date()
+        totals = self.ledger.summarize_since(cutoff_date)
         
-        # Filter records within period
-        recent_records = [
-            record for record in self.usage_records
-            if datetime.fromisoformat(record.timestamp) >= cutoff_date
-        ]
-        
-        if not recent_records:
+        if not totals['requests']:
             return CostSummary(0, 0, 0, 0.0, 0.0, 0.0, 0.0, "", "")
         
-        total_input_tokens = sum(r.input_tokens for r in recent_records)
-        total_output_tokens = sum(r.output_tokens for r in recent_records)
-        total_cost_usd = sum(r.cost_usd for r in recent_records)
-        total_cost_inr = sum(r.cost_inr for r in recent_records)
-        
         return CostSummary(
-            total_requests=len(recent_records),
-            total_input_tokens=total_input_tokens,
-            total_output_tokens=total_output_tokens,
-            total_cost_usd=total_cost_usd,
-            total_cost_inr=total_cost_inr,
-            average_cost_per_request_usd=total_cost_usd / len(recent_records),
-            average_cost_per_request_inr=total_cost_inr / len(recent_records),
-            start_time=min(r.timestamp for r in recent_records),
-            end_time=max(r.timestamp for r in recent_records)
+            total_requests=totals['requests'],
+            total_input_tokens=totals['input_tokens'],
+            total_output_tokens=totals['output_tokens'],
+            total_cost_usd=totals['cost_usd'],
+            total_cost_inr=totals['cost_inr'],
+            average_cost_per_request_usd=totals['cost_usd'] / totals['requests'],
+            average_cost_per_request_inr=totals['cost_inr'] / totals['requests'],
+            start_time=totals['first_timestamp'],
+            end_time=totals['last_timestamp'],
+            total_cached_input_tokens=totals['cached_input_tokens']
         )
     
     def generate_cost_report(self) -> str:
@@ -301,6 +381,8 @@ class CostTracker:
         report_lines.append(f"  Requests: {session['requests']}")
         report_lines.append(f"  Total tokens: {session['input_tokens'] + session['output_tokens']:,}")
         report_lines.append(f"  Input tokens: {session['input_tokens']:,}")
+        report_lines.append(f"  Cached input tokens: {session['cached_input_tokens']:,} "
+                            f"({session['cache_hit_rate']:.1f}% of input)")
         report_lines.append(f"  Output tokens: {session['output_tokens']:,}")
         report_lines.append(f"  Cost: ${session['cost_usd']:.4f} (₹{session['cost_inr']:.2f})")
         
@@ -333,80 +415,91 @@ class CostTracker:
         return "\n".join(report_lines)
     
     def save_cost_data(self):
-        """Save cost tracking data to file"""
+        """Compact the cost ledger into a checkpoint (records are appended as they happen)"""
         try:
-            data = {
-                'budget_limit_usd': self.budget_limit_usd,
-                'usd_to_inr_rate': self.usd_to_inr_rate,
-                'usage_records': [asdict(record) for record in self.usage_records],
-                'session_stats': self.session_stats,
-                'last_updated': datetime.now().isoformat()
-            }
-            
-            with open(self.cost_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            with self._lock, self.ledger.locked():
+                self.ledger.meta.update({
+                    'budget_limit_usd': self.budget_limit_usd,
+                    'usd_to_inr_rate': self.usd_to_inr_rate,
+                    'last_session': self.session_stats
+                })
+                self.ledger.compact()
+                self.usage_records = []
                 
         except Exception as e:
             self.logger.error(f"Failed to save cost data: {e}")
     
     def load_cost_data(self):
-        """Load cost tracking data from file"""
+        """Load cost tracking data from the ledger"""
         try:
-            if os.path.exists(self.cost_file):
-                with open(self.cost_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                
-                # Load usage records
-                if 'usage_records' in data:
-                    self.usage_records = [
-                        UsageRecord(**record) for record in data['usage_records']
-                    ]
-                
-                # Load other settings
-                if 'budget_limit_usd' in data:
-                    self.budget_limit_usd = data['budget_limit_usd']
-                if 'usd_to_inr_rate' in data:
-                    self.usd_to_inr_rate = data['usd_to_inr_rate']
-                
-                self.logger.info(f"Loaded {len(self.usage_records)} usage records")
+            records = self.ledger.open()
+            
+            # One-time import of the old whole-file JSON format
+            legacy_file = os.path.splitext(self.cost_file)[0] + '.json'
+            if legacy_file != self.cost_file:
+                imported = import_legacy_records(self.ledger, legacy_file)
+                if imported is not None:
+                    self.logger.info(f"Imported {imported} usage records from {legacy_file}")
+                    records = []
+            
+            record_fields = {f.name for f in fields(UsageRecord)}
+            self.usage_records = [
+                UsageRecord(**{k: v for k, v in record.items() if k in record_fields})
+                for record in records
+            ]
+            
+            # Load other settings
+            if 'usd_to_inr_rate' in self.ledger.meta:
+                self.usd_to_inr_rate = self.ledger.meta['usd_to_inr_rate']
+            
+            self.logger.info(f"Loaded cost ledger: {self.ledger.totals['requests']} usage records")
                 
         except Exception as e:
             self.logger.warning(f"Failed to load cost data: {e}")
     
-    def estimate_cost_for_questions(self, num_questions: int, model: str = 'gpt-4o-mini') -> Tuple[float, float]:
+    def estimate_cost_for_questions(self, num_questions: int, model: str = 'gpt-4o-mini',
+                                    batch: bool = False, exam_type: str = "") -> Tuple[float, float]:
         """
         Estimate cost for processing a number of questions
         
         Args:
             num_questions: Number of questions to process
             model: Model to use for estimation
+            batch: Whether the questions go through the Batch API
+            exam_type: Exam whose observed prompt sizes to use ("" = all exams)
         
         Returns:
             Tuple of (estimated_cost_usd, estimated_cost_inr)
         """
-        # Estimate tokens per question based on our prompts
-        # Stage 1: ~950 input + 50 output tokens
-        # Stage 2: ~2700 input + 80 output tokens
-        estimated_input_tokens = num_questions * (950 + 2700)  # 3650 per question
-        estimated_output_tokens = num_questions * (50 + 80)    # 130 per question
+        # Tokens per question from the rolling mean of actual usage (or a primed sample prompt);
+        # prompt sizes differ a lot between exams because of the taxonomy lists
+        input_per_question, output_per_question = self.token_estimator.expected_tokens(exam_type)
+        estimated_input_tokens = num_questions * input_per_question
+        estimated_output_tokens = num_questions * output_per_question
         
-        cost_usd, cost_inr = self.calculate_cost(model, estimated_input_tokens, estimated_output_tokens)
+        cost_usd, cost_inr = self.calculate_cost(model, estimated_input_tokens, estimated_output_tokens, batch)
         
         return cost_usd, cost_inr
     
-    def can_afford_questions(self, num_questions: int, model: str = 'gpt-4o-mini') -> bool:
+    def can_afford_questions(self, num_questions: int, model: str = 'gpt-4o-mini',
+                             batch: bool = False, exam_type: str = "") -> bool:
         """
         Check if we can afford to process the given number of questions
         
+        Budget reserved by in-flight requests (in any process) counts as spent.
+        
         Args:
             num_questions: Number of questions to process
             model: Model to use for cost calculation
+            batch: Whether the questions go through the Batch API
+            exam_type: Exam whose observed prompt sizes to use ("" = all exams)
         
         Returns:
             True if within budget, False otherwise
         """
-        estimated_cost, _ = self.estimate_cost_for_questions(num_questions, model)
-        current_cost = self.get_total_cost_usd()
+        estimated_cost, _ = self.estimate_cost_for_questions(num_questions, model, batch, exam_type)
+        with self.ledger.locked():
+            current_cost = self.ledger.totals['cost_usd'] + self.ledger.reserved_usd()
         
         return (current_cost + estimated_cost) <= self.budget_limit_usd
 
@@ -439,6 +532,9 @@ if __name__ == "__main__":
     print("\n📝 Usage Recording Test:")
     record = tracker.record_usage('gpt-4o-mini', 950, 50, "test_q1", "subject_detection")
     print(f"Recorded: ${record.cost_usd:.6f} (₹{record.cost_inr:.4f})")
+    record = tracker.record_usage('gpt-4o-mini', 950, 50, "test_q2", "subject_detection",
+                                  cached_input_tokens=768)
+    print(f"Recorded with 768 cached tokens: ${record.cost_usd:.6f} (₹{record.cost_inr:.4f})")
     
     # Test cost estimation
     print("\n💰 Cost Estimation Test:")
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+CSV Row Index - Byte-offset sidecar index for large CSV files
+
+Scans the CSV once and stores, next to it, the byte offset of every N-th data
+row together with the row count and detected encoding. Reading a row range
+then seeks close to the first requested row and parses only that slice,
+instead of parsing and discarding every preceding row.
+
+Rows are CSV records, not physical lines: quoted fields containing newlines
+are handled, and blank lines are skipped the same way pandas skips them.
+"""
+
+import codecs
+import io
+import json
+import logging
+import os
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+INDEX_VERSION = 2
+
+
+class _ByteRangeReader(io.RawIOBase):
+    """Read-only stream of a prefix followed by a byte range of an open file"""
+
+    def __init__(self, f: BinaryIO, prefix: bytes, length: int):
+        self._f = f
+        self._prefix = prefix
+        self._remaining = length
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self._prefix:
+            size = min(len(buffer), len(self._prefix))
+            buffer[:size] = self._prefix[:size]
+            self._prefix = self._prefix[size:]
+            return size
+        if self._remaining <= 0:
+            return 0
+        data = self._f.read(min(len(buffer), self._remaining))
+        self._remaining -= len(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class CsvRowIndex:
+    """
+    Row number to byte offset index for one CSV file
+
+    Features:
+    - One sequential scan, persisted as <csv>.index.json
+    - Rebuilt automatically when the CSV's size or modification time changes
+    - Stride checkpoints keep the sidecar small (1.8M rows -> ~1.8k offsets)
+    """
+
+    def __init__(self, csv_path: str, stride: int = 1000, index_path: Optional[str] = None):
+        """
+        Initialize the index (call load_or_build() before use)
+
+        Args:
+            csv_path: CSV file to index
+            stride: Store the offset of every stride-th data row
+            index_path: Sidecar file (default: <csv_path>.index.json)
+        """
+        self.csv_path = csv_path
+        self.stride = max(1, stride)
+        self.index_path = index_path or f"{csv_path}.index.json"
+        self.logger = logging.getLogger(__name__)
+
+        self.encoding = 'utf-8'
+        self.total_rows = 0
+        self.header_end = 0
+        self.offsets: List[int] = []  # offsets[k] = byte offset of data row k * stride + 1
+
+    @staticmethod
+    def _is_blank(line: bytes) -> bool:
+        return not line.strip(b"\r\n")
+
+    def _file_signature(self) -> Dict:
+        stat = os.stat(self.csv_path)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def load_or_build(self) -> 'CsvRowIndex':
+        """
+        Load the sidecar index if it matches the CSV, otherwise rebuild it
+
+        Returns:
+            self, for chaining
+        """
+        if self._load():
+            return self
+        self.build()
+        self.save()
+        return self
+
+    def _load(self) -> bool:
+        """Load the sidecar if it exists and still describes the CSV"""
+        if not os.path.exists(self.index_path):
+            return False
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable row index {self.index_path}: {e}")
+            return False
+
+        if (data.get("version") != INDEX_VERSION or data.get("stride") != self.stride or
+                data.get("source") != self._file_signature()):
+            self.logger.info(f"Row index {self.index_path} is out of date, rebuilding")
+            return False
+
+        self.encoding = data["encoding"]
+        self.total_rows = data["total_rows"]
+        self.header_end = data["header_end"]
+        self.offsets = data["offsets"]
+        self.logger.info(f"Loaded row index: {self.total_rows:,} rows, encoding {self.encoding}")
+        return True
+
+    def build(self):
+        """Scan the CSV once, recording row offsets, row count and encoding"""
+        self.logger.info(f"Building row index for {self.csv_path} (one-time scan)...")
+
+        offsets = []
+        total_rows = 0
+        utf8_ok = True
+        decoder = codecs.getincrementaldecoder('utf-8')()
+
+        with open(self.csv_path, 'rb') as f:
+            header = self._read_record(f)
+            header_end = f.tell()
+            try:
+                decoder.decode(header)
+            except UnicodeDecodeError:
+                utf8_ok = False
+
+            while True:
+                start = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                if self._is_blank(line):
+                    continue
+
+                record = self._complete_record(f, line)
+
+                if total_rows % self.stride == 0:
+                    offsets.append(start)
+                total_rows += 1
+
+                if utf8_ok:
+                    try:
+                        decoder.decode(record)
+                    except UnicodeDecodeError:
+                        utf8_ok = False
+
+        # Same preference as BatchQuestionExtractor: UTF-8 if the whole file decodes, else Latin-1
+        self.encoding = 'utf-8' if utf8_ok else 'latin-1'
+        self.total_rows = total_rows
+        self.header_end = header_end
+        self.offsets = offsets
+        self.logger.info(f"Row index built: {total_rows:,} rows, encoding {self.encoding}")
+
+    def save(self):
+        """Write the sidecar index"""
+        data = {
+            "version": INDEX_VERSION,
+            "source": self._file_signature(),
+            "stride": self.stride,
+            "encoding": self.encoding,
+            "total_rows": self.total_rows,
+            "header_end": self.header_end,
+            "offsets": self.offsets
+        }
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.index_path)
+
+    @staticmethod
+    def _ends_in_quotes(line: bytes, in_quotes: bool = False) -> bool:
+        """
+        Whether a quoted field is still open at the end of a line
+
+        A quote only opens a field at the start of the field (start of the
+        record or right after a delimiter), as in the csv module and pandas;
+        anywhere else, e.g. 'a 5" screen', it is a literal character. Inside a
+        quoted field a doubled quote is an escaped quote.
+
+        Args:
+            line: Physical line of the CSV
+            in_quotes: Whether the line starts inside a quoted field
+
+        Returns:
+            True if the record continues on the next line
+        """
+        pos = 0
+        while True:
+            quote = line.find(b'"', pos)
+            if quote < 0:
+                return in_quotes
+            if in_quotes:
+                if line[quote + 1:quote + 2] == b'"':
+                    pos = quote + 2
+                    continue
+                in_quotes = False
+            elif quote == 0 or line[quote - 1:quote] == b',':
+                in_quotes = True
+            pos = quote + 1
+
+    def _complete_record(self, f: BinaryIO, line: bytes) -> bytes:
+        """Extend a line to a full CSV record (quoted fields may contain newlines)"""
+        record = line
+        in_quotes = self._ends_in_quotes(line)
+        while in_quotes:
+            more = f.readline()
+            if not more:
+                break
+            record += more
+            in_quotes = self._ends_in_quotes(more, in_quotes=True)
+        return record
+
+    def _read_record(self, f: BinaryIO) -> bytes:
+        """Read one CSV record from the current position"""
+        return self._complete_record(f, f.readline())
+
+    def _skip_records(self, f: BinaryIO, count: int) -> int:
+        """Advance past count data rows (blank lines are not rows); returns rows skipped"""
+        skipped = 0
+        while skipped < count:
+            line = f.readline()
+            if not line:
+                break
+            if self._is_blank(line):
+                continue
+            self._complete_record(f, line)
+            skipped += 1
+        return skipped
+
+    def offset_of(self, row: int, f: BinaryIO) -> int:
+        """
+        Position f at the start of a data row
+
+        Args:
+            row: Data row number (1-based, header excluded)
+            f: CSV file opened in binary mode
+
+        Returns:
+            Byte offset of the row
+        """
+        checkpoint = (row - 1) // self.stride
+        f.seek(self.offsets[checkpoint])
+        self._skip_records(f, (row - 1) - checkpoint * self.stride)
+        return f.tell()
+
+    def _open_range(self, f: BinaryIO, start_row: int, end_row: int) -> Tuple[bytes, int, int]:
+        """
+        Locate a row range in an open CSV file
+
+        Returns:
+            Tuple of (header bytes ending in a newline, start offset, end offset)
+        """
+        if start_row < 1 or start_row > end_row:
+            raise ValueError(f"Row range {start_row}-{end_row} is outside 1-{self.total_rows}")
+
+        f.seek(0)
+        header = f.read(self.header_end)
+        # Guarantee the header ends with a newline before the rows are appended
+        if not header.endswith(b"\n"):
+            header += b"\n"
+
+        start = self.offset_of(start_row, f)
+        if end_row >= self.total_rows:
+            end = os.fstat(f.fileno()).st_size
+        else:
+            end = self.offset_of(end_row + 1, f)
+        return header, start, end
+
+    def read_rows(self, start_row: int, end_row: int, **read_csv_kwargs) -> pd.DataFrame:
+        """
+        Parse only the requested data rows
+
+        Args:
+            start_row: First data row (1-based, header excluded)
+            end_row: Last data row (inclusive)
+            **read_csv_kwargs: Extra pandas.read_csv arguments (e.g. usecols)
+
+        Returns:
+            DataFrame with the header's columns and rows start_row..end_row
+        """
+        end_row = min(end_row, self.total_rows)
+
+        with open(self.csv_path, 'rb') as f:
+            header, start, end = self._open_range(f, start_row, end_row)
+            f.seek(start)
+            body = f.read(end - start)
+
+        return pd.read_csv(io.BytesIO(header + body), encoding=self.encoding, **read_csv_kwargs)
+
+    def iter_rows(self, start_row: int, end_row: int, chunk_size: int,
+                  **read_csv_kwargs) -> Iterator[pd.DataFrame]:
+        """
+        Stream a row range in chunks with a single pass over that part of the file
+
+        Args:
+            start_row: First data row (1-based, header excluded)
+            end_row: Last data row (inclusive)
+            chunk_size: Rows per yielded DataFrame
+            **read_csv_kwargs: Extra pandas.read_csv arguments (e.g. usecols)
+
+        Yields:
+            DataFrames of up to chunk_size consecutive rows
+        """
+        end_row = min(end_row, self.total_rows)
+
+        with open(self.csv_path, 'rb') as f:
+            header, start, end = self._open_range(f, start_row, end_row)
+            f.seek(start)
+            stream = io.BufferedReader(_ByteRangeReader(f, header, end - start))
+            with pd.read_csv(stream, encoding=self.encoding, chunksize=chunk_size,
+                             **read_csv_kwargs) as reader:
+                yield from reader
+
+
+def _self_test():
+    """Check row counts and slices against pandas on quoting edge cases"""
+    import tempfile
+
+    rows = []
+    for i in range(1, 301):
+        question = f"Q{i} plain question"
+        if i == 10:
+            question = 'Q10 a 5" screen'  # Literal quote inside an unquoted field
+        elif i == 50:
+            question = '"Q50 spans\ntwo lines, with ""quotes"""'
+        elif i == 120:
+            question = 'Q120 12" ruler and 3" nail'
+        rows.append(f"{i},{question},Explanation {i}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "quotes.csv")
+        with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+            f.write("Id,Questions,Explanation\n" + "\n".join(rows) + "\n")
+
+        expected = pd.read_csv(csv_path)
+        index = CsvRowIndex(csv_path, stride=7).load_or_build()
+        assert index.total_rows == len(expected), f"{index.total_rows} rows indexed, pandas reads {len(expected)}"
+        for first, last in ((1, 300), (8, 12), (45, 55), (115, 125), (290, 300)):
+            df = index.read_rows(first, last)
+            assert df.equals(expected.iloc[first - 1:last].reset_index(drop=True)), f"rows {first}-{last} differ"
+        chunks = pd.concat(index.iter_rows(40, 130, chunk_size=25), ignore_index=True)
+        assert chunks.equals(expected.iloc[39:130].reset_index(drop=True)), "iter_rows 40-130 differs"
+    print("Self-test passed: row count and slices match pandas")
+
+
+# Module testing
+if __name__ == "__main__":
+    import sys
+    import time
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    _self_test()
+
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else "mainexcel/mate.csv"
+    if not os.path.exists(csv_path):
+        print(f"CSV not found: {csv_path}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    index = CsvRowIndex(csv_path).load_or_build()
+    print(f"Index ready in {time.perf_counter() - start:.2f}s: {index.total_rows:,} rows")
+
+    for first in (1, index.total_rows // 2, max(1, index.total_rows - 999)):
+        start = time.perf_counter()
+        df = index.read_rows(first, first + 999)
+        print(f"  Rows {first:,}-{first + len(df) - 1:,}: {time.perf_counter() - start:.3f}s")
@@ -10,9 +10,10 @@ Classifies questions using exam-specific taxonomies in a single-stage approach:
 
 import json
 import logging
+import threading
 import time
 import os
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 
 # Load environment variables
@@ -23,6 +24,7 @@ except ImportError:
     pass
 
 from taxonomy_constants import get_taxonomy_for_exam
+from config import SUBJECT_DETECTION_PROMPT
 
 # Import rule-based classifier
 try:
@@ -32,6 +34,30 @@ except ImportError:
     RULE_BASED_AVAILABLE = False
     RuleBasedClassifier = None
 
+# Import candidate retriever
+try:
+    from triplet_retriever import TripletRetriever
+    RETRIEVAL_AVAILABLE = True
+except ImportError:
+    RETRIEVAL_AVAILABLE = False
+    TripletRetriever = None
+
+# Import near-miss triplet repair
+try:
+    from triplet_repair import TripletRepairer
+    REPAIR_AVAILABLE = True
+except ImportError:
+    REPAIR_AVAILABLE = False
+    TripletRepairer = None
+
+# Import classification cache
+try:
+    from classification_cache import ClassificationCache, taxonomy_version
+    CACHE_AVAILABLE = True
+except ImportError:
+    CACHE_AVAILABLE = False
+    ClassificationCache = None
+
 # Import AI clients
 try:
     from openai_client import OpenAIClient, create_openai_client
@@ -40,6 +66,44 @@ except ImportError:
     OPENAI_AVAILABLE = False
     OpenAIClient = None
 
+# Structured Outputs accept at most this many enum values per schema
+MAX_SCHEMA_ENUM_VALUES = 1000
+
+# SSC-Railways subject areas: (area, where to look in the numbered list, what to do with the match)
+SSC_SUBJECT_MAPPINGS = [
+    ("📊 SPORTS (cricket, football, olympics, tournaments, athletes, games)",
+     'Search the numbered list for: "Static GK > Static GK > Sports"',
+     "Select that EXACT triplet"),
+    ("📚 HISTORY (ancient, medieval, modern, dynasties, empires, historical events)",
+     'Search the numbered list for triplets starting with: "General Studies > Ancient - History >" OR '
+     '"General Studies > Medieval - History >" OR "General Studies > Modern - History >"',
+     "Find the CLOSEST match and copy it EXACTLY"),
+    ("🗺️ GEOGRAPHY (countries, rivers, mountains, climate, regions, maps)",
+     'Search the numbered list for triplets starting with: "General Studies > Geography >"',
+     "Find the CLOSEST match and copy it EXACTLY"),
+    ("⚖️ POLITY (government, constitution, laws, parliament, judiciary)",
+     'Search the numbered list for triplets starting with: "General Studies > Polity >"',
+     "Find the CLOSEST match and copy it EXACTLY"),
+    ("💰 ECONOMY (budget, GDP, banking, finance, trade, economics)",
+     'Search the numbered list for triplets starting with: "General Studies > Economy >"',
+     "Find the CLOSEST match and copy it EXACTLY"),
+    ("🔬 PHYSICS (motion, energy, electricity, magnetism, laws of physics)",
+     'Search the numbered list for triplets starting with: "General Studies > Physics >"',
+     "Find the CLOSEST match and copy it EXACTLY"),
+    ("🧪 CHEMISTRY (elements, compounds, reactions, periodic table)",
+     'Search the numbered list for triplets starting with: "General Studies > Chemistry >"',
+     "Find the CLOSEST match and copy it EXACTLY"),
+    ("🧬 BIOLOGY (animals, plants, human body, cells, life science)",
+     'Search the numbered list for triplets starting with: "General Studies > Biology >"',
+     "Find the CLOSEST match and copy it EXACTLY"),
+]
+
+# Characters per token assumed when sizing Ollama prompts (conservative for Llama/Gemma tokenizers)
+OLLAMA_CHARS_PER_TOKEN = 3.0
+
+# Shortest prompt prefix OpenAI serves from its prompt cache
+OPENAI_CACHE_MIN_TOKENS = 1024
+
 
 class ExamSpecificClassifier:
     """
@@ -47,6 +111,8 @@ class ExamSpecificClassifier:
 
     For each exam type (TNPSC, Banking, SSC-Railways), directly selects
     the best matching Subject-Topic-Subtopic triplet in one AI call.
+    An optional hierarchical mode first picks the subject (locally or with
+    a tiny prompt) and then lists only that subject's triplets.
     """
 
     def __init__(self, exam_type: str, config: Dict, ollama_client=None):
@@ -76,11 +142,34 @@ class ExamSpecificClassifier:
         self.triplets = taxonomy['triplets']
         self.triplet_dict = taxonomy['triplet_dict']
 
+        # Answer format: compact line numbers resolved locally, optionally schema-constrained
+        self.structured_config = config.get("structured_output", {})
+        self.structured_output = self.structured_config.get("enabled", False)
+        self.compact_answers = self.structured_config.get("answer_format", "line_number") == "line_number"
+
+        # Static prompt prefix, built once so every request reuses identical text
+        self.instruction_block = self.create_instruction_block()
+        self.full_triplet_list = "\n".join([f"{i+1}. {t}" for i, t in enumerate(self.triplets)])
+        self.full_list_section = self.render_triplet_section(self.full_triplet_list, "ALL valid triplets for this exam")
+
         # Determine primary and fallback providers
         self.primary_provider = self.provider_config.get("primary_provider", "openai")
         self.fallback_provider = self.provider_config.get("fallback_provider", "ollama")
         self.auto_fallback = self.provider_config.get("auto_fallback", True)
 
+        # Ollama reuses the KV cache of a static system prefix; the full list then costs less than a new shortlist
+        ollama_config = config.get("ollama", {})
+        self.ollama_chat_prefix = ollama_config.get("chat_prefix", True)
+        self.ollama_full_list = (self.primary_provider == "ollama" and self.ollama_chat_prefix and
+                                 ollama_config.get("prefix_full_list", True))
+        self.ollama_num_ctx = ollama_config.get("num_ctx") or 2048
+        self.ollama_num_predict = ollama_config.get("num_predict", 512)
+        if self.ollama_full_list and not self.fits_ollama_context(""):
+            # Ollama would silently drop the start of the prompt - keep shortlisting instead
+            self.logger.info(f"{exam_type} triplet list (~{self.ollama_prompt_tokens(''):,} tokens) does not fit "
+                             f"ollama.num_ctx={self.ollama_num_ctx} - keeping shortlists")
+            self.ollama_full_list = False
+
         # Initialize providers
         self.initialize_providers()
 
@@ -96,6 +185,67 @@ class ExamSpecificClassifier:
                 self.logger.warning(f"Failed to initialize rule-based classifier: {e}")
                 self.rule_classifier = None
 
+        # Initialize candidate retriever
+        self.retrieval_config = config.get("retrieval", {})
+        self.retriever = None
+        if RETRIEVAL_AVAILABLE and self.retrieval_config.get("enabled", False):
+            try:
+                self.retriever = TripletRetriever(self.triplets)
+                self.logger.info(f"Candidate retriever initialized (top {self.retrieval_config.get('top_k', 40)})")
+            except Exception as e:
+                self.logger.warning(f"Failed to initialize candidate retriever: {e}")
+                self.retriever = None
+
+        # Hierarchical mode: per-subject triplet sublists, formatted once and reused by every prompt
+        self.hierarchical_config = config.get("hierarchical", {})
+        self.hierarchical = self.hierarchical_config.get("enabled", False)
+        self.subject_triplets: Dict[str, List[int]] = {}
+        for index, triplet in enumerate(self.triplets):
+            self.subject_triplets.setdefault(triplet.split(" > ", 1)[0], []).append(index)
+        self.sublist_text: Dict[Tuple[int, ...], str] = {}
+        self.subject_index = None
+        if self.hierarchical:
+            for indices in self.subject_triplets.values():
+                self.sublist_text[tuple(indices)] = "\n".join(f"{i+1}. {self.triplets[i]}" for i in indices)
+            if self.retriever:
+                self.subject_index = self.retriever
+            elif RETRIEVAL_AVAILABLE:
+                try:
+                    self.subject_index = TripletRetriever(self.triplets)
+                except Exception as e:
+                    self.logger.warning(f"Failed to build subject index: {e}")
+            self.logger.info(f"Hierarchical mode: {len(self.subject_triplets)} subject sublists, "
+                             f"{self.hierarchical_config.get('subject_detection', 'local')} subject detection")
+
+        # Initialize near-miss repair
+        self.repairer = None
+        validation_config = config.get("validation", {})
+        if REPAIR_AVAILABLE and validation_config.get("fuzzy_repair", True):
+            try:
+                self.repairer = TripletRepairer(
+                    self.triplets,
+                    min_similarity=validation_config.get("repair_min_similarity", 0.85),
+                    min_margin=validation_config.get("repair_min_margin", 0.03)
+                )
+            except Exception as e:
+                self.logger.warning(f"Failed to initialize triplet repair: {e}")
+                self.repairer = None
+
+        # Initialize classification cache
+        self.cache_config = config.get("cache", {})
+        self.cache = None
+        self.taxonomy_version = None
+        if CACHE_AVAILABLE and self.cache_config.get("enabled", False):
+            try:
+                self.cache = ClassificationCache(
+                    self.cache_config.get("db_path", "temp/classification_cache.sqlite"),
+                    self.cache_config.get("max_entries", 500000)
+                )
+                self.taxonomy_version = taxonomy_version(self.triplets)
+            except Exception as e:
+                self.logger.warning(f"Failed to open classification cache: {e}")
+                self.cache = None
+
         # Statistics
         self.stats = {
             'total_classifications': 0,
@@ -106,12 +256,38 @@ class ExamSpecificClassifier:
             'openai_requests': 0,
             'ollama_requests': 0,
             'provider_fallbacks': 0,
+            'shortlisted_prompts': 0,
+            'full_list_prompts': 0,
+            'cache_hits': 0,
+            'fuzzy_repairs': 0,
+            'subject_sublist_prompts': 0,
+            'subject_detection_requests': 0,
+            'subject_detection_failures': 0,
+            'batch_requests': 0,
+            'batched_questions': 0,
+            'batch_requeued': 0,
             'total_cost_usd': 0.0,
             'cost_savings_usd': 0.0,
             'average_response_time': 0,
             'start_time': datetime.now()
         }
 
+        # Guards stats when questions are classified concurrently
+        self._lock = threading.Lock()
+
+        # Budget checks use the full-list prompt size until real usage is observed
+        if self.openai_client:
+            self.openai_client.prime_token_estimate(
+                self.exam_type, f"{self.instruction_block}\n{self.full_triplet_list}"
+            )
+
+        # OpenAI bills a cached full-list prefix at the cached-input rate, but a shortlisted
+        # prompt shares too short a prefix to be cached; send whichever costs less
+        self.openai_full_list = (self.primary_provider == "openai" and self.openai_client is not None and
+                                 self.retriever is not None and
+                                 config.get("openai", {}).get("prefix_full_list", True) and
+                                 self.openai_full_list_is_cheaper())
+
         self.logger.info(f"Exam-specific classifier initialized for {exam_type}")
         self.logger.info(f"  {len(self.subjects)} subjects, {len(self.triplets)} triplets")
         self.logger.info(f"  Primary: {self.primary_provider}, Fallback: {self.fallback_provider}")
@@ -139,90 +315,227 @@ class ExamSpecificClassifier:
         if self.ollama_client:
             self.logger.info("Ollama client available")
 
-    def create_classification_prompt(self, question: str, explanation: str = "") -> str:
+    def select_candidates(self, question: str, explanation: str = "", allow_ai: bool = True) -> Optional[List[int]]:
         """
-        Create prompt for single-stage classification
+        Shortlist candidate triplets for a question
+
+        In hierarchical mode the detected subject's sublist is used first;
+        otherwise (or when no subject is certain) the retrieval shortlist.
+        With Ollama as primary provider and a cached full-list prefix
+        (ollama.prefix_full_list), no shortlist is made as long as the full
+        prompt fits Ollama's context window; with OpenAI (openai.prefix_full_list),
+        only when the cached full list costs less than a shortlist.
 
         Args:
             question: Question text
             explanation: Optional explanation text
+            allow_ai: Whether hierarchical mode may spend an AI request on subject detection
 
         Returns:
-            Formatted prompt string
+            Indices into self.triplets, or None to use the full list
         """
-        # Combine question and explanation
-        combined_text = question
+        text = question
         if explanation and explanation.strip() and explanation.lower() != 'nan':
-            combined_text += f"\n\nExplanation: {explanation}"
+            text += f" {explanation}"
 
-        # Format available triplets - Show ALL triplets so AI doesn't invent categories
-        triplet_list = self.triplets  # Show all triplets
-        triplets_formatted = "\n".join([f"{i+1}. {t}" for i, t in enumerate(triplet_list)])
+        if self.openai_full_list or (self.ollama_full_list and self.fits_ollama_context(text)):
+            return None
 
-        # Add special instructions for SSC-Railways
-        special_instructions = ""
-        if self.exam_type == "SSC-Railways":
-            special_instructions = """
-⚠️ SPECIAL INSTRUCTIONS FOR SSC-RAILWAYS:
+        if self.hierarchical:
+            subjects = self.detect_subjects(text, allow_ai)
+            if subjects:
+                self._count('subject_sublist_prompts')
+                self.logger.debug(f"Subject pass selected: {', '.join(subjects)}")
+                if len(subjects) == 1:
+                    return self.subject_triplets[subjects[0]]
+                return sorted(index for subject in subjects for index in self.subject_triplets[subject])
 
-SUBJECT MAPPING RULES:
-When you identify what the question is about, use these subject mappings:
+        if not self.retriever:
+            return None
+
+        candidates = self.retriever.shortlist(
+            text,
+            top_k=self.retrieval_config.get("top_k", 40),
+            min_top_score=self.retrieval_config.get("min_top_score", 5.0),
+            min_matched_terms=self.retrieval_config.get("min_matched_terms", 2),
+            min_candidates=self.retrieval_config.get("min_candidates", 10)
+        )
+
+        if candidates is None and not self.full_list_fits(text):
+            # An uncertain but wide shortlist beats a prompt Ollama would truncate
+            candidates = self.retriever.shortlist(text, top_k=self.ollama_shortlist_size(text),
+                                                  min_top_score=0.0, min_matched_terms=1, min_candidates=1)
+
+        if candidates is None and not self.full_list_fits(text):
+            self.logger.warning(f"No shortlist for a question and the full list exceeds "
+                                f"ollama.num_ctx={self.ollama_num_ctx} - Ollama will truncate the prompt")
+        elif candidates is None:
+            self.logger.debug("Retrieval uncertain - using full triplet list")
+        else:
+            self.logger.debug(f"Retrieval shortlisted {len(candidates)}/{len(self.triplets)} triplets")
+
+        return candidates
+
+    def detect_subjects(self, text: str, allow_ai: bool = True) -> Optional[List[str]]:
+        """
+        First pass of hierarchical mode: find the subject(s) a question belongs to
+
+        Args:
+            text: Question (and explanation) text
+            allow_ai: Whether an AI subject prompt may be sent
+
+        Returns:
+            One or more subject names, or None if the subject is uncertain
+        """
+        if self.hierarchical_config.get("subject_detection", "local") == "ai" and allow_ai:
+            subject = self.detect_subject_with_ai(text)
+            return [subject] if subject else None
+        return self.detect_subjects_locally(text)
+
+    def detect_subjects_locally(self, text: str) -> Optional[List[str]]:
+        """
+        Detect subjects from the best BM25 triplet score within each subject
+
+        Args:
+            text: Question (and explanation) text
+
+        Returns:
+            Subjects scoring close to the best one, or None if the scores are too weak or too spread
+        """
+        if not self.subject_index:
+            return None
 
-📊 SPORTS (cricket, football, olympics, tournaments, athletes, games)
-   → Search the numbered list for: "Static GK > Static GK > Sports"
-   → Select that EXACT triplet
+        scores = self.subject_index.score(text)
+        subject_scores = sorted(((float(scores[indices].max()), subject)
+                                 for subject, indices in self.subject_triplets.items()), reverse=True)
+        best_score = subject_scores[0][0]
+        if best_score < self.hierarchical_config.get("min_subject_score", 5.0):
+            return None
 
-📚 HISTORY (ancient, medieval, modern, dynasties, empires, historical events)
-   → Search the numbered list for triplets starting with: "General Studies > Ancient - History >" OR "General Studies > Medieval - History >" OR "General Studies > Modern - History >"
-   → Find the CLOSEST match and copy it EXACTLY
+        cutoff = best_score * self.hierarchical_config.get("subject_margin", 0.8)
+        subjects = [subject for score, subject in subject_scores if score >= cutoff]
+        if len(subjects) > self.hierarchical_config.get("max_subjects", 2):
+            return None
+        return subjects
 
-🗺️ GEOGRAPHY (countries, rivers, mountains, climate, regions, maps)
-   → Search the numbered list for triplets starting with: "General Studies > Geography >"
-   → Find the CLOSEST match and copy it EXACTLY
+    def create_subject_prompt(self, text: str) -> Tuple[str, Optional[Dict]]:
+        """
+        Create the subject-only prompt and its response schema
 
-⚖️ POLITY (government, constitution, laws, parliament, judiciary)
-   → Search the numbered list for triplets starting with: "General Studies > Polity >"
-   → Find the CLOSEST match and copy it EXACTLY
+        Args:
+            text: Question (and explanation) text
 
-💰 ECONOMY (budget, GDP, banking, finance, trade, economics)
-   → Search the numbered list for triplets starting with: "General Studies > Economy >"
-   → Find the CLOSEST match and copy it EXACTLY
+        Returns:
+            Tuple of (prompt, JSON schema or None)
+        """
+        subjects = list(self.subject_triplets)
+        template = self.config.get("templates", {}).get("subject_detection", SUBJECT_DETECTION_PROMPT)
+        prompt = template.format(combined_context=text, subjects_list="\n".join(f"- {s}" for s in subjects))
+
+        schema = None
+        if self.structured_output:
+            schema = {
+                "type": "object",
+                "properties": {
+                    "subject": {"type": "string", "enum": subjects},
+                    "confidence": {"type": "number"}
+                },
+                "required": ["subject", "confidence"],
+                "additionalProperties": False
+            }
+        return prompt, schema
 
-🔬 PHYSICS (motion, energy, electricity, magnetism, laws of physics)
-   → Search the numbered list for triplets starting with: "General Studies > Physics >"
-   → Find the CLOSEST match and copy it EXACTLY
+    def detect_subject_with_ai(self, text: str) -> Optional[str]:
+        """
+        Detect the subject with a tiny prompt listing only the subject names
 
-🧪 CHEMISTRY (elements, compounds, reactions, periodic table)
-   → Search the numbered list for triplets starting with: "General Studies > Chemistry >"
-   → Find the CLOSEST match and copy it EXACTLY
+        Args:
+            text: Question (and explanation) text
 
-🧬 BIOLOGY (animals, plants, human body, cells, life science)
-   → Search the numbered list for triplets starting with: "General Studies > Biology >"
-   → Find the CLOSEST match and copy it EXACTLY
+        Returns:
+            Subject name, or None if no confident answer was given
+        """
+        prompt, schema = self.create_subject_prompt(text)
+        max_tokens = self.hierarchical_config.get("subject_max_tokens", 30)
+        self._count('subject_detection_requests')
 
-CRITICAL: COPY EXACTLY FROM THE NUMBERED LIST
-✅ Look through the NUMBERED LIST above
+        response_text = None
+        for provider in (self.primary_provider, self.fallback_provider):
+            if provider == "openai" and self.openai_client:
+                self._count('openai_requests')
+                try:
+                    # Separate estimator key so subject prompts do not skew classification estimates
+                    response_text = self.openai_client.make_request(
+                        prompt=prompt, question="", operation="subject_detection",
+                        exam_type=f"{self.exam_type}/subject", max_tokens=max_tokens, json_schema=schema
+                    )
+                except Exception as e:
+                    self.logger.error(f"Error calling openai for subject detection: {e}")
+            elif provider == "ollama" and self.ollama_client:
+                self._count('ollama_requests')
+                try:
+                    response_text = self.ollama_client.make_request(prompt, json_schema=schema, max_tokens=max_tokens)
+                except Exception as e:
+                    self.logger.error(f"Error calling ollama for subject detection: {e}")
+            if response_text or not self.auto_fallback:
+                break
+
+        subject = None
+        if response_text:
+            try:
+                data = json.loads(self.strip_code_fences(response_text))
+                answer = str(data.get("subject", "")).strip().lower()
+                if float(data.get("confidence", 0.0)) >= self.hierarchical_config.get("min_subject_confidence", 0.6):
+                    subject = next((s for s in self.subject_triplets if s.lower() == answer), None)
+            except (json.JSONDecodeError, AttributeError, TypeError, ValueError):
+                pass
+
+        if not subject:
+            self._count('subject_detection_failures')
+            self.logger.debug("Subject pass inconclusive - using the single-stage candidates")
+        return subject
+
+    def create_instruction_block(self) -> str:
+        """
+        Create the static instructions shared by every prompt for this exam
+
+        The block depends only on the exam type, so it is built once and sent
+        as the first part of each prompt where the provider's prefix cache can
+        reuse it between questions. Line-number answers get the compact block.
+
+        Returns:
+            Instruction text (everything before the triplet list)
+        """
+        if self.compact_answers:
+            return self.create_compact_instruction_block()
+
+        # Add special instructions for SSC-Railways
+        special_instructions = ""
+        if self.exam_type == "SSC-Railways":
+            mappings = "".join(f"{area}\n   → {where}\n   → {action}\n\n"
+                               for area, where, action in SSC_SUBJECT_MAPPINGS)
+            special_instructions = f"""
+⚠️ SPECIAL INSTRUCTIONS FOR SSC-RAILWAYS:
+
+SUBJECT MAPPING RULES:
+When you identify what the question is about, use these subject mappings:
+
+{mappings}CRITICAL: COPY EXACTLY FROM THE NUMBERED LIST
+✅ Look through the NUMBERED LIST below
 ✅ Find a triplet that matches the question topic
 ✅ Copy the ENTIRE triplet EXACTLY character-by-character
 ✅ Include all three parts: Subject > Topic > Subtopic
 ✅ DO NOT invent your own triplets - only use what's in the list
 """
 
-        prompt = f"""You are classifying a question for the {self.exam_type} exam.
-
-QUESTION TO CLASSIFY:
-{combined_text}
-
-AVAILABLE SUBJECT > TOPIC > SUBTOPIC COMBINATIONS:
-{triplets_formatted}
+        return f"""You are classifying a question for the {self.exam_type} exam.
 {special_instructions}
-
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 🚨 CRITICAL INSTRUCTION - READ THIS FIRST 🚨
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
 UNDERSTANDING THE LIST STRUCTURE:
-The numbered list above shows ALL valid triplets for this exam.
+The numbered list at the end of these instructions shows the triplets you may choose from.
 Each line has this EXACT format:
     [NUMBER]. [SUBJECT] > [TOPIC] > [SUBTOPIC]
 
@@ -230,7 +543,7 @@ Example from the list:
     523. History, Culture, Heritage & Socio-Political Movements in Tamilnadu > Justice Party > Justice Party and the Home Rule Movement
 
 ABSOLUTE RULES YOU MUST FOLLOW:
-1. ✅ YOU CAN ONLY SELECT FROM THE NUMBERED LIST ABOVE
+1. ✅ YOU CAN ONLY SELECT FROM THE NUMBERED LIST BELOW
 2. ✅ YOU MUST COPY THE EXACT TEXT - EVERY CHARACTER, SPACE, AND PUNCTUATION MARK
 3. ✅ YOU MUST CITE THE LINE NUMBER WHERE YOU FOUND IT
 4. ❌ YOU CANNOT CREATE YOUR OWN SUBJECT NAMES - ONLY USE WHAT'S IN THE LIST
@@ -239,18 +552,18 @@ ABSOLUTE RULES YOU MUST FOLLOW:
 7. ❌ YOU CANNOT MODIFY, SHORTEN, OR PARAPHRASE ANY PART OF THE TRIPLET
 8. ❌ YOU CANNOT COMBINE PARTS FROM DIFFERENT LINES - TAKE THE COMPLETE LINE AS-IS
 
-IF YOUR ANSWER IS NOT FOUND EXACTLY IN THE NUMBERED LIST ABOVE, IT IS WRONG!
+IF YOUR ANSWER IS NOT FOUND EXACTLY IN THE NUMBERED LIST BELOW, IT IS WRONG!
 
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
 STEP-BY-STEP REASONING PROCESS (FOLLOW EXACTLY IN THIS ORDER):
 
 STEP 1: UNDERSTAND THE QUESTION
-- Read the question and explanation carefully
+- Read the question and explanation (given at the very end) carefully
 - Identify what specific knowledge area it tests (e.g., "This tests knowledge about Justice Party in Tamil Nadu")
 
 STEP 2: SEARCH FOR MATCHING SUBJECT (EXACT NAME)
-- Scan through the numbered list above
+- Scan through the numbered list below
 - Find subjects that might match the knowledge area
 - BE CAREFUL: Some subjects have similar names - you MUST match EXACTLY
 - Example: "History, Culture of India and Indian National Movement" ≠ "History, Culture, Heritage & Socio-Political Movements in Tamilnadu"
@@ -318,10 +631,263 @@ Question about "Justice Party in Tamil Nadu during Home Rule Movement"
     ...
 }}
 ❌ REASON: "History, Culture of India and Indian National Movement" doesn't have any "Justice Party" topics in the list! You mixed up two different subjects!
+"""
+
+    def create_compact_instruction_block(self) -> str:
+        """
+        Create the static instructions for line-number answers
+
+        Compact answers carry no reasoning or copied triplet text, so the
+        cached prefix asks for exactly the {"line_number", "confidence"} object
+        that the closing instruction and the output token cap expect.
+
+        Returns:
+            Instruction text (everything before the triplet list)
+        """
+        special_instructions = ""
+        if self.exam_type == "SSC-Railways":
+            mappings = "".join(f"{area}\n   → {where}\n\n" for area, where, _ in SSC_SUBJECT_MAPPINGS)
+            special_instructions = f"""
+⚠️ SPECIAL INSTRUCTIONS FOR SSC-RAILWAYS:
+
+SUBJECT MAPPING RULES:
+When you identify what the question is about, look in these parts of the numbered list:
+
+{mappings}"""
+
+        return f"""You are classifying a question for the {self.exam_type} exam.
+{special_instructions}
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+🚨 CRITICAL INSTRUCTION - READ THIS FIRST 🚨
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+UNDERSTANDING THE LIST STRUCTURE:
+The numbered list at the end of these instructions shows the triplets you may choose from.
+Each line has this format:
+    [NUMBER]. [SUBJECT] > [TOPIC] > [SUBTOPIC]
+
+HOW TO CHOOSE:
+1. Identify what specific knowledge area the question (given at the very end) tests
+2. Find the matching SUBJECT - some subjects have similar names, e.g.
+   "History, Culture of India and Indian National Movement" ≠ "History, Culture, Heritage & Socio-Political Movements in Tamilnadu"
+3. Within that subject, find the best matching TOPIC, then the best matching SUBTOPIC
+4. Answer with the NUMBER of that line
+
+RULES:
+1. ✅ ONLY line numbers from the numbered list are valid answers
+2. ❌ DO NOT explain your choice or copy the triplet text - the line number is the whole answer
+
+REQUIRED OUTPUT FORMAT (JSON ONLY - NO OTHER TEXT):
+{{"line_number": XXX, "confidence": 0.85}}
+
+EXAMPLE:
+Question about "Justice Party in Tamil Nadu during Home Rule Movement", with this line in the list:
+    523. History, Culture, Heritage & Socio-Political Movements in Tamilnadu > Justice Party > Justice Party and the Home Rule Movement
+
+✓ CORRECT ANSWER:
+{{"line_number": 523, "confidence": 0.90}}
+"""
+
+    def create_classification_prompt(self, question: str, explanation: str = "",
+                                     candidates: Optional[List[int]] = None) -> str:
+        """
+        Create prompt for single-stage classification
+
+        Static content comes first (instructions, then the triplet list) and the
+        question last, so consecutive prompts share a long identical prefix that
+        OpenAI serves from its prompt cache at the cached-input rate. Only the
+        full list makes that prefix long enough (OPENAI_CACHE_MIN_TOKENS); a
+        shortlisted prompt shares just the instruction block and is billed in full.
+
+        Args:
+            question: Question text
+            explanation: Optional explanation text
+            candidates: Optional triplet indices to list instead of the full taxonomy
+
+        Returns:
+            Formatted prompt string
+        """
+        # Combine question and explanation
+        combined_text = question
+        if explanation and explanation.strip() and explanation.lower() != 'nan':
+            combined_text += f"\n\nExplanation: {explanation}"
+
+        prompt = f"""{self.create_triplet_section(candidates, "this question")}
+QUESTION TO CLASSIFY:
+{combined_text}
+
+{self.answer_instruction()}
 """
 
         return prompt
 
+    def answer_instruction(self) -> str:
+        """Closing instruction of a single-question prompt for the current answer format"""
+        if self.compact_answers:
+            return ("Select the matching triplet from the numbered list above and answer with ONLY its "
+                    "line number and your confidence, e.g. {\"line_number\": 523, \"confidence\": 0.9}.")
+        return "Select the matching triplet from the numbered list above and return ONLY the JSON object."
+
+    def create_triplet_section(self, candidates: Optional[List[int]] = None,
+                               selected_for: str = "this question") -> str:
+        """
+        Create the instructions and numbered triplet list that start every prompt
+
+        Args:
+            candidates: Optional triplet indices to list instead of the full taxonomy
+            selected_for: What a shortlist was selected for (shown in its heading)
+
+        Returns:
+            Prompt text up to the question section
+        """
+        # Format available triplets - show ALL triplets unless a shortlist was given.
+        # Line numbers always refer to the full taxonomy so they stay verifiable.
+        if candidates:
+            self._count('shortlisted_prompts')
+            triplets_formatted = self.sublist_text.get(tuple(candidates))
+            if triplets_formatted is None:
+                triplets_formatted = "\n".join([f"{i+1}. {self.triplets[i]}" for i in candidates])
+            list_scope = f"the candidate triplets selected for {selected_for}"
+        else:
+            self._count('full_list_prompts')
+            return self.full_list_section
+
+        return self.render_triplet_section(triplets_formatted, list_scope)
+
+    def render_triplet_section(self, triplets_formatted: str, list_scope: str) -> str:
+        """
+        Put the instructions and a formatted triplet list together
+
+        Args:
+            triplets_formatted: Numbered triplet lines
+            list_scope: Description of the listed triplets (shown in the heading)
+
+        Returns:
+            Prompt text up to the question section
+        """
+        return f"""{self.instruction_block}
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+AVAILABLE SUBJECT > TOPIC > SUBTOPIC COMBINATIONS ({list_scope}):
+{triplets_formatted}
+
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+"""
+
+    def create_batch_classification_prompt(self, items: List[Tuple[str, str, str]],
+                                           candidates: Optional[List[int]] = None) -> str:
+        """
+        Create one prompt that classifies several questions against a shared triplet list
+
+        The instructions and triplet list are identical to the single-question
+        prompt, so batched and single requests share the same cached prefix.
+
+        Args:
+            items: (question_id, question, explanation) tuples
+            candidates: Optional triplet indices to list instead of the full taxonomy
+
+        Returns:
+            Formatted prompt string
+        """
+        question_blocks = []
+        for question_id, question, explanation in items:
+            block = f"[{question_id}]\n{question}"
+            if explanation and explanation.strip() and explanation.lower() != 'nan':
+                block += f"\n\nExplanation: {explanation}"
+            question_blocks.append(block)
+        questions_formatted = "\n\n".join(question_blocks)
+        ids = ", ".join(f'"{question_id}"' for question_id, _, _ in items)
+
+        if self.compact_answers:
+            output_format = """For every question, answer with ONLY the line number of its matching triplet and your confidence:
+{"classifications": [{"id": "q1", "line_number": 523, "confidence": 0.9}]}"""
+        else:
+            output_format = """Return ONLY a JSON object with exactly one entry per question, in the same order.
+Each entry has the fields of the JSON format above plus "id" (the question id in
+square brackets), and "reasoning_steps" is ONE short sentence:
+{"classifications": [
+    {"id": "q1", "reasoning_steps": "...", "line_number": XXX, "triplet": "Subject > Topic > Subtopic", "subject": "Subject", "topic": "Topic", "subtopic": "Subtopic", "confidence": 0.85}
+]}"""
+
+        return f"""{self.create_triplet_section(candidates, "these questions")}
+QUESTIONS TO CLASSIFY ({len(items)} questions, classify EACH ONE independently):
+{questions_formatted}
+
+BATCH OUTPUT FORMAT:
+{output_format}
+Question ids: {ids}
+"""
+
+    def create_response_schema(self, candidates: Optional[List[int]] = None,
+                               question_ids: Optional[List[str]] = None) -> Optional[Dict]:
+        """
+        Create the JSON schema constraining an answer to the listed line numbers
+
+        Compact answers carry only line_number and confidence; full answers also
+        carry the copied triplet text and reasoning.
+
+        Args:
+            candidates: Triplet indices listed in the prompt (None = full taxonomy)
+            question_ids: Question ids of a batched prompt (None for a single question)
+
+        Returns:
+            JSON schema, or None when structured output is disabled
+        """
+        if not self.structured_output:
+            return None
+
+        line_numbers = [i + 1 for i in candidates] if candidates else list(range(1, len(self.triplets) + 1))
+        line_number_schema = {"type": "integer"}
+        if len(line_numbers) <= MAX_SCHEMA_ENUM_VALUES:
+            line_number_schema["enum"] = line_numbers
+
+        if self.compact_answers:
+            properties = {"line_number": line_number_schema, "confidence": {"type": "number"}}
+        else:
+            properties = {
+                "reasoning_steps": {"type": "string"},
+                "line_number": line_number_schema,
+                "triplet": {"type": "string"},
+                "subject": {"type": "string"},
+                "topic": {"type": "string"},
+                "subtopic": {"type": "string"},
+                "confidence": {"type": "number"}
+            }
+        if question_ids is not None:
+            properties = {"id": {"type": "string", "enum": question_ids}, **properties}
+
+        answer = {
+            "type": "object",
+            "properties": properties,
+            "required": list(properties),
+            "additionalProperties": False
+        }
+        if question_ids is None:
+            return answer
+
+        return {
+            "type": "object",
+            "properties": {"classifications": {"type": "array", "items": answer}},
+            "required": ["classifications"],
+            "additionalProperties": False
+        }
+
+    def output_token_limit(self, questions: int = 1) -> Optional[int]:
+        """
+        Output token cap for a request
+
+        Args:
+            questions: Questions classified by the request
+
+        Returns:
+            Token cap, or None for the provider's configured default
+        """
+        if self.compact_answers:
+            return self.structured_config.get("max_tokens", 40) * questions
+        if questions > 1:
+            return self.config.get("processing", {}).get("batch_output_tokens_per_question", 150) * questions
+        return None
+
     def parse_classification_response(self, response_text: str) -> Optional[Dict]:
         """
         Parse AI response to extract classification
@@ -343,56 +909,9 @@ Question about "Justice Party in Tamil Nadu during Home Rule Movement"
                 self.logger.error(f"Expected string response, got {type(response_text)}")
                 return None
             
-            # Try to find JSON in response
-            response_text = response_text.strip()
-
-            # Remove markdown code blocks if present
-            if response_text.startswith("```json"):
-                response_text = response_text[7:]
-            if response_text.startswith("```"):
-                response_text = response_text[3:]
-            if response_text.endswith("```"):
-                response_text = response_text[:-3]
-
-            response_text = response_text.strip()
-
             # Parse JSON
-            data = json.loads(response_text)
-
-            # Extract fields with safe None handling
-            subject = data.get('subject') or ''
-            topic = data.get('topic') or ''
-            subtopic = data.get('subtopic') or ''
-            triplet = data.get('triplet') or ''
-            
-            # Safely strip whitespace
-            subject = subject.strip() if subject else ''
-            topic = topic.strip() if topic else ''
-            subtopic = subtopic.strip() if subtopic else ''
-            triplet = triplet.strip() if triplet else ''
-            confidence = data.get('confidence', 0.0)
-            reasoning_steps = data.get('reasoning_steps', '')
-            line_number = data.get('line_number', None)
-
-            # Log reasoning steps and line number (helps debug classification)
-            if reasoning_steps:
-                self.logger.debug(f"AI Reasoning: {reasoning_steps}")
-            if line_number:
-                self.logger.info(f"Selected from line #{line_number}: {triplet}")
-
-            if not (subject and topic and subtopic):
-                self.logger.error("Missing required fields in response")
-                return None
-
-            return {
-                'subject': subject,
-                'topic': topic,
-                'subtopic': subtopic,
-                'triplet': triplet,
-                'confidence': confidence,
-                'reasoning_steps': reasoning_steps,
-                'line_number': line_number
-            }
+            data = json.loads(self.strip_code_fences(response_text))
+            return self.result_from_data(data)
 
         except json.JSONDecodeError as e:
             self.logger.error(f"Failed to parse JSON response: {e}")
@@ -402,6 +921,156 @@ Question about "Justice Party in Tamil Nadu during Home Rule Movement"
             self.logger.error(f"Error parsing response: {e}")
             return None
 
+    @staticmethod
+    def strip_code_fences(response_text: str) -> str:
+        """Remove surrounding whitespace and markdown code fences from a response"""
+        response_text = response_text.strip()
+        if response_text.startswith("```json"):
+            response_text = response_text[7:]
+        if response_text.startswith("```"):
+            response_text = response_text[3:]
+        if response_text.endswith("```"):
+            response_text = response_text[:-3]
+        return response_text.strip()
+
+    def result_from_data(self, data: Dict) -> Optional[Dict]:
+        """
+        Extract classification fields from a decoded JSON response object
+
+        Args:
+            data: Decoded JSON object
+
+        Returns:
+            Dictionary with subject, topic, subtopic or None if fields are missing
+        """
+        # A compact answer may come back as just the line number
+        if isinstance(data, int) and not isinstance(data, bool):
+            data = {'line_number': data}
+        if not isinstance(data, dict):
+            self.logger.error(f"Expected JSON object, got {type(data).__name__}")
+            return None
+
+        # Compact answers carry only the line number of the selected triplet
+        if not data.get('subject') and data.get('line_number') is not None:
+            return self.result_from_line_number(data)
+
+        # Extract fields with safe None handling
+        subject = data.get('subject') or ''
+        topic = data.get('topic') or ''
+        subtopic = data.get('subtopic') or ''
+        triplet = data.get('triplet') or ''
+        
+        # Safely strip whitespace
+        subject = subject.strip() if subject else ''
+        topic = topic.strip() if topic else ''
+        subtopic = subtopic.strip() if subtopic else ''
+        triplet = triplet.strip() if triplet else ''
+        confidence = data.get('confidence', 0.0)
+        reasoning_steps = data.get('reasoning_steps', '')
+        line_number = data.get('line_number', None)
+
+        # Log reasoning steps and line number (helps debug classification)
+        if reasoning_steps:
+            self.logger.debug(f"AI Reasoning: {reasoning_steps}")
+        if line_number:
+            self.logger.info(f"Selected from line #{line_number}: {triplet}")
+
+        if not (subject and topic and subtopic):
+            self.logger.error("Missing required fields in response")
+            return None
+
+        return {
+            'subject': subject,
+            'topic': topic,
+            'subtopic': subtopic,
+            'triplet': triplet,
+            'confidence': confidence,
+            'reasoning_steps': reasoning_steps,
+            'line_number': line_number
+        }
+
+    def result_from_line_number(self, data: Dict) -> Optional[Dict]:
+        """
+        Resolve a compact answer's line number to its triplet in O(1)
+
+        Args:
+            data: Decoded JSON object with line_number and confidence
+
+        Returns:
+            Dictionary with subject, topic, subtopic or None if the line number is invalid
+        """
+        try:
+            line_number = int(data['line_number'])
+        except (TypeError, ValueError):
+            self.logger.error(f"Invalid line number format: {data.get('line_number')}")
+            return None
+
+        if not 1 <= line_number <= len(self.triplets):
+            self.logger.error(f"Line number {line_number} out of range 1-{len(self.triplets)}")
+            return None
+
+        triplet = self.triplets[line_number - 1]
+        subject, topic, subtopic = triplet.split(" > ", 2)
+        self.logger.info(f"Selected from line #{line_number}: {triplet}")
+
+        return {
+            'subject': subject,
+            'topic': topic,
+            'subtopic': subtopic,
+            'triplet': triplet,
+            'confidence': data.get('confidence', 0.0),
+            'reasoning_steps': '',
+            'line_number': line_number
+        }
+
+    def parse_batch_classification_response(self, response_text: str) -> Dict[str, Dict]:
+        """
+        Parse a batched AI response into classifications keyed by question id
+
+        Accepts a JSON array of objects with an "id" field, an object wrapping
+        such an array, or an object mapping question ids to classifications.
+
+        Args:
+            response_text: Raw response from AI
+
+        Returns:
+            Dictionary of question_id -> parsed classification (unparseable items are left out)
+        """
+        if not isinstance(response_text, str):
+            self.logger.error(f"Expected string response, got {type(response_text)}")
+            return {}
+
+        try:
+            data = json.loads(self.strip_code_fences(response_text))
+        except json.JSONDecodeError as e:
+            self.logger.error(f"Failed to parse batched JSON response: {e}")
+            self.logger.debug(f"Response text: {response_text}")
+            return {}
+
+        if isinstance(data, dict):
+            arrays = [value for value in data.values() if isinstance(value, list)]
+            if arrays:
+                data = arrays[0]
+            else:
+                data = [dict(value, id=key) for key, value in data.items() if isinstance(value, dict)]
+        if not isinstance(data, list):
+            self.logger.error(f"Expected JSON array in batched response, got {type(data).__name__}")
+            return {}
+
+        results = {}
+        for item in data:
+            if not isinstance(item, dict) or item.get('id') is None:
+                continue
+            try:
+                result = self.result_from_data(item)
+            except Exception as e:
+                self.logger.error(f"Error parsing batched item {item.get('id')}: {e}")
+                continue
+            if result:
+                results[str(item['id']).strip().strip('[]')] = result
+
+        return results
+
     def validate_classification(self, result: Dict) -> bool:
         """
         Validate that classification exists in exam-specific taxonomy with enhanced debugging
@@ -467,30 +1136,70 @@ Question about "Justice Party in Tamil Nadu during Home Rule Movement"
 
         return False
 
-    def classify_with_provider(self, prompt: str, provider: str) -> Optional[str]:
+    def repair_classification(self, result: Dict) -> bool:
+        """
+        Replace a near-miss classification with the closest taxonomy triplet
+
+        Only confident, unambiguous matches are accepted, so typos and mixed-up
+        subjects are fixed locally while real misclassifications are re-prompted.
+
+        Args:
+            result: Classification result dictionary (updated in place on success)
+
+        Returns:
+            True if the result now holds a valid triplet
+        """
+        if not self.repairer:
+            return False
+
+        repaired = self.repairer.repair(result.get('subject', ''), result.get('topic', ''),
+                                        result.get('subtopic', ''), result.get('line_number'))
+        if not repaired:
+            return False
+
+        index, similarity = repaired
+        triplet = self.triplets[index]
+        subject, topic, subtopic = triplet.split(" > ", 2)
+        self.logger.info(f"Repaired '{result.get('subject')} > {result.get('topic')} > {result.get('subtopic')}' "
+                         f"to line #{index + 1}: {triplet} (similarity {similarity:.2f})")
+        result.update(subject=subject, topic=topic, subtopic=subtopic, triplet=triplet, line_number=index + 1)
+        self._count('fuzzy_repairs')
+        return True
+
+    def classify_with_provider(self, prompt: str, provider: str, max_tokens: Optional[int] = None,
+                               questions: int = 1, json_schema: Optional[Dict] = None) -> Optional[str]:
         """
         Get classification from specified provider
 
         Args:
             prompt: Classification prompt
             provider: "openai" or "ollama"
+            max_tokens: Output token cap (default: the provider's configured limit)
+            questions: Questions classified by the prompt (for token estimates)
+            json_schema: Optional JSON schema constraining the response
 
         Returns:
             Raw response text or None if failed
         """
         try:
             if provider == "openai" and self.openai_client:
-                self.stats['openai_requests'] += 1
+                self._count('openai_requests')
                 response = self.openai_client.make_request(
                     prompt=prompt,
                     question="",
-                    operation="classification"
+                    operation="classification" if questions == 1 else "batch_classification",
+                    exam_type=self.exam_type,
+                    max_tokens=max_tokens,
+                    questions=questions,
+                    json_schema=json_schema
                 )
                 return response
 
             elif provider == "ollama" and self.ollama_client:
-                self.stats['ollama_requests'] += 1
-                response = self.ollama_client.generate(prompt)
+                self._count('ollama_requests')
+                system, prompt = self.split_static_prefix(prompt) if self.ollama_chat_prefix else (None, prompt)
+                response = self.ollama_client.make_request(prompt, json_schema=json_schema, max_tokens=max_tokens,
+                                                           system=system)
                 return response
 
             else:
@@ -501,6 +1210,246 @@ Question about "Justice Party in Tamil Nadu during Home Rule Movement"
             self.logger.error(f"Error calling {provider}: {e}")
             return None
 
+    def ollama_prompt_tokens(self, text: str) -> int:
+        """
+        Estimate the tokens of a full-list prompt plus its answer for Ollama
+
+        Args:
+            text: Question (and explanation) text
+
+        Returns:
+            Estimated prompt and output tokens
+        """
+        chars = len(self.full_list_section) + len(text) + len(self.answer_instruction()) + 50
+        output = self.output_token_limit() or self.ollama_num_predict
+        return int(chars / OLLAMA_CHARS_PER_TOKEN) + output
+
+    def fits_ollama_context(self, text: str) -> bool:
+        """Whether a question's full-list prompt and answer fit within ollama.num_ctx"""
+        return self.ollama_prompt_tokens(text) <= self.ollama_num_ctx
+
+    def full_list_fits(self, text: str) -> bool:
+        """Whether the full list can be sent for a question (only Ollama's context window limits it)"""
+        return self.primary_provider != "ollama" or self.fits_ollama_context(text)
+
+    def ollama_shortlist_size(self, text: str) -> int:
+        """
+        Number of triplets a shortlist for a question can hold within ollama.num_ctx
+
+        Args:
+            text: Question (and explanation) text
+
+        Returns:
+            Shortlist size (at least 1, fewer than the full list)
+        """
+        fixed_chars = len(self.instruction_block) + len(text) + len(self.answer_instruction()) + 300
+        output = self.output_token_limit() or self.ollama_num_predict
+        budget_chars = (self.ollama_num_ctx - output) * OLLAMA_CHARS_PER_TOKEN - fixed_chars
+        chars_per_triplet = len(self.full_triplet_list) / max(1, len(self.triplets))
+        return max(1, min(len(self.triplets) - 1, int(budget_chars / chars_per_triplet)))
+
+    def openai_full_list_is_cheaper(self) -> bool:
+        """
+        Whether OpenAI bills the cached full-list prefix below a shortlisted one
+
+        OpenAI only caches prompt prefixes of OPENAI_CACHE_MIN_TOKENS or more.
+        The full-list section (after its first request) is billed at the
+        cached-input rate, while a top_k shortlist shares only the instruction
+        block with other prompts and is billed at the full rate.
+
+        Returns:
+            True if the full list is cheaper per question
+        """
+        client = self.openai_client
+        pricing = client.cost_tracker.pricing.get(client.model) or client.cost_tracker.pricing['gpt-4o-mini']
+        top_k = self.retrieval_config.get("top_k", 40)
+        shortlist = self.render_triplet_section(
+            "\n".join(f"{i+1}. {t}" for i, t in enumerate(self.triplets[:top_k])),
+            "the candidate triplets selected for this question"
+        )
+
+        def cost(prompt: str, shared: str) -> Tuple[int, float]:
+            # Only the part shared with other prompts can come from the cache, and only if long enough
+            tokens = client.estimate_tokens(prompt, self.exam_type)
+            shared_tokens = min(tokens, client.estimate_tokens(shared, self.exam_type))
+            if shared_tokens < OPENAI_CACHE_MIN_TOKENS:
+                shared_tokens = 0
+            return tokens, ((tokens - shared_tokens) * pricing['input'] +
+                            shared_tokens * pricing.get('cached_input', pricing['input']))
+
+        full_tokens, full_cost = cost(self.full_list_section, self.full_list_section)
+        short_tokens, short_cost = cost(shortlist, self.instruction_block)
+        cheaper = full_cost < short_cost
+        # Prices are per million tokens, so cost / 1000 is the input cost of 1,000 questions
+        self.logger.info(f"{self.exam_type}: {'full list' if cheaper else 'shortlists'} for OpenAI "
+                         f"(input per 1,000 questions: full list ~{full_tokens:,} tokens ${full_cost / 1000:.3f} "
+                         f"with caching, shortlist ~{short_tokens:,} tokens ${short_cost / 1000:.3f})")
+        return cheaper
+
+    def split_static_prefix(self, prompt: str) -> Tuple[Optional[str], str]:
+        """
+        Split a prompt into its static prefix and the per-question rest
+
+        The full-list section is identical for every question of the exam; a
+        shortlisted prompt still shares the instruction block.
+
+        Args:
+            prompt: Classification prompt
+
+        Returns:
+            Tuple of (static prefix or None, remaining prompt)
+        """
+        for prefix in (self.full_list_section, self.instruction_block):
+            if prompt.startswith(prefix):
+                return prefix, prompt[len(prefix):]
+        return None, prompt
+
+    def classify_with_rules(self, question: str) -> Optional[Dict]:
+        """
+        Classify a question with the rule-based classifier, without any AI call
+
+        Args:
+            question: Question text
+
+        Returns:
+            Dictionary with subject, topic, subtopic or None if no rule matched
+        """
+        if not (self.rule_classifier and
+                self.rule_based_config.get("enabled", True) and
+                self.rule_based_config.get("priority") == "before_ai"):
+            return None
+
+        rule_result = self.rule_classifier.classify_question(question, self.exam_type)
+        if not rule_result.matched:
+            return None
+
+        # Rule matched - use rule-based classification
+        self._count('rule_based_matches')
+
+        # Calculate cost savings (approximate cost per question)
+        cost_savings = 0.000054  # Approximate cost per question with GPT-4o mini
+        self._count('cost_savings_usd', cost_savings)
+
+        classification = {
+            'subject': rule_result.rule.chapter,
+            'topic': rule_result.rule.topic,
+            'subtopic': rule_result.rule.subtopic,
+            'confidence': rule_result.confidence
+        }
+
+        if self.rule_based_config.get("log_matches", True):
+            self.logger.info(f"Rule-based classification: {classification['subject']} > "
+                           f"{classification['topic']} > {classification['subtopic']} "
+                           f"(rule: {rule_result.rule.description})")
+
+        return classification
+
+    def classify_from_cache(self, question: str, explanation: str = "") -> Optional[Dict]:
+        """
+        Look up a previously validated classification for this question
+
+        Args:
+            question: Question text
+            explanation: Optional explanation text
+
+        Returns:
+            Dictionary with subject, topic, subtopic or None on a cache miss
+        """
+        if not self.cache:
+            return None
+
+        key = self.cache.make_key(self.exam_type, self.taxonomy_version, question, explanation)
+        try:
+            classification = self.cache.get(key)
+        except Exception as e:
+            self.logger.warning(f"Classification cache lookup failed: {e}")
+            return None
+
+        if not classification:
+            return None
+
+        self._count('cache_hits')
+        self._count('cost_savings_usd', 0.000054)  # Approximate cost per question with GPT-4o mini
+        self.logger.debug(f"Cache hit: {classification['subject']} > {classification['topic']} > "
+                          f"{classification['subtopic']}")
+        return classification
+
+    def store_in_cache(self, question: str, explanation: str, classification: Dict):
+        """
+        Remember a validated AI classification for repeated questions
+
+        Args:
+            question: Question text
+            explanation: Optional explanation text
+            classification: Validated classification dictionary
+        """
+        if not self.cache:
+            return
+
+        key = self.cache.make_key(self.exam_type, self.taxonomy_version, question, explanation)
+        try:
+            self.cache.put(key, self.exam_type, classification)
+        except Exception as e:
+            self.logger.warning(f"Failed to store classification in cache: {e}")
+
+    def build_prompt(self, question: str, explanation: str = "") -> str:
+        """
+        Build the classification prompt for a question, shortlisting candidates when possible
+
+        Args:
+            question: Question text
+            explanation: Optional explanation text
+
+        Returns:
+            Formatted prompt string
+        """
+        return self.build_request(question, explanation)[0]
+
+    def build_request(self, question: str, explanation: str = "") -> Tuple[str, Optional[Dict]]:
+        """
+        Build the prompt and response schema for a question
+
+        Args:
+            question: Question text
+            explanation: Optional explanation text
+
+        Returns:
+            Tuple of (prompt, JSON schema or None)
+        """
+        candidates = self.select_candidates(question, explanation, allow_ai=False)
+        return (self.create_classification_prompt(question, explanation, candidates),
+                self.create_response_schema(candidates))
+
+    def classify_from_response(self, response_text: str) -> Optional[Dict]:
+        """
+        Turn an already received AI response into a validated classification
+
+        Used when responses arrive outside classify_question (e.g. Batch API results).
+
+        Args:
+            response_text: Raw response from AI
+
+        Returns:
+            Dictionary with subject, topic, subtopic or None if invalid
+        """
+        result = self.parse_classification_response(response_text)
+        if not result:
+            return None
+
+        if not (self.validate_classification(result) or self.repair_classification(result)):
+            self._count('validation_failures')
+            return None
+
+        self._count('total_classifications')
+        self._count('successful_classifications')
+
+        return {
+            'subject': result['subject'],
+            'topic': result['topic'],
+            'subtopic': result['subtopic'],
+            'confidence': result.get('confidence', 0.0)
+        }
+
     def classify_question(self, question: str, explanation: str = "") -> Optional[Dict]:
         """
         Classify a question using single-stage approach
@@ -513,57 +1462,87 @@ Question about "Justice Party in Tamil Nadu during Home Rule Movement"
             Dictionary with chapter, topic, subtopic or None if failed
         """
         start_time = time.time()
-        self.stats['total_classifications'] += 1
+        self._count('total_classifications')
 
         try:
-            # Try rule-based classification first
-            if (self.rule_classifier and 
-                self.rule_based_config.get("enabled", True) and 
-                self.rule_based_config.get("priority") == "before_ai"):
-                
-                rule_result = self.rule_classifier.classify_question(question, self.exam_type)
-                
-                if rule_result.matched:
-                    # Rule matched - use rule-based classification
-                    self.stats['rule_based_matches'] += 1
-                    
-                    # Calculate cost savings (approximate cost per question)
-                    cost_savings = 0.000054  # Approximate cost per question with GPT-4o mini
-                    self.stats['cost_savings_usd'] += cost_savings
-                    
-                    classification = {
-                        'subject': rule_result.rule.chapter,
-                        'topic': rule_result.rule.topic,
-                        'subtopic': rule_result.rule.subtopic,
-                        'confidence': rule_result.confidence
-                    }
-                    
-                    # Update statistics
-                    self.stats['successful_classifications'] += 1
-                    elapsed = time.time() - start_time
-                    
-                    # Update average response time
-                    total = self.stats['total_classifications']
-                    current_avg = self.stats['average_response_time']
-                    self.stats['average_response_time'] = ((current_avg * (total - 1)) + elapsed) / total
-                    
-                    if self.rule_based_config.get("log_matches", True):
-                        self.logger.info(f"Rule-based classification: {classification['subject']} > "
-                                       f"{classification['topic']} > {classification['subtopic']} "
-                                       f"(rule: {rule_result.rule.description})")
-                    
-                    return classification
-            
-            # No rule matched or rule-based disabled - proceed with AI classification with retry
-            validation_config = self.config.get("validation", {})
-            max_retries = validation_config.get("max_validation_retries", 3)
-            for attempt in range(max_retries):
-                # Create prompt
-                prompt = self.create_classification_prompt(question, explanation)
-                
-                if attempt > 0:
-                    self.logger.info(f"Retry attempt {attempt + 1}/{max_retries} for validation failure")
-                    # Add stricter instructions for retries
+            # Try rule-based classification first, then previously classified questions
+            classification = self.classify_with_rules(question) or self.classify_from_cache(question, explanation)
+            if classification:
+                self.record_success(start_time)
+                return classification
+
+            # No rule matched or rule-based disabled - proceed with AI classification
+            return self.classify_with_ai(question, explanation, start_time)
+
+        except Exception as e:
+            self.logger.error(f"Classification error: {e}")
+            self._count('failed_classifications')
+            return None
+
+    def _count(self, key: str, amount=1):
+        """Add to one of the statistics counters (thread-safe)"""
+        with self._lock:
+            self.stats[key] += amount
+
+    def record_success(self, start_time: float):
+        """Count a successful classification and update the average response time"""
+        elapsed = time.time() - start_time
+
+        with self._lock:
+            self.stats['successful_classifications'] += 1
+
+            # Update average response time
+            total = self.stats['total_classifications']
+            current_avg = self.stats['average_response_time']
+            self.stats['average_response_time'] = ((current_avg * (total - 1)) + elapsed) / total
+
+    def classify_with_ai(self, question: str, explanation: str, start_time: float) -> Optional[Dict]:
+        """
+        Classify one question with the AI providers, retrying on validation failures
+
+        Args:
+            question: Question text
+            explanation: Optional explanation text
+            start_time: When classification of this question started
+
+        Returns:
+            Dictionary with subject, topic, subtopic or None if failed
+        """
+        validation_config = self.config.get("validation", {})
+        max_retries = validation_config.get("max_validation_retries", 3)
+
+        # Build the prompt once; retries only append the retry notice
+        candidates = self.select_candidates(question, explanation)
+        base_prompt = self.create_classification_prompt(question, explanation, candidates)
+        schema = self.create_response_schema(candidates)
+        max_tokens = self.output_token_limit()
+
+        for attempt in range(max_retries):
+            prompt = base_prompt
+
+            if attempt > 0:
+                self.logger.info(f"Retry attempt {attempt + 1}/{max_retries} for validation failure")
+
+                # Widen a shortlisted prompt to the full taxonomy on the last retry
+                if (candidates and attempt == max_retries - 1 and
+                        self.retrieval_config.get("full_list_on_last_retry", True) and
+                        self.full_list_fits(f"{question} {explanation}")):
+                    self.logger.info("Last retry - sending the full triplet list")
+                    prompt = self.create_classification_prompt(question, explanation)
+                    schema = self.create_response_schema()
+
+                # Add stricter instructions for retries
+                if self.compact_answers:
+                    prompt += f"""
+
+🚨 RETRY ATTEMPT {attempt + 1} - PREVIOUS ANSWER REJECTED 🚨
+
+Your previous answer could not be used. Answer with ONLY a JSON object holding the
+line number of a triplet from the numbered list above and your confidence:
+{{"line_number": 523, "confidence": 0.9}}
+
+"""
+                else:
                     prompt += f"""
 
 🚨 RETRY ATTEMPT {attempt + 1} - VALIDATION FAILED BEFORE 🚨
@@ -582,81 +1561,193 @@ DOUBLE-CHECK YOUR WORK:
 
 """
 
-                # Try primary provider
-                self.logger.debug(f"Attempting classification with {self.primary_provider} (attempt {attempt + 1})")
-                response_text = self.classify_with_provider(prompt, self.primary_provider)
+            # Try primary provider
+            self.logger.debug(f"Attempting classification with {self.primary_provider} (attempt {attempt + 1})")
+            response_text = self.classify_with_provider(prompt, self.primary_provider, max_tokens,
+                                                        json_schema=schema)
+
+            # If primary fails and auto-fallback enabled, try fallback
+            if not response_text and self.auto_fallback:
+                self.logger.info(f"Primary provider failed, falling back to {self.fallback_provider}")
+                self._count('provider_fallbacks')
+                response_text = self.classify_with_provider(prompt, self.fallback_provider, max_tokens,
+                                                            json_schema=schema)
+
+            if not response_text:
+                self.logger.error(f"All providers failed on attempt {attempt + 1}")
+                continue
+
+            # Parse response
+            result = self.parse_classification_response(response_text)
+            if not result:
+                self.logger.error(f"Failed to parse response on attempt {attempt + 1}")
+                continue
+
+            # Validate classification, repairing near misses locally before re-prompting
+            if self.validate_classification(result) or self.repair_classification(result):
+                self.logger.info(f"Validation successful on attempt {attempt + 1}")
+                break
+            else:
+                self.logger.warning(f"Classification validation failed on attempt {attempt + 1}")
+                self._count('validation_failures')
+                if attempt == max_retries - 1:
+                    self.logger.error(f"All {max_retries} attempts failed validation")
+                    self._count('failed_classifications')
+                    return None
+        else:
+            # All retries exhausted without success
+            self._count('failed_classifications')
+            return None
+
+        # Map AI result to output format
+        classification = {
+            'subject': result['subject'],
+            'topic': result['topic'],
+            'subtopic': result['subtopic'],
+            'confidence': result.get('confidence', 0.0)
+        }
 
-                # If primary fails and auto-fallback enabled, try fallback
-                if not response_text and self.auto_fallback:
-                    self.logger.info(f"Primary provider failed, falling back to {self.fallback_provider}")
-                    self.stats['provider_fallbacks'] += 1
-                    response_text = self.classify_with_provider(prompt, self.fallback_provider)
+        self.store_in_cache(question, explanation, classification)
+        self.record_success(start_time)
 
-                if not response_text:
-                    self.logger.error(f"All providers failed on attempt {attempt + 1}")
-                    continue
+        self.logger.info(f"Classified: {classification['subject']} > {classification['topic']} > "
+                       f"{classification['subtopic']} (confidence: {classification['confidence']:.2f})")
 
-                # Parse response
-                result = self.parse_classification_response(response_text)
-                if not result:
-                    self.logger.error(f"Failed to parse response on attempt {attempt + 1}")
-                    continue
+        return classification
 
-                # Validate classification
-                if self.validate_classification(result):
-                    self.logger.info(f"Validation successful on attempt {attempt + 1}")
-                    break
-                else:
-                    self.logger.warning(f"Classification validation failed on attempt {attempt + 1}")
-                    self.stats['validation_failures'] += 1
-                    if attempt == max_retries - 1:
-                        self.logger.error(f"All {max_retries} attempts failed validation")
-                        self.stats['failed_classifications'] += 1
-                        return None
+    def classify_questions(self, items: List[Tuple[str, str]]) -> List[Optional[Dict]]:
+        """
+        Classify several questions, sending up to batch_size of them per AI request
+
+        Rule matches and cache hits are resolved first. The remaining questions
+        share one prompt (and one copy of the triplet list) per batch; every
+        returned item is validated and any question that is missing, invalid or
+        unparseable is re-queued through the single-question path.
+
+        Args:
+            items: (question, explanation) tuples
+
+        Returns:
+            Classification (or None) for each item, in input order
+        """
+        batch_size = max(1, self.config.get("processing", {}).get("batch_size", 1))
+        results: List[Optional[Dict]] = [None] * len(items)
+        start_times = [time.time()] * len(items)
+        pending = []
+
+        for index, (question, explanation) in enumerate(items):
+            self._count('total_classifications')
+            try:
+                classification = self.classify_with_rules(question) or self.classify_from_cache(question, explanation)
+            except Exception as e:
+                self.logger.error(f"Classification error: {e}")
+                classification = None
+            if classification:
+                self.record_success(start_times[index])
+                results[index] = classification
             else:
-                # All retries exhausted without success
-                self.stats['failed_classifications'] += 1
-                return None
+                pending.append(index)
+
+        for offset in range(0, len(pending), batch_size):
+            chunk = pending[offset:offset + batch_size]
+            batched = self.classify_batch_with_ai([items[i] for i in chunk]) if len(chunk) > 1 else {}
+
+            for position, index in enumerate(chunk):
+                question, explanation = items[index]
+                classification = batched.get(position)
+                if classification:
+                    self.store_in_cache(question, explanation, classification)
+                    self.record_success(start_times[index])
+                    results[index] = classification
+                    continue
+
+                # Not classified by the batch - fall back to a request of its own
+                if len(chunk) > 1:
+                    self._count('batch_requeued')
+                try:
+                    results[index] = self.classify_with_ai(question, explanation, start_times[index])
+                except Exception as e:
+                    self.logger.error(f"Classification error: {e}")
+                    self._count('failed_classifications')
+
+        return results
+
+    def classify_batch_with_ai(self, items: List[Tuple[str, str]]) -> Dict[int, Dict]:
+        """
+        Classify several questions in one AI request
 
-            # Map AI result to output format
-            classification = {
+        Args:
+            items: (question, explanation) tuples
+
+        Returns:
+            Dictionary of item position -> validated classification (failed items are left out)
+        """
+        question_ids = [f"q{position + 1}" for position in range(len(items))]
+
+        # Shortlist from the union of every question's candidates, unless any needs the full list.
+        # Subjects are detected locally here; one AI subject prompt per question would undo the batching.
+        candidates = None
+        if self.retriever or self.hierarchical:
+            shortlists = [self.select_candidates(question, explanation, allow_ai=False)
+                          for question, explanation in items]
+            if all(shortlists):
+                candidates = sorted(set().union(*shortlists))
+
+        prompt = self.create_batch_classification_prompt(
+            [(question_id, question, explanation) for question_id, (question, explanation) in zip(question_ids, items)],
+            candidates
+        )
+        schema = self.create_response_schema(candidates, question_ids)
+        max_tokens = self.output_token_limit(len(items))
+
+        self._count('batch_requests')
+        self._count('batched_questions', len(items))
+        response_text = self.classify_with_provider(prompt, self.primary_provider, max_tokens, len(items), schema)
+        if not response_text and self.auto_fallback:
+            self.logger.info(f"Primary provider failed, falling back to {self.fallback_provider}")
+            self._count('provider_fallbacks')
+            response_text = self.classify_with_provider(prompt, self.fallback_provider, max_tokens, len(items),
+                                                        schema)
+        if not response_text:
+            self.logger.error(f"All providers failed for a batch of {len(items)} questions")
+            return {}
+
+        parsed = self.parse_batch_classification_response(response_text)
+        classifications = {}
+        for position, question_id in enumerate(question_ids):
+            result = parsed.get(question_id)
+            if not result:
+                self.logger.warning(f"Batched response has no usable answer for {question_id}")
+                continue
+            if not (self.validate_classification(result) or self.repair_classification(result)):
+                self._count('validation_failures')
+                continue
+            classifications[position] = {
                 'subject': result['subject'],
                 'topic': result['topic'],
                 'subtopic': result['subtopic'],
                 'confidence': result.get('confidence', 0.0)
             }
 
-            # Update statistics
-            self.stats['successful_classifications'] += 1
-            elapsed = time.time() - start_time
-
-            # Update average response time
-            total = self.stats['total_classifications']
-            current_avg = self.stats['average_response_time']
-            self.stats['average_response_time'] = ((current_avg * (total - 1)) + elapsed) / total
-
-            self.logger.info(f"Classified: {classification['subject']} > {classification['topic']} > "
-                           f"{classification['subtopic']} (confidence: {classification['confidence']:.2f})")
-
-            return classification
-
-        except Exception as e:
-            self.logger.error(f"Classification error: {e}")
-            self.stats['failed_classifications'] += 1
-            return None
+        self.logger.info(f"Batch classified {len(classifications)}/{len(items)} questions in one request")
+        return classifications
 
     def get_statistics(self) -> Dict:
         """Get classification statistics"""
+        with self._lock:
+            stats = dict(self.stats)
+
         success_rate = 0
-        if self.stats['total_classifications'] > 0:
-            success_rate = (self.stats['successful_classifications'] /
-                          self.stats['total_classifications']) * 100
+        if stats['total_classifications'] > 0:
+            success_rate = (stats['successful_classifications'] /
+                          stats['total_classifications']) * 100
 
         return {
-            **self.stats,
+            **stats,
             'success_rate': round(success_rate, 2),
             'exam_type': self.exam_type,
-            'taxonomy_size': len(self.triplets)
+            'taxonomy_size': len(self.triplets),
+            'cache': self.cache.get_stats() if self.cache else None
         }
 
 
@@ -14,6 +14,8 @@ from datetime import datetime
 from typing import List, Dict, Optional, Tuple
 import numpy as np
 
+from progress_journal import ProgressJournal
+
 
 class MultiTabExcelProcessor:
     """
@@ -21,15 +23,21 @@ class MultiTabExcelProcessor:
 
     Handles reading Excel with multiple exam-specific tabs, tracking progress per tab,
     and saving classifications back to the same structure.
+
+    Each classification is appended to a progress journal as it is made; the
+    output workbook is only written by save_progress().
     """
 
-    def __init__(self, input_file_path: str, output_file_path: str = None):
+    def __init__(self, input_file_path: str, output_file_path: str = None,
+                 journal_file_path: str = None, journal_sync_interval: int = 10):
         """
         Initialize multi-tab Excel processor
 
         Args:
             input_file_path: Path to the input Excel file with multiple tabs
             output_file_path: Path to the output Excel file (optional)
+            journal_file_path: Progress journal path (default: temp/<output name>_journal.jsonl)
+            journal_sync_interval: fsync the journal every N classifications
         """
         self.input_file_path = input_file_path
         self.output_file_path = output_file_path or input_file_path.replace('SeparatedQuestions', 'ClassifiedQuestions')
@@ -43,6 +51,11 @@ class MultiTabExcelProcessor:
         self.backup_file_path = 'temp/SeparatedQuestions_backup.xlsx'
         self.progress_file_path = 'temp/classification_progress.json'
 
+        # Write-ahead journal of classifications, replayed when the file is loaded
+        output_stem = os.path.splitext(os.path.basename(self.output_file_path))[0]
+        self.journal_file_path = journal_file_path or os.path.join('temp', f'{output_stem}_journal.jsonl')
+        self.journal = ProgressJournal(self.journal_file_path, journal_sync_interval)
+
         # Setup logging
         self.logger = logging.getLogger(__name__)
 
@@ -102,6 +115,9 @@ class MultiTabExcelProcessor:
                 if not self.validate_tab_structure(tab_name, df):
                     return False
 
+            # Restore classifications made by earlier, interrupted runs
+            self.replay_journal()
+
             # Analyze processing state for all tabs
             self.analyze_all_tabs()
 
@@ -111,6 +127,36 @@ class MultiTabExcelProcessor:
             self.logger.error(f"Failed to load Excel file: {e}")
             return False
 
+    def replay_journal(self) -> int:
+        """
+        Open the progress journal and apply its classifications to the loaded tabs
+
+        Returns:
+            Number of rows restored from the journal
+        """
+        records = self.journal.open(ProgressJournal.fingerprint(self.input_file_path))
+
+        restored = 0
+        skipped = 0
+        for record in records:
+            df = self.tabs.get(record.get('tab'))
+            row_index = record.get('index')
+            if df is None or row_index not in df.index or str(df.at[row_index, 'Row No']) != record.get('row_no'):
+                skipped += 1
+                continue
+
+            df.at[row_index, 'Subject'] = record['subject']
+            df.at[row_index, 'Topic'] = record['topic']
+            df.at[row_index, 'Subtopic'] = record['subtopic']
+            restored += 1
+
+        if records:
+            self.logger.info(f"Replayed {restored} classifications from {self.journal_file_path}")
+        if skipped:
+            self.logger.warning(f"Skipped {skipped} journal records that no longer match a row")
+
+        return restored
+
     def validate_tab_structure(self, tab_name: str, df: pd.DataFrame) -> bool:
         """
         Validate that a tab has expected structure
@@ -278,6 +324,10 @@ class MultiTabExcelProcessor:
             df.at[row_index, 'Topic'] = str(topic)
             df.at[row_index, 'Subtopic'] = str(subtopic)
 
+            # Make the result durable before counting it
+            self.journal.append(tab_name, row_index, df.at[row_index, 'Row No'],
+                                str(chapter), str(topic), str(subtopic))
+
             # Update statistics
             self.stats_by_tab[tab_name]['processed_questions'] += 1
             self.stats_by_tab[tab_name]['successful_classifications'] += 1
@@ -293,16 +343,28 @@ class MultiTabExcelProcessor:
             self.overall_stats['failed_classifications'] += 1
             return False
 
+    def sync_journal(self):
+        """Force journaled classifications to disk (cheap, unlike save_progress)"""
+        try:
+            self.journal.sync()
+        except Exception as e:
+            self.logger.error(f"Failed to sync progress journal: {e}")
+
     def save_progress(self, backup: bool = False) -> bool:
         """
         Save current progress to Excel file
 
+        Rewrites every tab, so this is meant for the end of a run or an explicit
+        export; progress during a run is kept by the journal.
+
         Args:
             backup: If True, save to a timestamped backup file
 
         Returns:
             True if saved successfully, False otherwise
         """
+        self.sync_journal()
+
         try:
             if backup:
                 # Save to timestamped backup in temp folder
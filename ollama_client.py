@@ -1,19 +1,130 @@
 #!/usr/bin/env python3
 """
 Ollama Client - Handle interactions with Ollama API for question classification
+
+Requests go through one pooled keep-alive session, and the installed model
+list (/api/tags) is cached for models_ttl seconds, so a classification costs
+a single round-trip on an already open connection. With several hosts
+configured, requests are balanced across them by OllamaHostPool (least
+outstanding requests, per-host circuit breakers).
+
+Every request renews the model's keep_alive, and a model is loaded by a
+warm-up request before its first classification (fallback models in the
+background as soon as the circuit breaker opens), so load time never counts
+against a question's adaptive timeout.
+
+Responses are streamed, and unless a schema already ends the output at its
+JSON, the connection is closed as soon as the first complete JSON object has
+arrived, so trailing text is never generated; the num_predict option caps
+generation length. Closing is the only way to stop Ollama mid-generation, but
+it also drops that pooled connection, so a stream is only cut when num_predict
+still allows more than early_stop_min_tokens of trailing text; shorter tails
+are read to the end and the connection is reused.
+
+A caller can pass the static start of its prompts (the exam's instructions
+and triplet list) as system text. It is then sent as the system message of an
+/api/chat request, evaluated once per host by a warm-up request, and reused
+from Ollama's KV cache by every later question, so only the question suffix
+is evaluated per request. Prompt-eval tokens and time (and time to first
+token when streaming) are recorded per request to show the reuse.
 """
 
+import asyncio
 import json
 import requests
+import threading
 import time
 import logging
 from typing import List, Dict, Optional, Tuple
 import random
+from requests.adapters import HTTPAdapter
 from config import get_config
+from ollama_host_pool import OllamaHostPool
 
-class OllamaClient:
+class JsonValueScanner:
+    """
+    Incremental scanner that spots the end of the first complete JSON object in streamed text
+
+    Tracks object/array nesting outside of string literals, so a streamed
+    answer can be cut off as soon as its JSON is complete. Like
+    _parse_json_response, it only starts at a "{" (so prose such as
+    "Line [12] is best" is skipped), and a braced span that does not parse
+    as JSON is passed over in favour of the next one.
+    """
+    
     def __init__(self):
-        self.config = get_config()
+        self.parts: List[str] = []
+        self.length = 0
+        self.start: Optional[int] = None
+        self.end: Optional[int] = None
+        self.value: Optional[str] = None
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+    
+    @property
+    def text(self) -> str:
+        """All text received so far"""
+        return "".join(self.parts)
+    
+    def feed(self, chunk: str) -> Optional[str]:
+        """
+        Add streamed text
+        
+        Args:
+            chunk: Next piece of the response
+        
+        Returns:
+            The first complete JSON object once it has been received, else None
+        """
+        offset = self.length
+        self.parts.append(chunk)
+        self.length += len(chunk)
+        if self.end is not None:
+            return self.value
+        
+        for position, char in enumerate(chunk, offset):
+            if self.start is None:
+                if char == "{":
+                    self.start = position
+                    self.depth = 1
+                continue
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    candidate = self.text[self.start:position + 1]
+                    try:
+                        json.loads(candidate)
+                    except ValueError:
+                        # Not JSON (e.g. "{line number}" in prose) - look for the next object
+                        self.start = None
+                        continue
+                    self.end = position + 1
+                    self.value = candidate
+                    break
+        
+        return self.value
+
+class OllamaClient:
+    def __init__(self, config: Optional[Dict] = None):
+        """
+        Initialize the Ollama client
+
+        Args:
+            config: Full configuration dictionary (default: get_config())
+        """
+        self.config = config or get_config()
         self.ollama_config = self.config["ollama"]
         self.fallback_models = self.config["fallback_models"]
         self.current_model = self.ollama_config["model"]
@@ -35,9 +146,55 @@ class OllamaClient:
             "model_switches": 0,
             "consecutive_failures": 0,
             "timeout_failures": 0,
-            "circuit_breaker_trips": 0
+            "circuit_breaker_trips": 0,
+            "model_list_fetches": 0,
+            "model_loads": 0,
+            "model_load_time": 0.0,
+            "early_stops": 0,
+            "prefix_warmups": 0,
+            "prefix_eval_tokens": 0,
+            "prefix_eval_time": 0.0,
+            "prompt_evals": 0,
+            "prompt_eval_tokens": 0,
+            "prompt_eval_time": 0.0,
+            "prefix_cache_misses": 0,
+            "first_tokens": 0,
+            "first_token_time": 0.0,
+            "prompt_evals_unreported": 0
         }
         
+        # Ollama hosts: requests go to the least busy healthy host
+        hosts = self.ollama_config.get("hosts") or [self.ollama_config["host"]]
+        self.host_pool = OllamaHostPool(
+            hosts,
+            failure_threshold=self.ollama_config.get("host_failure_threshold", 3),
+            recovery_time=self.ollama_config.get("host_recovery_time", 30),
+            max_recovery_time=self.ollama_config.get("host_max_recovery_time", 300)
+        )
+        
+        # Pooled keep-alive session: one connection per concurrent request, reused across requests
+        pool_size = self.ollama_config.get("pool_maxsize", 32)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.host_pool.hosts), pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        
+        # Installed models per host from /api/tags, refreshed once older than models_ttl
+        self._available_models: Dict[str, List[str]] = {}
+        self._models_fetched_at: Dict[str, float] = {}
+        self._models_lock = threading.Lock()
+        
+        # Model residency per (host, model): last use (keep_alive restarts at each request) and loads in progress
+        self._last_used: Dict[Tuple[str, str], float] = {}
+        self._loading: Dict[Tuple[str, str], threading.Event] = {}
+        self._residency_lock = threading.Lock()
+        
+        # Warmed system prefixes per (host, model, prefix hash): prompt tokens of the prefix, and warm-ups in progress
+        self._prefix_tokens: Dict[Tuple[str, str, int], int] = {}
+        self._prefix_warming: Dict[Tuple[str, str, int], threading.Event] = {}
+        self._prefix_lock = threading.Lock()
+        self._tokens_per_char = 0.25  # Calibrated from warm-ups that evaluated a whole prefix
+        
         # Circuit breaker state (optimized for faster model)
         self.circuit_breaker = {
             "is_open": False,
@@ -46,36 +203,327 @@ class OllamaClient:
             "last_failure_time": 0
         }
     
-    def check_ollama_status(self) -> bool:
-        """Check if Ollama server is running and accessible"""
+    def get_available_models(self, refresh: bool = False, host: Optional[str] = None) -> Optional[List[str]]:
+        """
+        Get the installed model names of a host, cached for models_ttl seconds
+        
+        Args:
+            refresh: Fetch /api/tags even if the cached list is still fresh
+            host: Host URL (default: the first host)
+        
+        Returns:
+            List of model names, or None if the host could not be reached
+        """
+        host = host or self.host_pool.urls[0]
+        with self._models_lock:
+            ttl = self.ollama_config.get("models_ttl", 300)
+            if (not refresh and host in self._available_models and
+                    time.time() - self._models_fetched_at[host] < ttl):
+                return self._available_models[host]
+            
+            try:
+                response = self.session.get(f"{host}/api/tags", timeout=5)
+            except requests.RequestException as e:
+                self.logger.error(f"Cannot connect to Ollama at {host}: {e}")
+                return None
+            
+            if response.status_code != 200:
+                self.logger.error(f"Ollama at {host} returned status code: {response.status_code}")
+                return None
+            
+            self._available_models[host] = [model["name"] for model in response.json().get("models", [])]
+            self._models_fetched_at[host] = time.time()
+            self.stats["model_list_fetches"] += 1
+            return self._available_models[host]
+    
+    def hosts_without(self, model: str) -> List[str]:
+        """URLs of hosts whose (cached) model list lacks a model, to exclude them from routing"""
+        lacking = []
+        for host in self.host_pool.urls:
+            available_models = self.get_available_models(host=host)
+            if available_models is not None and model not in available_models:
+                lacking.append(host)
+        return lacking
+    
+    def keep_alive_seconds(self) -> float:
+        """Configured keep_alive in seconds (negative = kept loaded until Ollama restarts)"""
+        keep_alive = str(self.ollama_config.get("keep_alive", "30m")).strip()
+        units = {"s": 1, "m": 60, "h": 3600}
+        if keep_alive and keep_alive[-1] in units:
+            return float(keep_alive[:-1]) * units[keep_alive[-1]]
+        return float(keep_alive)
+    
+    def is_resident(self, model: str, host: str) -> bool:
+        """Whether the model should still be loaded on a host, judging by its last use and keep_alive"""
+        last_used = self._last_used.get((host, model))
+        if last_used is None:
+            return False
+        keep_alive = self.keep_alive_seconds()
+        return keep_alive < 0 or time.time() - last_used < keep_alive
+    
+    def warm_up(self, model: Optional[str] = None, host: Optional[str] = None) -> bool:
+        """
+        Load a model into memory with an empty generate request
+        
+        Args:
+            model: Model to load (default: the current model)
+            host: Host URL (default: the first host)
+        
+        Returns:
+            True if the model is loaded
+        """
+        model = model or self.current_model
+        host = host or self.host_pool.urls[0]
+        start_time = time.time()
         try:
-            response = requests.get(f"{self.ollama_config['host']}/api/tags", timeout=5)
-            if response.status_code == 200:
-                available_models = [model["name"] for model in response.json().get("models", [])]
-                self.logger.info(f"Ollama is running. Available models: {available_models}")
-                
-                # Check if our preferred model is available
-                if self.current_model not in available_models:
-                    self.logger.warning(f"Preferred model '{self.current_model}' not found.")
-                    # Try to find a fallback model
-                    for model in self.fallback_models:
-                        if model in available_models:
-                            self.logger.info(f"Switching to fallback model: {model}")
-                            self.current_model = model
-                            self.stats["model_switches"] += 1
-                            break
-                    else:
-                        self.logger.error("No suitable models found!")
-                        return False
-                
-                return True
-            else:
-                self.logger.error(f"Ollama returned status code: {response.status_code}")
-                return False
-                
+            response = self.session.post(
+                f"{host}/api/generate",
+                json={"model": model, "keep_alive": self.ollama_config.get("keep_alive", "30m")},
+                timeout=self.ollama_config.get("load_timeout", 120)
+            )
         except requests.RequestException as e:
-            self.logger.error(f"Cannot connect to Ollama: {e}")
+            self.logger.warning(f"Warm-up of {model} on {host} failed: {e}")
+            return False
+        
+        if response.status_code != 200:
+            self.logger.warning(f"Warm-up of {model} on {host} failed with status {response.status_code}")
+            return False
+        
+        load_time = time.time() - start_time
+        self._last_used[(host, model)] = time.time()
+        self.forget_prefixes(model, host)
+        self.stats["model_loads"] += 1
+        self.stats["model_load_time"] += load_time
+        self.logger.info(f"Model {model} loaded on {host} in {load_time:.1f}s")
+        return True
+    
+    def _load_model(self, model: str, host: str, event: threading.Event):
+        """Warm a model up and wake every request waiting for it"""
+        try:
+            self.warm_up(model, host)
+        finally:
+            with self._residency_lock:
+                self._loading.pop((host, model), None)
+            event.set()
+    
+    def ensure_loaded(self, model: str, host: str) -> bool:
+        """
+        Make sure a model is loaded on a host before a request is timed against it
+        
+        Waits for a load already in progress, or loads the model now.
+        
+        Args:
+            model: Model name
+            host: Host URL
+        
+        Returns:
+            True if the model is loaded
+        """
+        if not self.ollama_config.get("warm_up", True) or self.is_resident(model, host):
+            return True
+        
+        with self._residency_lock:
+            event = self._loading.get((host, model))
+            owner = event is None
+            if owner:
+                event = threading.Event()
+                self._loading[(host, model)] = event
+        
+        if owner:
+            self._load_model(model, host, event)
+        else:
+            event.wait(self.ollama_config.get("load_timeout", 120))
+        return self.is_resident(model, host)
+    
+    def preload(self, model: Optional[str] = None):
+        """
+        Load a model on every healthy host that has it, in background threads
+        
+        Args:
+            model: Model to load (default: the current model)
+        """
+        model = model or self.current_model
+        if not self.ollama_config.get("warm_up", True):
+            return
+        
+        for host in self.host_pool.healthy_hosts():
+            if self.is_resident(model, host.url) or model not in self._available_models.get(host.url, [model]):
+                continue
+            with self._residency_lock:
+                if (host.url, model) in self._loading:
+                    continue
+                event = threading.Event()
+                self._loading[(host.url, model)] = event
+            
+            self.logger.info(f"Pre-loading model {model} on {host.url} in the background")
+            threading.Thread(target=self._load_model, args=(model, host.url, event), daemon=True).start()
+    
+    def forget_prefixes(self, model: str, host: str):
+        """Drop the warmed prefixes of a model on a host (its KV cache went with the last unload)"""
+        with self._prefix_lock:
+            for key in [key for key in self._prefix_tokens if key[:2] == (host, model)]:
+                del self._prefix_tokens[key]
+    
+    def warm_prefix(self, system: str, model: Optional[str] = None, host: Optional[str] = None) -> Optional[int]:
+        """
+        Evaluate a system prefix once so later chat requests find it in Ollama's KV cache
+        
+        Args:
+            system: System message shared by the requests
+            model: Model name (default: the current model)
+            host: Host URL (default: the first host)
+        
+        Returns:
+            Prompt tokens Ollama evaluated for the prefix, or None if the warm-up failed
+        """
+        model = model or self.current_model
+        host = host or self.host_pool.urls[0]
+        payload = {
+            "model": model,
+            "messages": [{"role": "system", "content": system}],
+            "stream": False,
+            "keep_alive": self.ollama_config.get("keep_alive", "30m"),
+            "options": {**self._request_options(), "num_predict": 1}
+        }
+        start_time = time.time()
+        try:
+            status_code, result = self._post_generate(host, payload, self.ollama_config.get("load_timeout", 120),
+                                                      endpoint="chat")
+        except (requests.RequestException, ValueError) as e:
+            self.logger.warning(f"Prefix warm-up on {host} failed: {e}")
+            return None
+        if status_code != 200:
+            self.logger.warning(f"Prefix warm-up on {host} failed with status {status_code}")
+            return None
+        
+        tokens = result.get("prompt_eval_count", 0)
+        eval_time = result.get("prompt_eval_duration", 0) / 1e9 or time.time() - start_time
+        self._last_used[(host, model)] = time.time()
+        self.stats["prefix_warmups"] += 1
+        self.stats["prefix_eval_tokens"] += tokens
+        self.stats["prefix_eval_time"] += eval_time
+        # A warm-up that found part of the prefix cached already reports fewer tokens than the prefix holds
+        if tokens * 6 >= len(system):
+            self._tokens_per_char = tokens / len(system)
+        self.logger.info(f"Prompt prefix cached for {model} on {host}: {tokens} tokens evaluated in {eval_time:.1f}s")
+        return tokens
+    
+    def ensure_prefix(self, system: Optional[str], model: str, host: str):
+        """
+        Warm a system prefix on a host before its first request is timed
+        
+        Requests arriving while another thread warms the same prefix wait for
+        it rather than evaluating the prefix again themselves.
+        
+        Args:
+            system: System message (None: nothing to warm)
+            model: Model name
+            host: Host URL
+        """
+        if not system or not self.ollama_config.get("chat_prefix", True) or not self.ollama_config.get("warm_prefix", True):
+            return
+        key = (host, model, hash(system))
+        with self._prefix_lock:
+            if self._prefix_tokens.get(key) is not None:
+                return
+            event = self._prefix_warming.get(key)
+            owner = event is None
+            if owner:
+                event = threading.Event()
+                self._prefix_warming[key] = event
+        
+        if not owner:
+            event.wait(self.ollama_config.get("load_timeout", 120))
+            return
+        
+        tokens = None
+        try:
+            tokens = self.warm_prefix(system, model, host)
+        finally:
+            with self._prefix_lock:
+                self._prefix_warming.pop(key, None)
+                if tokens is not None:
+                    self._prefix_tokens[key] = tokens
+            event.set()
+    
+    def _record_prompt_eval(self, result: Dict, system: Optional[str], model: str, host: str, prompt: str):
+        """
+        Record how much of a request's prompt Ollama had to evaluate
+        
+        With the prefix cached, only about the prompt's own tokens are
+        evaluated; a request that evaluated more than that plus half the
+        prefix (token counts estimated from the calibrated tokens per
+        character) did not get the prefix from the KV cache and counts as a
+        cache miss.
+        Streams stopped early never see Ollama's final chunk, so they only
+        contribute time to first token and are counted as unreported.
+        """
+        if "first_token_time" in result:
+            self.stats["first_tokens"] += 1
+            self.stats["first_token_time"] += result["first_token_time"]
+        if "prompt_eval_count" not in result:
+            self.stats["prompt_evals_unreported"] += 1
+            return
+        
+        tokens = result["prompt_eval_count"]
+        eval_time = result.get("prompt_eval_duration", 0) / 1e9
+        self.stats["prompt_evals"] += 1
+        self.stats["prompt_eval_tokens"] += tokens
+        self.stats["prompt_eval_time"] += eval_time
+        self.logger.debug(f"Prompt eval on {host}: {tokens} tokens in {eval_time * 1000:.0f}ms")
+        
+        if not system or (host, model, hash(system)) not in self._prefix_tokens:
+            return
+        prefix_tokens = len(system) * self._tokens_per_char
+        threshold = len(prompt) * self._tokens_per_char + prefix_tokens / 2
+        if tokens >= threshold:
+            self.stats["prefix_cache_misses"] += 1
+            self.logger.debug(f"Prompt prefix (~{prefix_tokens:.0f} tokens) was re-evaluated on {host} "
+                              f"({tokens} tokens evaluated)")
+    
+    def preload_fallback(self):
+        """Pre-load the first installed fallback model (uses the cached model lists only)"""
+        available_models = set().union(*self._available_models.values())
+        for model in self.fallback_models:
+            if model != self.current_model and model in available_models:
+                self.preload(model)
+                return
+    
+    def close(self):
+        """Close the pooled connections"""
+        self.session.close()
+    
+    def check_ollama_status(self) -> bool:
+        """Check if the Ollama hosts are running and accessible (unreachable hosts are ejected)"""
+        available_models = set()
+        reachable = 0
+        for host in self.host_pool.hosts:
+            host_models = self.get_available_models(refresh=True, host=host.url)
+            if host_models is None:
+                self.host_pool.eject(host)
+                continue
+            reachable += 1
+            available_models.update(host_models)
+            self.logger.info(f"Ollama is running at {host.url}. Available models: {host_models}")
+        
+        if not reachable:
             return False
+        
+        # Check if our preferred model is available
+        if self.current_model not in available_models:
+            self.logger.warning(f"Preferred model '{self.current_model}' not found.")
+            # Try to find a fallback model
+            for model in self.fallback_models:
+                if model in available_models:
+                    self.logger.info(f"Switching to fallback model: {model}")
+                    self.current_model = model
+                    self.stats["model_switches"] += 1
+                    break
+            else:
+                self.logger.error("No suitable models found!")
+                return False
+        
+        return True
     
     def calculate_adaptive_timeout(self, question: str) -> int:
         """Calculate adaptive timeout based on question complexity"""
@@ -143,8 +591,152 @@ class OllamaClient:
                     self.circuit_breaker["is_open"] = True
                     self.circuit_breaker["last_failure_time"] = time.time()
                     self.stats["circuit_breaker_trips"] += 1
+                    # Fallback requests follow while the circuit is open - load their model now
+                    self.preload_fallback()
+    
+    def _request_options(self, max_tokens: Optional[int] = None) -> Dict:
+        """Model options shared by generate and chat requests"""
+        options = {
+            "temperature": self.ollama_config["temperature"],
+            "top_p": self.ollama_config["top_p"]
+        }
+        num_predict = max_tokens or self.ollama_config.get("num_predict")
+        if num_predict:
+            options["num_predict"] = num_predict
+        if self.ollama_config.get("num_ctx"):
+            options["num_ctx"] = self.ollama_config["num_ctx"]
+        return options
+    
+    def _generate_payload(self, prompt: str, json_schema: Optional[Dict] = None,
+                          model: Optional[str] = None, max_tokens: Optional[int] = None) -> Dict:
+        """Build the /api/generate request body (default model: the current model)"""
+        payload = {
+            "model": model or self.current_model,
+            "prompt": prompt,
+            "stream": self.ollama_config.get("stream", True),
+            "keep_alive": self.ollama_config.get("keep_alive", "30m"),
+            "options": self._request_options(max_tokens)
+        }
+        if json_schema:
+            payload["format"] = json_schema
+        return payload
+    
+    def _request_payload(self, prompt: str, system: Optional[str] = None, json_schema: Optional[Dict] = None,
+                         model: Optional[str] = None, max_tokens: Optional[int] = None) -> Tuple[str, Dict]:
+        """
+        Build the request for a prompt, sending its static prefix as a chat system message
+        
+        Args:
+            prompt: Per-request part of the prompt
+            system: Static prefix shared with other requests (None if there is none)
+            json_schema: Optional JSON schema for Ollama's "format"
+            model: Model name (default: the current model)
+            max_tokens: Generation cap sent as num_predict
+        
+        Returns:
+            Tuple of (endpoint name, request body)
+        """
+        if not system or not self.ollama_config.get("chat_prefix", True):
+            return "generate", self._generate_payload((system or "") + prompt, json_schema, model, max_tokens)
+        
+        payload = self._generate_payload(prompt, json_schema, model, max_tokens)
+        del payload["prompt"]
+        payload["messages"] = [
+            {"role": "system", "content": system},
+            {"role": "user", "content": prompt}
+        ]
+        return "chat", payload
     
-    def _attempt_fallback_model(self, prompt: str, question: str = None) -> Optional[str]:
+    @staticmethod
+    def _chunk_text(chunk: Dict) -> str:
+        """Generated text of a generate or chat response (chunk)"""
+        if "message" in chunk:
+            return chunk["message"].get("content", "")
+        return chunk.get("response", "")
+    
+    def _post_generate(self, host: str, payload: Dict, timeout: float,
+                       endpoint: str = "generate") -> Tuple[int, Dict]:
+        """
+        Send a generate or chat request to a host, streaming it when the payload asks for it
+        
+        A streamed response is read chunk by chunk, and the connection is closed
+        as soon as the first complete JSON object has arrived, which makes Ollama
+        stop generating. Closing also takes the connection out of the keep-alive
+        pool, so this only happens when num_predict still allows more than
+        early_stop_min_tokens chunks (one token each) after the answer; a shorter
+        tail is cheaper to read to the end. Schema-constrained output ends with
+        its JSON anyway, so those streams are always read to the final chunk and
+        its prompt-eval figures. The timeout covers the whole generation.
+        
+        Args:
+            host: Host URL
+            payload: Request body from _generate_payload or _request_payload
+            timeout: Seconds allowed for the request
+            endpoint: "generate" or "chat"
+        
+        Returns:
+            Tuple of (status code, response body); the answer is always under
+            "response" (for a stream, its first JSON object when there is one,
+            without any trailing text), and a stream's body is its last chunk plus
+            "first_token_time" (seconds until the first text arrived)
+        """
+        url = f"{host}/api/{endpoint}"
+        if not payload.get("stream"):
+            response = self.session.post(url, json=payload, timeout=timeout)
+            if response.status_code != 200:
+                return response.status_code, {"error": response.text}
+            result = response.json()
+            return 200, {**result, "response": self._chunk_text(result)}
+        
+        start_time = time.time()
+        deadline = start_time + timeout
+        scanner = JsonValueScanner()
+        stop_early = "format" not in payload
+        num_predict = payload.get("options", {}).get("num_predict")
+        min_trailing = self.ollama_config.get("early_stop_min_tokens", 64)
+        tokens = 0
+        chunk = {}
+        timing = {}
+        with self.session.post(url, json=payload, timeout=timeout, stream=True) as response:
+            if response.status_code != 200:
+                return response.status_code, {"error": response.text}
+            
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    return 500, chunk
+                
+                text = self._chunk_text(chunk)
+                if text:
+                    tokens += 1
+                    if not timing:
+                        timing["first_token_time"] = time.time() - start_time
+                answer = scanner.feed(text)
+                if chunk.get("done"):
+                    # Keep iterating to the end of the body so the connection can be reused
+                    continue
+                if answer is not None and stop_early:
+                    if num_predict and num_predict - tokens <= min_trailing:
+                        # The tail is short - finish reading so the connection goes back to the pool
+                        stop_early = False
+                    else:
+                        # Leaving the block closes the connection before generation finishes
+                        self.stats["early_stops"] += 1
+                        return 200, {**chunk, **timing, "response": answer, "done": True,
+                                     "done_reason": "json_complete"}
+                if time.time() > deadline:
+                    raise requests.exceptions.Timeout(f"Generation still running after {timeout}s")
+        
+        # A drained tail is not part of the answer
+        answer = scanner.value if scanner.value is not None else scanner.text
+        return 200, {**chunk, **timing, "response": answer}
+    
+    def _attempt_fallback_model(self, prompt: str, question: str = None,
+                                json_schema: Optional[Dict] = None,
+                                max_tokens: Optional[int] = None,
+                                system: Optional[str] = None) -> Optional[str]:
         """Attempt to use a fallback model when primary model fails"""
         if not self.fallback_models:
             self.logger.warning("No fallback models configured")
@@ -153,69 +745,93 @@ class OllamaClient:
         original_model = self.current_model
         
         for fallback_model in self.fallback_models:
+            host = None
+            host_ok = False
+            latency = None
             try:
                 self.logger.info(f"Attempting fallback to model: {fallback_model}")
                 
-                # Check if model is available
-                response = requests.get(f"{self.ollama_config['host']}/api/tags", timeout=5)
-                if response.status_code == 200:
-                    available_models = [model["name"] for model in response.json().get("models", [])]
+                # Route to a healthy host that has the model (cached model lists, no extra round-trip)
+                host = self.host_pool.acquire(exclude=self.hosts_without(fallback_model))
+                if host:
+                    # Temporarily switch to fallback model
+                    self.current_model = fallback_model
+                    self.stats["model_switches"] += 1
                     
-                    if fallback_model in available_models:
-                        # Temporarily switch to fallback model
-                        self.current_model = fallback_model
-                        self.stats["model_switches"] += 1
-                        
-                        # Use shorter timeout for fallback models (they're usually faster)
-                        fallback_timeout = min(45, self.ollama_config["timeout"] // 2)
-                        
-                        payload = {
-                            "model": self.current_model,
-                            "prompt": prompt,
-                            "stream": False,
-                            "options": {
-                                "temperature": self.ollama_config["temperature"],
-                                "top_p": self.ollama_config["top_p"]
-                            }
-                        }
-                        
-                        self.logger.debug(f"Trying fallback model {fallback_model} with timeout {fallback_timeout}s")
-                        response = requests.post(
-                            f"{self.ollama_config['host']}/api/generate",
-                            json=payload,
-                            timeout=fallback_timeout
-                        )
+                    # Use shorter timeout for fallback models (they're usually faster);
+                    # loading the model is not part of it
+                    fallback_timeout = min(45, self.ollama_config["timeout"] // 2)
+                    self.ensure_loaded(fallback_model, host.url)
+                    self.ensure_prefix(system, fallback_model, host.url)
+                    
+                    endpoint, payload = self._request_payload(prompt, system, json_schema, fallback_model, max_tokens)
+                    
+                    self.logger.debug(f"Trying fallback model {fallback_model} on {host.url} with timeout {fallback_timeout}s")
+                    start_time = time.time()
+                    status_code, result = self._post_generate(host.url, payload, fallback_timeout, endpoint)
+                    host_ok = self.host_answered(status_code)
+                    
+                    if status_code == 200:
+                        latency = time.time() - start_time
+                        response_text = result.get("response", "")
+                        self._last_used[(host.url, fallback_model)] = time.time()
+                        self._record_prompt_eval(result, system, fallback_model, host.url, prompt)
                         
-                        if response.status_code == 200:
-                            result = response.json()
-                            response_text = result.get("response", "")
-                            
-                            self.logger.info(f"Fallback model {fallback_model} succeeded")
-                            # Don't switch back to original model immediately - let it recover
-                            return response_text
-                        else:
-                            self.logger.warning(f"Fallback model {fallback_model} failed with status {response.status_code}")
+                        self.logger.info(f"Fallback model {fallback_model} succeeded")
+                        # Don't switch back to original model immediately - let it recover
+                        return response_text
                     else:
-                        self.logger.warning(f"Fallback model {fallback_model} not available")
+                        self.logger.warning(f"Fallback model {fallback_model} failed with status {status_code}")
+                else:
+                    self.logger.warning(f"Fallback model {fallback_model} not available")
                 
             except Exception as e:
                 self.logger.warning(f"Fallback model {fallback_model} failed: {e}")
                 continue
+            finally:
+                if host:
+                    self.host_pool.release(host, host_ok, latency)
         
         # Restore original model if all fallbacks failed
         self.current_model = original_model
         self.logger.error("All fallback models failed")
         return None
     
-    def make_request(self, prompt: str, max_retries: Optional[int] = None, question: str = None) -> Optional[str]:
-        """Make a request to Ollama API with adaptive timeout and circuit breaker"""
+    @staticmethod
+    def host_answered(status_code: int) -> bool:
+        """Whether a response shows a working host (server errors and missing models count against it)"""
+        return status_code < 500 and status_code != 404
+    
+    def make_request(self, prompt: str, max_retries: Optional[int] = None, question: str = None,
+                     json_schema: Optional[Dict] = None, max_tokens: Optional[int] = None,
+                     system: Optional[str] = None) -> Optional[str]:
+        """
+        Make a request to Ollama API with adaptive timeout and circuit breaker
+        
+        Each attempt goes to the least busy healthy host; a retry avoids the
+        hosts that already failed this request while others are available.
+        Responses are streamed (ollama.stream) and cut off once their JSON is complete.
+        With system text (and ollama.chat_prefix), the request goes to /api/chat
+        after the prefix has been warmed on the chosen host.
+        
+        Args:
+            prompt: The prompt to send (the per-question part when system is given)
+            max_retries: Retries after the first attempt (default from config)
+            question: Question text (for the adaptive timeout)
+            json_schema: Optional JSON schema passed as Ollama's "format" to constrain the output
+            max_tokens: Generation cap sent as num_predict (default: ollama.num_predict)
+            system: Static prompt prefix shared across requests, sent as the system message
+        
+        Returns:
+            Response text or None if failed
+        """
         if max_retries is None:
             max_retries = self.ollama_config["max_retries"]
         
         # Check circuit breaker
         if not self.check_circuit_breaker():
             self.logger.warning("Circuit breaker is open - attempting model fallback")
-            return self._attempt_fallback_model(prompt, question)
+            return self._attempt_fallback_model(prompt, question, json_schema, max_tokens, system)
         
         # Calculate adaptive timeout
         if question:
@@ -224,54 +840,72 @@ class OllamaClient:
         else:
             adaptive_timeout = self.ollama_config["timeout"]
         
+        model = self.current_model
+        endpoint, payload = self._request_payload(prompt, system, json_schema, model, max_tokens)
+        failed_hosts = set()
+        
         request_success = False
         for attempt in range(max_retries + 1):
-            try:
-                start_time = time.time()
-                
-                payload = {
-                    "model": self.current_model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": self.ollama_config["temperature"],
-                        "top_p": self.ollama_config["top_p"]
-                    }
-                }
-                
-                self.logger.info(f"Making request to Ollama (attempt {attempt + 1}) with timeout {adaptive_timeout}s - Question length: {len(question) if question else 'unknown'}")
-                response = requests.post(
-                    f"{self.ollama_config['host']}/api/generate",
-                    json=payload,
-                    timeout=adaptive_timeout
-                )
-                
-                response_time = time.time() - start_time
-                self.stats["total_requests"] += 1
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    response_text = result.get("response", "")
+            host = self.host_pool.acquire(exclude=failed_hosts) or self.host_pool.acquire()
+            host_ok = False
+            if host is None:
+                self.logger.warning(f"Request attempt {attempt + 1}: no healthy Ollama host available")
+            else:
+                latency = None
+                try:
+                    # Load the model and its prompt prefix first so the adaptive timeout only covers the question
+                    self.ensure_loaded(model, host.url)
+                    self.ensure_prefix(system, model, host.url)
+                    start_time = time.time()
                     
-                    # Update statistics
-                    self.stats["successful_requests"] += 1
-                    self.stats["average_response_time"] = (
-                        (self.stats["average_response_time"] * (self.stats["successful_requests"] - 1) + response_time) 
-                        / self.stats["successful_requests"]
-                    )
+                    self.logger.info(f"Making request to Ollama at {host.url} (attempt {attempt + 1}) with timeout {adaptive_timeout}s - Question length: {len(question) if question else 'unknown'}")
+                    status_code, result = self._post_generate(host.url, payload, adaptive_timeout, endpoint)
                     
-                    self.logger.debug(f"Request successful in {response_time:.2f}s")
-                    request_success = True
-                    self.update_circuit_breaker(True)
-                    return response_text
-                else:
-                    self.logger.warning(f"Request failed with status {response.status_code}: {response.text}")
+                    response_time = time.time() - start_time
+                    self.stats["total_requests"] += 1
+                    host_ok = self.host_answered(status_code)
                     
-            except requests.exceptions.Timeout as e:
-                self.logger.warning(f"Request attempt {attempt + 1} timed out after {adaptive_timeout}s: {e}")
-                self.stats["timeout_failures"] += 1
-            except requests.RequestException as e:
-                self.logger.warning(f"Request attempt {attempt + 1} failed: {e}")
+                    if status_code == 200:
+                        response_text = result.get("response", "")
+                        self._last_used[(host.url, model)] = time.time()
+                        
+                        # A reload after eviction is load time, not question time
+                        load_time = result.get("load_duration", 0) / 1e9
+                        if load_time > 1:
+                            self.logger.info(f"Model {model} was reloaded on {host.url} ({load_time:.1f}s)")
+                            self.stats["model_loads"] += 1
+                            self.stats["model_load_time"] += load_time
+                            response_time = max(0.0, response_time - load_time)
+                            self.forget_prefixes(model, host.url)
+                        latency = response_time
+                        self._record_prompt_eval(result, system, model, host.url, prompt)
+                        
+                        # Update statistics
+                        self.stats["successful_requests"] += 1
+                        self.stats["average_response_time"] = (
+                            (self.stats["average_response_time"] * (self.stats["successful_requests"] - 1) + response_time) 
+                            / self.stats["successful_requests"]
+                        )
+                        
+                        self.logger.debug(f"Request successful in {response_time:.2f}s")
+                        request_success = True
+                        self.update_circuit_breaker(True)
+                        return response_text
+                    else:
+                        self.logger.warning(f"Request failed with status {status_code}: {result.get('error', '')}")
+                        
+                except requests.exceptions.Timeout as e:
+                    self.logger.warning(f"Request attempt {attempt + 1} timed out after {adaptive_timeout}s: {e}")
+                    self.stats["timeout_failures"] += 1
+                except requests.RequestException as e:
+                    self.logger.warning(f"Request attempt {attempt + 1} failed: {e}")
+                except ValueError as e:
+                    self.logger.warning(f"Request attempt {attempt + 1} returned invalid JSON: {e}")
+                finally:
+                    self.host_pool.release(host, host_ok, latency)
+                
+                if not host_ok:
+                    failed_hosts.add(host.url)
                 
             # Wait before retry (with exponential backoff and jitter)
             if attempt < max_retries:
@@ -279,6 +913,9 @@ class OllamaClient:
                 backoff_delay = base_delay * (2 ** attempt)
                 jitter = random.uniform(0, base_delay)
                 wait_time = backoff_delay + jitter
+                # Another healthy host can take the retry right away
+                if host is not None and not host_ok and self.host_pool.has_available_host(failed_hosts):
+                    wait_time = 0
                 self.logger.info(f"Waiting {wait_time:.1f}s before retry...")
                 time.sleep(wait_time)
         
@@ -288,6 +925,29 @@ class OllamaClient:
         self.logger.error(f"All {max_retries + 1} attempts failed")
         return None
     
+    async def make_request_async(self, prompt: str, max_retries: Optional[int] = None, question: str = None,
+                                 json_schema: Optional[Dict] = None, max_tokens: Optional[int] = None,
+                                 system: Optional[str] = None) -> Optional[str]:
+        """
+        Awaitable make_request for asyncio callers
+        
+        The streamed request runs on a worker thread, so it shares the pooled
+        session, host pool and model residency of the synchronous client.
+        
+        Args:
+            prompt: The prompt to send
+            max_retries: Retries after the first attempt (default from config)
+            question: Question text (for the adaptive timeout)
+            json_schema: Optional JSON schema passed as Ollama's "format" to constrain the output
+            max_tokens: Generation cap sent as num_predict (default: ollama.num_predict)
+            system: Static prompt prefix shared across requests, sent as the system message
+        
+        Returns:
+            Response text or None if failed
+        """
+        return await asyncio.to_thread(self.make_request, prompt, max_retries, question, json_schema, max_tokens,
+                                       system)
+    
     def classify_single_question(self, question: str, taxonomy_options: List[str] = None) -> Optional[Dict]:
         """Three-stage classification: Subject → Topic → Subtopic"""
         
@@ -537,6 +1197,10 @@ class OllamaClient:
             "timeout_rate": timeout_rate,
             "current_model": self.current_model,
             "circuit_breaker_status": "OPEN" if self.circuit_breaker["is_open"] else "CLOSED",
+            "hosts": self.host_pool.get_stats(),
+            "average_prompt_eval_tokens": (self.stats["prompt_eval_tokens"] / self.stats["prompt_evals"]) if self.stats["prompt_evals"] else 0,
+            "average_prompt_eval_time": (self.stats["prompt_eval_time"] / self.stats["prompt_evals"]) if self.stats["prompt_evals"] else 0,
+            "average_first_token_time": (self.stats["first_token_time"] / self.stats["first_tokens"]) if self.stats["first_tokens"] else 0,
             "questions_per_minute": (self.stats["total_questions_processed"] / (self.stats["average_response_time"] / 60)) if self.stats["average_response_time"] > 0 else 0
         }
     
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Ollama Host Pool - Least-outstanding-requests balancing over several Ollama hosts
+
+Spreads requests from one OllamaClient across a list of Ollama endpoints:
+- each request goes to the healthy host with the fewest requests in flight
+  (ties go to the host with the lower recent latency)
+- every host has its own circuit breaker: after failure_threshold consecutive
+  failures it is ejected for recovery_time seconds, doubling on each repeated
+  ejection up to max_recovery_time
+- once the ejection has passed, a single probe request decides whether the
+  host rejoins the pool
+
+With a single host the pool only adds bookkeeping, so it is always used.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+
+class OllamaHost:
+    """Load, health and latency state of one Ollama endpoint"""
+
+    def __init__(self, url: str):
+        """
+        Initialize host state
+
+        Args:
+            url: Base URL of the Ollama server
+        """
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.probing = False
+        self.latency_ewma: Optional[float] = None
+        self.stats = {"requests": 0, "successes": 0, "failures": 0, "ejections": 0}
+
+    def is_ejected(self, now: float) -> bool:
+        """Whether the host is still sitting out its ejection"""
+        return now < self.ejected_until
+
+    def get_stats(self) -> Dict:
+        """Get this host's counters, load and latency"""
+        return {
+            **self.stats,
+            "outstanding": self.outstanding,
+            "healthy": not self.is_ejected(time.time()) and not (self.ejections and self.consecutive_failures),
+            "ejected_for": max(0.0, round(self.ejected_until - time.time(), 1)),
+            "latency_ewma": round(self.latency_ewma, 3) if self.latency_ewma is not None else None
+        }
+
+
+class OllamaHostPool:
+    """
+    Pool of Ollama hosts with least-outstanding-requests selection
+
+    Features:
+    - Thread-safe acquire/release around every request
+    - Per-host circuit breakers with exponential ejection
+    - Single-probe recovery of ejected hosts
+    - Per-host latency (EWMA) and request counters
+    """
+
+    def __init__(self, urls: Iterable[str], failure_threshold: int = 3, recovery_time: float = 30.0,
+                 max_recovery_time: float = 300.0, latency_smoothing: float = 0.2):
+        """
+        Initialize the pool
+
+        Args:
+            urls: Base URLs of the Ollama servers
+            failure_threshold: Consecutive failures that eject a host
+            recovery_time: First ejection period in seconds
+            max_recovery_time: Longest ejection period in seconds
+            latency_smoothing: Weight of the newest latency sample in the EWMA
+        """
+        self.hosts: List[OllamaHost] = []
+        for url in urls:
+            if url and url.rstrip("/") not in [host.url for host in self.hosts]:
+                self.hosts.append(OllamaHost(url))
+        if not self.hosts:
+            raise ValueError("Ollama host pool needs at least one host")
+
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_time = recovery_time
+        self.max_recovery_time = max(recovery_time, max_recovery_time)
+        self.latency_smoothing = latency_smoothing
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._next = 0  # Rotates the starting point so equal hosts share the load
+
+    @property
+    def urls(self) -> List[str]:
+        """Base URLs of every host in the pool"""
+        return [host.url for host in self.hosts]
+
+    def healthy_hosts(self) -> List[OllamaHost]:
+        """Hosts that are not ejected"""
+        now = time.time()
+        with self._lock:
+            return [host for host in self.hosts if not host.is_ejected(now)]
+
+    def has_available_host(self, exclude: Iterable[str] = ()) -> bool:
+        """Whether a host outside exclude could take a request now"""
+        excluded = set(exclude)
+        now = time.time()
+        with self._lock:
+            return any(host.url not in excluded and not host.is_ejected(now) for host in self.hosts)
+
+    def acquire(self, exclude: Iterable[str] = ()) -> Optional[OllamaHost]:
+        """
+        Pick a host for one request and count the request as outstanding
+
+        Args:
+            exclude: Host URLs not to use (e.g. hosts that just failed this request)
+
+        Returns:
+            Host to send the request to, or None if every host is ejected or excluded
+        """
+        excluded = set(exclude)
+        now = time.time()
+        with self._lock:
+            count = len(self.hosts)
+            candidates = []
+            for offset in range(count):
+                host = self.hosts[(self._next + offset) % count]
+                if host.url in excluded or host.is_ejected(now):
+                    continue
+                # A host back from ejection takes one probe request at a time
+                if host.ejections and host.consecutive_failures and host.probing:
+                    continue
+                candidates.append(host)
+            if not candidates:
+                return None
+
+            host = min(candidates, key=lambda h: (h.outstanding, h.latency_ewma or 0.0))
+            if host.ejections and host.consecutive_failures:
+                host.probing = True
+            host.outstanding += 1
+            host.stats["requests"] += 1
+            self._next = (self._next + 1) % count
+            return host
+
+    def release(self, host: OllamaHost, success: bool, latency: Optional[float] = None):
+        """
+        Record the outcome of a request sent to a host
+
+        Args:
+            host: Host returned by acquire()
+            success: Whether the host answered the request
+            latency: Response time in seconds (successful requests)
+        """
+        with self._lock:
+            host.outstanding = max(0, host.outstanding - 1)
+            host.probing = False
+            if success:
+                host.stats["successes"] += 1
+                if host.consecutive_failures and host.ejections:
+                    self.logger.info(f"Ollama host {host.url} recovered")
+                host.consecutive_failures = 0
+                host.ejections = 0
+                if latency is not None:
+                    host.latency_ewma = latency if host.latency_ewma is None else (
+                        self.latency_smoothing * latency + (1 - self.latency_smoothing) * host.latency_ewma
+                    )
+                return
+
+            host.stats["failures"] += 1
+            host.consecutive_failures += 1
+            # Requests still in flight when the host was ejected do not extend the ejection
+            if host.consecutive_failures >= self.failure_threshold and not host.is_ejected(time.time()):
+                self._eject(host)
+
+    def eject(self, host: OllamaHost):
+        """Take a host out of rotation now (e.g. it is unreachable at startup)"""
+        with self._lock:
+            host.consecutive_failures = max(host.consecutive_failures, self.failure_threshold)
+            self._eject(host)
+
+    def _eject(self, host: OllamaHost):
+        """Eject a host for its current recovery period (caller holds the lock)"""
+        period = min(self.recovery_time * (2 ** host.ejections), self.max_recovery_time)
+        host.ejected_until = time.time() + period
+        host.ejections += 1
+        host.stats["ejections"] += 1
+        self.logger.warning(f"Ollama host {host.url} ejected for {period:.0f}s "
+                            f"after {host.consecutive_failures} consecutive failures")
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """Get per-host statistics"""
+        with self._lock:
+            return {host.url: host.get_stats() for host in self.hosts}
+
+
+# Module testing
+if __name__ == "__main__":
+    print("OLLAMA HOST POOL TESTING")
+    print("=" * 40)
+
+    pool = OllamaHostPool(["http://box-a:11434", "http://box-b:11434", "http://box-c:11434"],
+                          failure_threshold=2, recovery_time=0.2)
+
+    held = [pool.acquire() for _ in range(6)]
+    print(f"6 concurrent requests: {[h.url[-12:] for h in held]}")
+    for host in held:
+        pool.release(host, success=True, latency=0.5)
+
+    box_b = pool.hosts[1]
+    for _ in range(2):
+        pool.release(pool.acquire(exclude=[pool.hosts[0].url, pool.hosts[2].url]), success=False)
+    print(f"After 2 failures on box-b, healthy: {[h.url for h in pool.healthy_hosts()]}")
+
+    time.sleep(0.25)
+    probe = pool.acquire(exclude=[pool.hosts[0].url, pool.hosts[2].url])
+    print(f"Probe after recovery time goes to: {probe.url if probe else None}")
+    pool.release(probe, success=True, latency=0.4)
+    print(f"Stats: {pool.get_stats()}")
+    print("\nOllama host pool testing completed!")
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Ollama Stub Server - Local stand-in for the Ollama API used in offline testing
+
+Implements the subset of endpoints OllamaClient uses:
+- GET /api/tags
+- POST /api/generate and POST /api/chat (streamed as NDJSON chunks unless "stream" is false)
+
+Generate requests are answered like the OpenAI stub answers chat completions
+(first listed triplet, compact or full format), so responses pass validation.
+Requests for a model that is not installed get 404. GET /stub/stats reports
+how many connections and requests the server has seen, and --connection-delay
+adds a fixed cost to every new connection to mimic a remote host's handshake.
+With --load-delay, the first request for a model (or the first after its
+keep_alive ran out) waits that long and reports it as load_duration, and
+--generate-delay makes every prompt take that long before its first token.
+Streamed answers arrive in ~4-character tokens --token-delay apart, followed
+by --trailing-tokens of chatter after the JSON (unless a "format" schema
+constrains the output); options.num_predict truncates
+the output. Streams the client closes early are counted as cancelled. A
+request without a prompt (or messages) only loads the model, as in Ollama.
+
+Prompts are evaluated against --num-parallel slots that keep their last
+prompt, like Ollama's KV cache: only the part after the longest common
+prefix with a slot counts as prompt_eval_count, and --prompt-eval-delay is
+charged per evaluated token, so prefix reuse shows up in the responses.
+
+Usage:
+    python ollama_stub_server.py --port 11435
+    python ollama_stub_server.py --port 11435 --models llama3:latest --connection-delay 0.005
+    python ollama_stub_server.py --port 11435 --load-delay 3
+    python ollama_stub_server.py --port 11435 --token-delay 0.02 --trailing-tokens 100
+    python ollama_stub_server.py --port 11435 --prompt-eval-delay 0.0005 --num-parallel 2
+"""
+
+import json
+import os
+import re
+import sys
+import time
+import argparse
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from openai_stub_server import fake_completion
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODELS = ["gemma2:9b", "llama3:latest", "mistral:7b", "llama3.2:1b"]
+TOKEN = re.compile(r"\s*\S{1,4}|\s+")
+TRAILING_TEXT = " The question tests this subtopic because its key terms appear in the listed triplet."
+
+
+def render_chat(messages: List[Dict]) -> str:
+    """Render chat messages into one prompt, as a model's chat template would"""
+    return "".join(f"<|{m.get('role', 'user')}|>\n{m.get('content', '')}<|end|>\n" for m in messages) + "<|assistant|>\n"
+
+
+def parse_keep_alive(value) -> float:
+    """Convert an Ollama keep_alive value ("30m", "1h", 300, "-1") to seconds"""
+    if value is None:
+        return 300.0
+    value = str(value).strip()
+    units = {"s": 1, "m": 60, "h": 3600}
+    if value and value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+
+class OllamaStubState:
+    """Installed models and request counters shared by all request handlers"""
+
+    def __init__(self, models: List[str], connection_delay: float = 0.0, load_delay: float = 0.0,
+                 generate_delay: float = 0.0, token_delay: float = 0.0, trailing_tokens: int = 0,
+                 prompt_eval_delay: float = 0.0, num_parallel: int = 1):
+        self.models = list(models)
+        self.connection_delay = connection_delay
+        self.load_delay = load_delay
+        self.generate_delay = generate_delay
+        self.token_delay = token_delay
+        self.trailing_tokens = trailing_tokens
+        self.prompt_eval_delay = prompt_eval_delay
+        self.loaded: Dict[str, float] = {}  # model -> time its keep_alive runs out
+        self.slots: List[Dict] = [{"model": None, "prompt": "", "used": 0.0} for _ in range(max(1, num_parallel))]
+        self.lock = threading.Lock()
+        self.counters = {"connections": 0, "tags": 0, "generate": 0, "chat": 0, "loads": 0,
+                         "tokens_generated": 0, "cancelled": 0, "prompt_tokens": 0, "prompt_tokens_cached": 0}
+
+    def count(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            return dict(self.counters)
+
+    def evaluate_prompt(self, model: str, prompt: str) -> Tuple[int, float]:
+        """
+        Evaluate a prompt in the slot sharing the longest prefix with it
+
+        Returns:
+            Tuple of (evaluated prompt tokens, seconds spent)
+        """
+        with self.lock:
+            def shared(slot: Dict) -> int:
+                return len(os.path.commonprefix([slot["prompt"], prompt])) if slot["model"] == model else 0
+
+            slot = max(self.slots, key=lambda s: (shared(s), -s["used"]))
+            if not shared(slot):
+                slot = min(self.slots, key=lambda s: s["used"])
+            cached_chars = shared(slot)
+            slot.update({"model": model, "prompt": prompt, "used": time.time()})
+            cached = len(TOKEN.findall(prompt[:cached_chars]))
+            evaluated = max(1, len(TOKEN.findall(prompt)) - cached)
+            self.counters["prompt_tokens"] += evaluated
+            self.counters["prompt_tokens_cached"] += cached
+
+        eval_time = evaluated * self.prompt_eval_delay
+        if eval_time:
+            time.sleep(eval_time)
+        return evaluated, eval_time
+
+    def load(self, model: str, keep_alive) -> float:
+        """
+        Load a model if it is not resident and renew its keep_alive
+
+        Returns:
+            Seconds spent loading
+        """
+        keep_alive = parse_keep_alive(keep_alive)
+        with self.lock:
+            resident = self.loaded.get(model, 0) > time.time()
+            if not resident:
+                self.counters["loads"] += 1
+        load_time = 0.0 if resident else self.load_delay
+        if load_time:
+            time.sleep(load_time)
+        with self.lock:
+            if keep_alive == 0:
+                self.loaded.pop(model, None)
+            else:
+                self.loaded[model] = float("inf") if keep_alive < 0 else time.time() + keep_alive
+            if load_time:
+                # A freshly loaded model starts with an empty KV cache
+                for slot in self.slots:
+                    if slot["model"] == model:
+                        slot.update({"model": None, "prompt": ""})
+        return load_time
+
+
+class OllamaStubHandler(BaseHTTPRequestHandler):
+    """HTTP handler implementing the Ollama endpoints"""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    state: OllamaStubState = None
+
+    def setup(self):
+        super().setup()
+        self.state.count("connections")
+        if self.state.connection_delay:
+            time.sleep(self.state.connection_delay)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def send_json(self, status: int, payload: Dict):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_chunk(self, payload: Dict):
+        data = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    @staticmethod
+    def answer_chunk(model: str, text: str, chat: bool) -> Dict:
+        """Response chunk carrying generated text in the endpoint's format"""
+        if chat:
+            return {"model": model, "message": {"role": "assistant", "content": text}}
+        return {"model": model, "response": text}
+
+    def stream_answer(self, model: str, tokens: List[str], done_reason: str, chat: bool, final: Dict):
+        """Send an answer token by token as NDJSON chunks, stopping if the client goes away"""
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        generated = 0
+        try:
+            for token in tokens:
+                if self.state.token_delay:
+                    time.sleep(self.state.token_delay)
+                generated += 1
+                self.send_chunk({**self.answer_chunk(model, token, chat), "done": False})
+            self.send_chunk({**self.answer_chunk(model, "", chat), **final, "done": True,
+                             "done_reason": done_reason, "eval_count": generated})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.state.count("cancelled")
+            self.close_connection = True
+        finally:
+            self.state.count("tokens_generated", generated)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self.state.count("tags")
+            self.send_json(200, {"models": [{"name": name, "model": name} for name in self.state.models]})
+        elif self.path == "/stub/stats":
+            self.send_json(200, self.state.get_stats())
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path not in ("/api/generate", "/api/chat"):
+            self.send_json(404, {"error": "not found"})
+            return
+
+        chat = self.path == "/api/chat"
+        self.state.count("chat" if chat else "generate")
+        model = body.get("model", "")
+        if model not in self.state.models:
+            self.send_json(404, {"error": f"model '{model}' not found, try pulling it first"})
+            return
+
+        load_time = self.state.load(model, body.get("keep_alive"))
+        response = {
+            **self.answer_chunk(model, "", chat),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "done": True,
+            "done_reason": "load",
+            "load_duration": int(load_time * 1e9)
+        }
+        messages = body.get("messages") or ([{"role": "user", "content": body["prompt"]}] if body.get("prompt") else [])
+        if not messages:
+            self.send_json(200, response)
+            return
+
+        prompt = render_chat(messages) if chat else body["prompt"]
+        prompt_tokens, eval_time = self.state.evaluate_prompt(model, prompt)
+        if self.state.generate_delay:
+            time.sleep(self.state.generate_delay)
+        content = fake_completion({"messages": messages})["choices"][0]["message"]["content"]
+        final = {"prompt_eval_count": prompt_tokens, "prompt_eval_duration": int(eval_time * 1e9),
+                 "load_duration": int(load_time * 1e9)}
+
+        tokens = TOKEN.findall(content)
+        stream = body.get("stream", True)
+        if stream and self.state.trailing_tokens and not body.get("format"):
+            trailing = TOKEN.findall(TRAILING_TEXT * (self.state.trailing_tokens // 15 + 1))
+            tokens += trailing[:self.state.trailing_tokens]
+        done_reason = "stop"
+        num_predict = body.get("options", {}).get("num_predict")
+        if num_predict and num_predict > 0 and len(tokens) > num_predict:
+            tokens, done_reason = tokens[:num_predict], "length"
+
+        if stream:
+            self.stream_answer(model, tokens, done_reason, chat, final)
+            return
+        self.state.count("tokens_generated", len(tokens))
+        response.update({
+            **self.answer_chunk(model, "".join(tokens), chat),
+            **final,
+            "done_reason": done_reason,
+            "eval_count": len(tokens)
+        })
+        self.send_json(200, response)
+
+
+def create_stub_server(host: str = "127.0.0.1", port: int = 11435, models: Optional[List[str]] = None,
+                       connection_delay: float = 0.0, load_delay: float = 0.0,
+                       generate_delay: float = 0.0, token_delay: float = 0.0,
+                       trailing_tokens: int = 0, prompt_eval_delay: float = 0.0,
+                       num_parallel: int = 1) -> ThreadingHTTPServer:
+    """
+    Create (but do not start) a stub server
+
+    Args:
+        host: Interface to bind
+        port: Port to listen on (0 picks a free port)
+        models: Installed model names (default: the configured model and fallbacks)
+        connection_delay: Seconds added to every new connection
+        load_delay: Seconds a model takes to load
+        generate_delay: Seconds every prompt takes before its first token
+        token_delay: Seconds between streamed tokens
+        trailing_tokens: Tokens of chatter streamed after the JSON answer
+        prompt_eval_delay: Seconds per prompt token not found in a slot's cache
+        num_parallel: Parallel slots, each caching its last prompt
+
+    Returns:
+        Server instance; call serve_forever() to start it
+    """
+    state = OllamaStubState(models or DEFAULT_MODELS, connection_delay, load_delay, generate_delay,
+                            token_delay, trailing_tokens, prompt_eval_delay, num_parallel)
+    handler = type("BoundOllamaStubHandler", (OllamaStubHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.state = state
+    return server
+
+
+def main():
+    """Run the stub server from the command line"""
+    parser = argparse.ArgumentParser(description='Local stand-in for the Ollama API')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Interface to bind')
+    parser.add_argument('--port', type=int, default=11435, help='Port to listen on')
+    parser.add_argument('--models', nargs='+', default=DEFAULT_MODELS, help='Installed model names')
+    parser.add_argument('--connection-delay', type=float, default=0.0,
+                        help='Seconds added to every new connection')
+    parser.add_argument('--load-delay', type=float, default=0.0, help='Seconds a model takes to load')
+    parser.add_argument('--generate-delay', type=float, default=0.0,
+                        help='Seconds every prompt takes before its first token')
+    parser.add_argument('--token-delay', type=float, default=0.0, help='Seconds between streamed tokens')
+    parser.add_argument('--trailing-tokens', type=int, default=0,
+                        help='Tokens of chatter streamed after the JSON answer')
+    parser.add_argument('--prompt-eval-delay', type=float, default=0.0,
+                        help='Seconds per prompt token not found in the KV cache')
+    parser.add_argument('--num-parallel', type=int, default=1, help='Parallel slots, each caching its last prompt')
+    args = parser.parse_args()
+
+    server = create_stub_server(args.host, args.port, args.models, args.connection_delay, args.load_delay,
+                                args.generate_delay, args.token_delay, args.trailing_tokens,
+                                args.prompt_eval_delay, args.num_parallel)
+    print(f"Ollama stub server listening on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,22 +6,31 @@ Provides a robust interface to OpenAI's GPT-4o mini API with cost tracking,
 error handling, and fallback capabilities.
 """
 
+import asyncio
 import json
 import logging
+import random
+import threading
 import time
 import os
-from typing import Dict, Optional, List, Tuple
+from typing import Callable, Dict, Optional, List, Tuple, Iterable
 from datetime import datetime
 import requests
 
 try:
-    from openai import OpenAI
+    from openai import OpenAI, AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError, RateLimitError
     OPENAI_AVAILABLE = True
 except ImportError:
     OPENAI_AVAILABLE = False
     OpenAI = None
+    AsyncOpenAI = None
 
 from cost_tracker import CostTracker
+from rate_limiter import get_shared_rate_limiter, parse_retry_after
+from concurrency_controller import get_shared_concurrency_controller
+
+SYSTEM_PROMPT = ("You are an expert educational content classifier. "
+                 "Follow instructions precisely and return only valid JSON responses.")
 
 class OpenAIClient:
     """
@@ -46,6 +55,7 @@ class OpenAIClient:
         self.config = config
         self.openai_config = config.get("openai", {})
         self.cost_tracker = cost_tracker or CostTracker()
+        self.token_estimator = self.cost_tracker.token_estimator
         
         # Setup logging
         self.logger = logging.getLogger(__name__)
@@ -60,7 +70,7 @@ class OpenAIClient:
         if not api_key:
             raise ValueError("OpenAI API key not found. Set OPENAI_API_KEY environment variable")
         
-        self.client = OpenAI(api_key=api_key)
+        self.client = self._create_client(api_key)
         
         # Configuration
         self.model = self.openai_config.get("model", "gpt-4o-mini")
@@ -76,6 +86,7 @@ class OpenAIClient:
             "successful_requests": 0,
             "failed_requests": 0,
             "total_input_tokens": 0,
+            "total_cached_tokens": 0,
             "total_output_tokens": 0,
             "average_response_time": 0,
             "rate_limit_hits": 0,
@@ -83,17 +94,37 @@ class OpenAIClient:
             "last_request_time": 0
         }
         
-        # Rate limiting
-        self.rate_limit = {
-            "requests_per_minute": self.openai_config.get("requests_per_minute", 100),
-            "tokens_per_minute": self.openai_config.get("tokens_per_minute", 100000),
-            "last_reset": time.time(),
-            "requests_this_minute": 0,
-            "tokens_this_minute": 0
-        }
+        # Rate limiting - one token bucket per API endpoint and model, shared by
+        # every client in the process (each exam classifier has its own client)
+        self.rate_limiter = get_shared_rate_limiter(
+            self.openai_config.get("base_url") or os.getenv("OPENAI_BASE_URL"),
+            self.model,
+            self.openai_config.get("requests_per_minute", 100),
+            self.openai_config.get("tokens_per_minute", 100000)
+        )
+        
+        # Adaptive in-flight limit (AIMD on 429s, latency and quota headers), shared like the limiter
+        processing_config = config.get("processing", {})
+        initial_concurrency = max(1, processing_config.get("max_concurrent", 5))
+        max_concurrency = (processing_config.get("max_concurrent_limit", 32)
+                           if processing_config.get("adaptive_concurrency", True) else initial_concurrency)
+        self.concurrency = get_shared_concurrency_controller(
+            self.openai_config.get("base_url") or os.getenv("OPENAI_BASE_URL"),
+            self.model,
+            initial_limit=initial_concurrency,
+            max_limit=max(initial_concurrency, max_concurrency)
+        )
+        
+        # Guards stats when requests run concurrently
+        self._lock = threading.Lock()
         
         self.logger.info(f"OpenAI client initialized with model: {self.model}")
         
+    def _create_client(self, api_key: str):
+        """Create the underlying SDK client"""
+        # Retries are done by make_request so 429s reach the shared rate limiter
+        return OpenAI(api_key=api_key, base_url=self.openai_config.get("base_url"), max_retries=0)
+    
     def get_api_key(self) -> Optional[str]:
         """
         Get OpenAI API key from environment or config
@@ -123,50 +154,284 @@ class OpenAIClient:
         Returns:
             True if request can proceed, False if rate limited
         """
-        now = time.time()
+        return self.rate_limiter.time_until_available(estimated_tokens) == 0
+    
+    def wait_for_rate_limit(self, estimated_tokens: int = 0):
+        """
+        Wait until the shared rate limiter has capacity, then take it
         
-        # Reset counters if a minute has passed
-        if now - self.rate_limit["last_reset"] >= 60:
-            self.rate_limit["requests_this_minute"] = 0
-            self.rate_limit["tokens_this_minute"] = 0
-            self.rate_limit["last_reset"] = now
+        Args:
+            estimated_tokens: Estimated tokens for the request
+        """
+        waited = self.rate_limiter.acquire(estimated_tokens)
+        if waited > 1:
+            self.logger.info(f"Rate limit reached, waited {waited:.1f}s")
+    
+    def estimate_tokens(self, text: str, exam_type: str = "") -> int:
+        """
+        Estimate the prompt tokens of a request for a user prompt
         
-        # Check limits
-        if (self.rate_limit["requests_this_minute"] >= self.rate_limit["requests_per_minute"] or
-            self.rate_limit["tokens_this_minute"] + estimated_tokens >= self.rate_limit["tokens_per_minute"]):
-            return False
+        Exact with tiktoken, otherwise calibrated from the exam's recent usage.
+        
+        Args:
+            text: User prompt
+            exam_type: Exam the prompt belongs to (calibration key)
         
-        return True
+        Returns:
+            Estimated prompt token count (system prompt included)
+        """
+        return self.token_estimator.count_tokens(f"{SYSTEM_PROMPT}\n{text}", exam_type)
     
-    def wait_for_rate_limit(self, estimated_tokens: int = 0):
+    def prime_token_estimate(self, exam_type: str, sample_prompt: str):
         """
-        Wait if rate limit would be exceeded
+        Seed an exam's per-question estimate with a representative prompt
+        
+        Budget checks use it until actual usage for the exam has been observed.
         
         Args:
-            estimated_tokens: Estimated tokens for the request
+            exam_type: Exam type
+            sample_prompt: Typical user prompt for the exam
         """
-        while not self.check_rate_limits(estimated_tokens):
-            wait_time = 60 - (time.time() - self.rate_limit["last_reset"])
-            if wait_time > 0:
-                self.logger.info(f"Rate limit reached, waiting {wait_time:.1f}s")
-                time.sleep(min(wait_time + 1, 10))  # Wait with max 10s chunks
-            else:
-                break
+        self.token_estimator.prime(exam_type, f"{SYSTEM_PROMPT}\n{sample_prompt}")
+    
+    def _reserve_request(self, estimated_tokens: int, max_tokens: Optional[int] = None) -> Optional[str]:
+        """
+        Check quota and reserve budget before sending a request
+        
+        The reservation covers the estimated prompt plus max_tokens of output and is
+        shared with every thread and process using the same cost file.
+        
+        Args:
+            estimated_tokens: Estimated prompt tokens
+            max_tokens: Output token cap of the request (default: configured max_tokens)
+        
+        Returns:
+            Budget reservation ID, or None if the request must not be sent
+        """
+        if self.stats["quota_exhausted"]:
+            self.logger.error("API quota exhausted, cannot make request")
+            return None
+        
+        # Reserve budget
+        worst_case_usd, _ = self.cost_tracker.calculate_cost(self.model, estimated_tokens,
+                                                             max_tokens or self.max_tokens)
+        reservation_id = self.cost_tracker.reserve_budget(worst_case_usd)
+        if reservation_id is None:
+            self.logger.error("Budget exhausted, cannot make request")
+        
+        return reservation_id
     
-    def estimate_tokens(self, text: str) -> int:
+    def _build_request(self, prompt: str, max_tokens: Optional[int] = None,
+                       json_schema: Optional[Dict] = None) -> Dict:
         """
-        Estimate token count for text (rough approximation)
+        Build chat completion arguments for a classification prompt
         
         Args:
-            text: Text to estimate
+            prompt: User prompt
+            max_tokens: Output token cap (default: configured max_tokens)
+            json_schema: Optional JSON schema the response must follow (Structured Outputs)
+        
+        Returns:
+            Keyword arguments for chat.completions.create
+        """
+        request = {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": SYSTEM_PROMPT
+                },
+                {
+                    "role": "user", 
+                    "content": prompt
+                }
+            ],
+            "max_tokens": max_tokens or self.max_tokens,
+            "temperature": self.temperature,
+            "timeout": self.timeout
+        }
+        if json_schema:
+            request["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": "classification", "strict": True, "schema": json_schema}
+            }
+        return request
+    
+    def _handle_response(self, response, question: str, operation: str,
+                         estimated_tokens: int, start_time: float,
+                         reservation_id: Optional[str] = None,
+                         exam_type: str = "", prompt_chars: int = 0,
+                         questions: int = 1) -> Optional[str]:
+        """
+        Record usage for a completed request and extract its text
+        
+        Actual token counts also calibrate the token estimator for exam_type
+        (per question when one request classified several).
+        
+        Returns:
+            Response text or None if the response was empty
+        """
+        if not (response.choices and response.choices[0].message):
+            self.logger.error("Empty response from OpenAI")
+            return None
+        
+        response_text = response.choices[0].message.content
+        
+        # Track token usage (cached_tokens is the prompt prefix served from OpenAI's cache)
+        input_tokens = response.usage.prompt_tokens
+        output_tokens = response.usage.completion_tokens
+        details = getattr(response.usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", 0) or 0
+        if operation != "connection_test":
+            self.token_estimator.observe(exam_type, prompt_chars, input_tokens, output_tokens, questions)
+        
+        # Record cost
+        self.cost_tracker.record_usage(
+            model=self.model,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            question_id=question[:50] if question else None,
+            operation=operation,
+            cached_input_tokens=cached_tokens,
+            reservation_id=reservation_id
+        )
+        
+        response_time = time.time() - start_time
+        
+        # Replace the rate limiter's estimate with actual token usage
+        self.rate_limiter.settle(estimated_tokens, input_tokens + output_tokens)
+        
+        with self._lock:
+            # Update stats
+            self.stats["total_requests"] += 1
+            self.stats["successful_requests"] += 1
+            self.stats["total_input_tokens"] += input_tokens
+            self.stats["total_cached_tokens"] += cached_tokens
+            self.stats["total_output_tokens"] += output_tokens
+            
+            # Update response time
+            self.stats["average_response_time"] = (
+                (self.stats["average_response_time"] * (self.stats["successful_requests"] - 1) + response_time) /
+                self.stats["successful_requests"]
+            )
+        
+        self.logger.debug(f"OpenAI request successful: {input_tokens}+{output_tokens} tokens "
+                        f"({cached_tokens} cached), {response_time:.2f}s")
+        
+        return response_text
+    
+    @staticmethod
+    def _is_rate_limit_error(error: Exception) -> bool:
+        """Whether an SDK error is a 429 response"""
+        return isinstance(error, RateLimitError) or getattr(error, "status_code", None) == 429
+    
+    def _backoff(self, attempt: int) -> float:
+        """Exponential backoff with jitter for retries without a Retry-After"""
+        return min(60.0, self.retry_delay * (2 ** attempt)) * random.uniform(0.5, 1.0)
+    
+    def _send_request(self, request_kwargs: Dict):
+        """
+        Send one chat completion while holding an adaptive concurrency slot
+        
+        The response headers and latency (or a 429) are fed back to the shared
+        rate limiter and concurrency controller.
         
         Returns:
-            Estimated token count
+            Parsed ChatCompletion
         """
-        # Rough approximation: ~4 characters per token
-        return len(text) // 4 + 50  # Add buffer for safety
+        self.concurrency.acquire()
+        start = time.monotonic()
+        try:
+            raw_response = self.client.chat.completions.with_raw_response.create(**request_kwargs)
+        except Exception as e:
+            if self._is_rate_limit_error(e):
+                self.concurrency.record_throttled()
+            raise
+        finally:
+            self.concurrency.release()
+        
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        self.concurrency.record_success(time.monotonic() - start, raw_response.headers)
+        return raw_response.parse()
     
-    def make_request(self, prompt: str, question: str = "", operation: str = "") -> Optional[str]:
+    def _handle_error(self, error: Exception, attempt: int) -> Optional[float]:
+        """
+        Decide how to proceed after a failed request
+        
+        Args:
+            error: Exception raised by the SDK
+            attempt: Zero-based attempt number
+        
+        Returns:
+            Seconds to wait before retrying, or None to stop retrying
+        """
+        error_msg = str(error).lower()
+        last_attempt = attempt >= self.max_retries - 1
+        
+        # Handle different types of errors
+        if self._is_rate_limit_error(error):
+            # OpenAI reports an exhausted prepaid balance as a 429 too
+            if getattr(error, "code", None) == "insufficient_quota":
+                self.stats["quota_exhausted"] = True
+                self.logger.error(f"API quota exhausted: {error}")
+                return None
+            
+            self.stats["rate_limit_hits"] += 1
+            
+            # Honor the server's Retry-After for every client sharing the limiter
+            response = getattr(error, "response", None)
+            headers = getattr(response, "headers", None)
+            self.rate_limiter.update_from_headers(headers)
+            wait_time = parse_retry_after(headers)
+            if wait_time is not None:
+                self.rate_limiter.pause(wait_time)
+            if last_attempt:
+                self.logger.warning("Rate limit hit on the last attempt - giving up")
+                return None
+            if wait_time is None:
+                wait_time = self._backoff(attempt)
+            self.logger.warning(f"Rate limit hit, waiting {wait_time:.1f}s before retry")
+            return wait_time
+            
+        elif "quota" in error_msg or "billing" in error_msg:
+            self.stats["quota_exhausted"] = True
+            self.logger.error(f"API quota exhausted: {error}")
+            return None
+            
+        elif isinstance(error, APITimeoutError) or "timeout" in error_msg:
+            self.logger.warning(f"Request timeout (attempt {attempt + 1}): {error}")
+            if not last_attempt:
+                return self._backoff(attempt)
+                
+        elif isinstance(error, APIConnectionError) or "connection" in error_msg or "network" in error_msg:
+            self.logger.warning(f"Connection error (attempt {attempt + 1}): {error}")
+            if not last_attempt:
+                return self._backoff(attempt)
+        
+        elif isinstance(error, APIStatusError) and error.status_code >= 500:
+            self.logger.warning(f"OpenAI server error {error.status_code} (attempt {attempt + 1}): {error}")
+            if not last_attempt:
+                return self._backoff(attempt)
+                
+        else:
+            self.logger.error(f"OpenAI API error: {error}")
+        
+        return None
+    
+    def _record_failure(self, reservation_id: Optional[str] = None):
+        """Record a request that failed after all attempts and return its reserved budget"""
+        if reservation_id:
+            self.cost_tracker.release_reservation(reservation_id)
+        
+        with self._lock:
+            self.stats["failed_requests"] += 1
+            self.stats["total_requests"] += 1
+        
+        self.logger.error(f"OpenAI request failed after {self.max_retries} attempts")
+    
+    def make_request(self, prompt: str, question: str = "", operation: str = "",
+                     exam_type: str = "", max_tokens: Optional[int] = None,
+                     questions: int = 1, json_schema: Optional[Dict] = None) -> Optional[str]:
         """
         Make a request to OpenAI API
         
@@ -174,21 +439,24 @@ class OpenAIClient:
             prompt: The prompt to send
             question: Question being classified (for logging)
             operation: Operation type (for cost tracking)
+            exam_type: Exam the prompt belongs to (for token estimates)
+            max_tokens: Output token cap (default: configured max_tokens)
+            questions: Questions classified by the prompt (for token estimates)
+            json_schema: Optional JSON schema the response must follow
         
         Returns:
             Response text or None if failed
         """
-        if self.stats["quota_exhausted"]:
-            self.logger.error("API quota exhausted, cannot make request")
-            return None
-        
-        # Check budget
-        if not self.cost_tracker.can_afford_questions(1):
-            self.logger.error("Budget exhausted, cannot make request")
+        prompt_tokens = self.estimate_tokens(prompt, exam_type)
+        reservation_id = self._reserve_request(prompt_tokens, max_tokens)
+        if reservation_id is None:
             return None
         
         start_time = time.time()
-        estimated_tokens = self.estimate_tokens(prompt)
+        prompt_chars = len(SYSTEM_PROMPT) + 1 + len(prompt)
+        
+        # Rate limits count prompt plus expected completion tokens
+        estimated_tokens = prompt_tokens + self.token_estimator.expected_tokens(exam_type)[1] * max(1, questions)
         
         # Wait for rate limits
         self.wait_for_rate_limit(estimated_tokens)
@@ -198,103 +466,268 @@ class OpenAIClient:
             try:
                 self.logger.debug(f"Making OpenAI request (attempt {attempt + 1}/{self.max_retries})")
                 
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": "You are an expert educational content classifier. Follow instructions precisely and return only valid JSON responses."
-                        },
-                        {
-                            "role": "user", 
-                            "content": prompt
-                        }
-                    ],
-                    max_tokens=self.max_tokens,
-                    temperature=self.temperature,
-                    timeout=self.timeout
-                )
+                response = self._send_request(self._build_request(prompt, max_tokens, json_schema))
                 
-                # Extract response
-                if response.choices and response.choices[0].message:
-                    response_text = response.choices[0].message.content
-                    
-                    # Track token usage
-                    input_tokens = response.usage.prompt_tokens
-                    output_tokens = response.usage.completion_tokens
-                    
-                    # Record cost
-                    self.cost_tracker.record_usage(
-                        model=self.model,
-                        input_tokens=input_tokens,
-                        output_tokens=output_tokens,
-                        question_id=question[:50] if question else None,
-                        operation=operation
-                    )
-                    
-                    # Update stats
-                    self.stats["total_requests"] += 1
-                    self.stats["successful_requests"] += 1
-                    self.stats["total_input_tokens"] += input_tokens
-                    self.stats["total_output_tokens"] += output_tokens
-                    
-                    # Update rate limit counters
-                    self.rate_limit["requests_this_minute"] += 1
-                    self.rate_limit["tokens_this_minute"] += input_tokens + output_tokens
-                    
-                    # Update response time
-                    response_time = time.time() - start_time
-                    self.stats["average_response_time"] = (
-                        (self.stats["average_response_time"] * (self.stats["successful_requests"] - 1) + response_time) /
-                        self.stats["successful_requests"]
-                    )
-                    
-                    self.logger.debug(f"OpenAI request successful: {input_tokens}+{output_tokens} tokens, "
-                                    f"{response_time:.2f}s")
-                    
+                response_text = self._handle_response(response, question, operation,
+                                                      estimated_tokens, start_time, reservation_id,
+                                                      exam_type, prompt_chars, questions)
+                if response_text is not None:
                     return response_text
-                else:
-                    self.logger.error("Empty response from OpenAI")
                     
             except Exception as e:
-                error_msg = str(e).lower()
-                
-                # Handle different types of errors
-                if "rate_limit" in error_msg or "rate limit" in error_msg:
-                    self.stats["rate_limit_hits"] += 1
-                    wait_time = min(60, (attempt + 1) * self.retry_delay)
-                    self.logger.warning(f"Rate limit hit, waiting {wait_time}s before retry")
-                    time.sleep(wait_time)
-                    continue
-                    
-                elif "quota" in error_msg or "billing" in error_msg:
-                    self.stats["quota_exhausted"] = True
-                    self.logger.error(f"API quota exhausted: {e}")
-                    break
-                    
-                elif "timeout" in error_msg:
-                    self.logger.warning(f"Request timeout (attempt {attempt + 1}): {e}")
-                    if attempt < self.max_retries - 1:
-                        time.sleep(self.retry_delay * (attempt + 1))
-                        continue
-                        
-                elif "connection" in error_msg or "network" in error_msg:
-                    self.logger.warning(f"Connection error (attempt {attempt + 1}): {e}")
-                    if attempt < self.max_retries - 1:
-                        time.sleep(self.retry_delay * (attempt + 1))
-                        continue
-                        
-                else:
-                    self.logger.error(f"OpenAI API error: {e}")
+                wait_time = self._handle_error(e, attempt)
+                if wait_time is None:
                     break
+                time.sleep(wait_time)
         
         # All attempts failed
-        self.stats["failed_requests"] += 1
-        self.stats["total_requests"] += 1
+        self._record_failure(reservation_id)
+        return None
+    
+    def write_batch_file(self, requests_to_send: Iterable[Tuple], file_path: str,
+                         max_tokens: Optional[int] = None) -> int:
+        """
+        Serialize prompts into a Batch API JSONL input file
         
-        self.logger.error(f"OpenAI request failed after {self.max_retries} attempts")
+        Args:
+            requests_to_send: (custom_id, prompt) or (custom_id, prompt, json_schema) tuples
+            file_path: Path of the JSONL file to write
+            max_tokens: Output token cap per request (default: configured max_tokens)
+        
+        Returns:
+            Number of requests written
+        """
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        count = 0
+        
+        with open(file_path, 'w', encoding='utf-8') as f:
+            for custom_id, prompt, *schema in requests_to_send:
+                body = self._build_request(prompt, max_tokens, schema[0] if schema else None)
+                body.pop("timeout", None)  # Client-side option, not part of the API body
+                line = {
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": body
+                }
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+                count += 1
+        
+        self.logger.info(f"Wrote {count} batch requests to {file_path}")
+        return count
+    
+    def _batch_worst_case_usd(self, file_path: str, exam_type: str = "") -> float:
+        """
+        Worst-case cost of a batch input file (every request using its full max_tokens)
+        
+        Args:
+            file_path: JSONL file produced by write_batch_file
+            exam_type: Exam the requests belong to (token estimate calibration)
+        
+        Returns:
+            Cost in USD at Batch API prices
+        """
+        worst_case_usd = 0.0
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                body = json.loads(line)["body"]
+                prompt = body["messages"][-1]["content"]
+                cost_usd, _ = self.cost_tracker.calculate_cost(
+                    self.model, self.estimate_tokens(prompt, exam_type),
+                    body.get("max_tokens") or self.max_tokens, batch=True
+                )
+                worst_case_usd += cost_usd
+        return worst_case_usd
+    
+    def submit_batch(self, file_path: str, num_requests: int,
+                     completion_window: str = "24h", metadata: Optional[Dict] = None,
+                     exam_type: str = "") -> Optional[Tuple[str, str]]:
+        """
+        Upload a batch input file and create a batch job
+        
+        The batch's worst-case cost is reserved first, like a single request's, so
+        concurrent workers cannot submit more than the budget covers together. The
+        reservation lasts as long as the batch may be polled (batch.max_wait_hours);
+        pass it to get_batch_results to settle it.
+        
+        Args:
+            file_path: JSONL file produced by write_batch_file
+            num_requests: Number of requests in the file
+            completion_window: Batch API completion window
+            metadata: Optional metadata attached to the batch
+            exam_type: Exam the requests belong to (for the cost estimate)
+        
+        Returns:
+            (batch ID, budget reservation ID), or None if submission failed
+        """
+        if self.stats["quota_exhausted"]:
+            self.logger.error("API quota exhausted, cannot submit batch")
+            return None
+        
+        worst_case_usd = self._batch_worst_case_usd(file_path, exam_type)
+        max_wait_hours = self.config.get("batch", {}).get("max_wait_hours", 24)
+        reservation_id = self.cost_tracker.reserve_budget(worst_case_usd, ttl_seconds=max_wait_hours * 3600)
+        if reservation_id is None:
+            self.logger.error(f"Budget insufficient for batch of {num_requests} requests "
+                              f"(up to ${worst_case_usd:.4f})")
+            return None
+        
+        try:
+            with open(file_path, 'rb') as f:
+                input_file = self.client.files.create(file=f, purpose="batch")
+            
+            batch = self.client.batches.create(
+                input_file_id=input_file.id,
+                endpoint="/v1/chat/completions",
+                completion_window=completion_window,
+                metadata=metadata
+            )
+            
+            self.logger.info(f"Submitted batch {batch.id} with {num_requests} requests "
+                             f"(reserved ${worst_case_usd:.4f})")
+            return batch.id, reservation_id
+            
+        except Exception as e:
+            self.cost_tracker.release_reservation(reservation_id)
+            if "quota" in str(e).lower() or "billing" in str(e).lower():
+                self.stats["quota_exhausted"] = True
+            self.logger.error(f"Failed to submit batch: {e}")
+            return None
+    
+    def wait_for_batch(self, batch_id: str, poll_interval: float = 60,
+                       max_wait_seconds: float = 24 * 3600,
+                       should_stop: Optional[Callable[[], bool]] = None):
+        """
+        Poll a batch job until it reaches a final state
+        
+        Args:
+            batch_id: Batch ID returned by submit_batch
+            poll_interval: Seconds between status checks
+            max_wait_seconds: Maximum time to wait
+            should_stop: Optional callable that ends the wait early (e.g. on shutdown)
+        
+        Returns:
+            Final batch object, or None if it failed, timed out or was stopped
+        """
+        deadline = time.time() + max_wait_seconds
+        last_status = None
+        
+        def stopped() -> bool:
+            return bool(should_stop and should_stop())
+        
+        def pause():
+            # Sleep in short steps so a stop request is noticed promptly
+            wake_at = min(deadline, time.time() + poll_interval)
+            while not stopped() and time.time() < wake_at:
+                time.sleep(min(1.0, max(0.0, wake_at - time.time())))
+        
+        while time.time() < deadline and not stopped():
+            try:
+                batch = self.client.batches.retrieve(batch_id)
+            except Exception as e:
+                self.logger.warning(f"Failed to check batch {batch_id}: {e}")
+                pause()
+                continue
+            
+            if batch.status != last_status:
+                counts = batch.request_counts
+                progress = f" ({counts.completed}/{counts.total} done)" if counts else ""
+                self.logger.info(f"Batch {batch_id} status: {batch.status}{progress}")
+                last_status = batch.status
+            
+            if batch.status == "completed":
+                return batch
+            if batch.status in ("failed", "expired", "cancelled"):
+                self.logger.error(f"Batch {batch_id} ended with status: {batch.status}")
+                # Expired batches still return the requests that did finish
+                return batch if batch.output_file_id else None
+            
+            pause()
+        
+        if stopped():
+            self.logger.info(f"Stopped waiting for batch {batch_id}")
+        else:
+            self.logger.error(f"Timed out waiting for batch {batch_id}")
         return None
     
+    def get_batch_results(self, batch, reservation_id: Optional[str] = None) -> Dict[str, Optional[str]]:
+        """
+        Download batch output and record its cost
+        
+        Args:
+            batch: Completed batch object from wait_for_batch
+            reservation_id: Budget reservation from submit_batch, settled by the
+                batch's last usage record (released if nothing was billed)
+        
+        Returns:
+            Dictionary mapping custom_id to response text (None for failed requests)
+        """
+        results = {}
+        if not batch.output_file_id:
+            self.logger.error(f"Batch {batch.id} has no output file")
+            if reservation_id:
+                self.cost_tracker.release_reservation(reservation_id)
+            return results
+        
+        content = self.client.files.content(batch.output_file_id).text
+        usages = []
+        
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                self.logger.warning(f"Skipping malformed batch output line: {e}")
+                continue
+            
+            custom_id = item.get("custom_id")
+            response = item.get("response") or {}
+            body = response.get("body") or {}
+            
+            if item.get("error") or response.get("status_code") != 200:
+                self.logger.warning(f"Batch request {custom_id} failed: {item.get('error') or body.get('error')}")
+                results[custom_id] = None
+                continue
+            
+            usage = body.get("usage") or {}
+            usages.append((custom_id,
+                           usage.get("prompt_tokens", 0),
+                           usage.get("completion_tokens", 0),
+                           (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0))
+            
+            choices = body.get("choices") or []
+            results[custom_id] = choices[0]["message"]["content"] if choices else None
+        
+        # The reservation keeps covering the batch until its last request is recorded
+        for i, (custom_id, input_tokens, output_tokens, cached_tokens) in enumerate(usages):
+            self.cost_tracker.record_usage(
+                model=self.model,
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                question_id=custom_id,
+                operation="batch_classification",
+                batch=True,
+                cached_input_tokens=cached_tokens,
+                reservation_id=reservation_id if i == len(usages) - 1 else None
+            )
+            
+            with self._lock:
+                self.stats["total_requests"] += 1
+                self.stats["successful_requests"] += 1
+                self.stats["total_input_tokens"] += input_tokens
+                self.stats["total_cached_tokens"] += cached_tokens
+                self.stats["total_output_tokens"] += output_tokens
+        
+        if reservation_id and not usages:
+            self.cost_tracker.release_reservation(reservation_id)
+        
+        self.logger.info(f"Batch {batch.id}: {sum(1 for r in results.values() if r)} of "
+                         f"{len(results)} requests returned a response")
+        return results
+    
     def test_connection(self) -> bool:
         """
         Test connection to OpenAI API
@@ -335,8 +768,13 @@ class OpenAIClient:
             "average_tokens_per_request": (
                 total_tokens / max(1, self.stats["successful_requests"])
             ),
+            "cache_hit_rate": (
+                self.stats["total_cached_tokens"] / max(1, self.stats["total_input_tokens"]) * 100
+            ),
             "model": self.model,
-            "quota_exhausted": self.stats["quota_exhausted"]
+            "quota_exhausted": self.stats["quota_exhausted"],
+            "rate_limiter": self.rate_limiter.get_stats(),
+            "concurrency": self.concurrency.get_stats()
         }
     
     def get_cost_summary(self) -> str:
@@ -360,19 +798,181 @@ class OpenAIClient:
             self.cost_tracker.can_afford_questions(1)
         )
 
-def create_openai_client(config: Dict, budget_usd: float = 10.0) -> Optional[OpenAIClient]:
+class AsyncOpenAIClient(OpenAIClient):
+    """
+    Asyncio OpenAI API client for question classification
+    
+    Same request semantics as OpenAIClient (cost tracking, rate limiting,
+    quota detection and retries), but built on the SDK's AsyncOpenAI and
+    asyncio.sleep so many classifications can be multiplexed on one event
+    loop. All requests from this client share one HTTP connection pool.
+    Budget reservations and usage records take the cost ledger's file lock,
+    so they run in worker threads to keep the event loop responsive.
+    The Batch API helpers are only supported on the synchronous client.
+    """
+    
+    def __init__(self, config: Dict, cost_tracker: Optional[CostTracker] = None,
+                 async_client=None):
+        """
+        Initialize async OpenAI client
+        
+        Args:
+            config: Configuration dictionary with OpenAI settings
+            cost_tracker: Optional cost tracker instance
+            async_client: Optional AsyncOpenAI instance to share its connection pool
+        """
+        self._shared_client = async_client
+        super().__init__(config, cost_tracker)
+    
+    def _create_client(self, api_key: str):
+        """Create (or reuse) the AsyncOpenAI client and its connection pool"""
+        if self._shared_client is not None:
+            return self._shared_client
+        return AsyncOpenAI(api_key=api_key, base_url=self.openai_config.get("base_url"), max_retries=0)
+    
+    async def wait_for_rate_limit(self, estimated_tokens: int = 0):
+        """
+        Await capacity from the shared rate limiter, then take it
+        
+        Args:
+            estimated_tokens: Estimated tokens for the request
+        """
+        waited = await self.rate_limiter.acquire_async(estimated_tokens)
+        if waited > 1:
+            self.logger.info(f"Rate limit reached, waited {waited:.1f}s")
+    
+    async def _send_request_async(self, request_kwargs: Dict):
+        """Send one chat completion while holding an adaptive concurrency slot (see _send_request)"""
+        await self.concurrency.acquire_async()
+        start = time.monotonic()
+        try:
+            raw_response = await self.client.chat.completions.with_raw_response.create(**request_kwargs)
+        except Exception as e:
+            if self._is_rate_limit_error(e):
+                self.concurrency.record_throttled()
+            raise
+        finally:
+            self.concurrency.release()
+        
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        self.concurrency.record_success(time.monotonic() - start, raw_response.headers)
+        return raw_response.parse()
+    
+    async def make_request(self, prompt: str, question: str = "", operation: str = "",
+                           exam_type: str = "", max_tokens: Optional[int] = None,
+                           questions: int = 1, json_schema: Optional[Dict] = None) -> Optional[str]:
+        """
+        Make a request to OpenAI API without blocking the event loop
+        
+        Args:
+            prompt: The prompt to send
+            question: Question being classified (for logging)
+            operation: Operation type (for cost tracking)
+            exam_type: Exam the prompt belongs to (for token estimates)
+            max_tokens: Output token cap (default: configured max_tokens)
+            questions: Questions classified by the prompt (for token estimates)
+            json_schema: Optional JSON schema the response must follow
+        
+        Returns:
+            Response text or None if failed
+        """
+        prompt_tokens = self.estimate_tokens(prompt, exam_type)
+        reservation_id = await asyncio.to_thread(self._reserve_request, prompt_tokens, max_tokens)
+        if reservation_id is None:
+            return None
+        
+        start_time = time.time()
+        prompt_chars = len(SYSTEM_PROMPT) + 1 + len(prompt)
+        
+        # Rate limits count prompt plus expected completion tokens
+        estimated_tokens = prompt_tokens + self.token_estimator.expected_tokens(exam_type)[1] * max(1, questions)
+        
+        # Wait for rate limits
+        await self.wait_for_rate_limit(estimated_tokens)
+        
+        # Try the request with retries
+        for attempt in range(self.max_retries):
+            try:
+                self.logger.debug(f"Making async OpenAI request (attempt {attempt + 1}/{self.max_retries})")
+                
+                response = await self._send_request_async(self._build_request(prompt, max_tokens, json_schema))
+                
+                response_text = await asyncio.to_thread(self._handle_response, response, question, operation,
+                                                        estimated_tokens, start_time, reservation_id,
+                                                        exam_type, prompt_chars, questions)
+                if response_text is not None:
+                    return response_text
+                    
+            except Exception as e:
+                wait_time = self._handle_error(e, attempt)
+                if wait_time is None:
+                    break
+                await asyncio.sleep(wait_time)
+        
+        # All attempts failed
+        await asyncio.to_thread(self._record_failure, reservation_id)
+        return None
+    
+    async def test_connection(self) -> bool:
+        """
+        Test connection to OpenAI API
+        
+        Returns:
+            True if connection successful, False otherwise
+        """
+        try:
+            test_prompt = "Respond with exactly: 'Test successful'"
+            response = await self.make_request(test_prompt, operation="connection_test")
+            
+            if response and "test successful" in response.lower():
+                self.logger.info("OpenAI API connection test successful")
+                return True
+            else:
+                self.logger.warning(f"OpenAI API test unexpected response: {response}")
+                return False
+                
+        except Exception as e:
+            self.logger.error(f"OpenAI API connection test failed: {e}")
+            return False
+    
+    async def aclose(self):
+        """Close the underlying HTTP connection pool"""
+        await self.client.close()
+
+def create_cost_tracker_from_config(config: Dict, budget_usd: Optional[float] = None) -> CostTracker:
+    """
+    Create the cost tracker described by the configuration
+    
+    Args:
+        config: Configuration dictionary
+        budget_usd: Budget limit in USD (default: openai.budget_limit_usd)
+    
+    Returns:
+        CostTracker enforcing the configured budget on the configured ledger
+    """
+    openai_config = config.get("openai", {})
+    if budget_usd is None:
+        budget_usd = openai_config.get("budget_limit_usd", 10.0)
+    return CostTracker(
+        budget_usd,
+        config.get("paths", {}).get("cost_file", "logs/api_costs.jsonl"),
+        openai_config.get("cost_ledger_compact_every", 5000),
+        openai_config.get("budget_reservation_ttl", 600)
+    )
+
+def create_openai_client(config: Dict, budget_usd: Optional[float] = None) -> Optional[OpenAIClient]:
     """
     Create OpenAI client with error handling
     
     Args:
         config: Configuration dictionary
-        budget_usd: Budget limit in USD
+        budget_usd: Budget limit in USD (default: openai.budget_limit_usd)
     
     Returns:
         OpenAIClient instance or None if creation failed
     """
     try:
-        cost_tracker = CostTracker(budget_limit_usd=budget_usd)
+        cost_tracker = create_cost_tracker_from_config(config, budget_usd)
         client = OpenAIClient(config, cost_tracker)
         
         # Test connection
@@ -386,6 +986,33 @@ def create_openai_client(config: Dict, budget_usd: float = 10.0) -> Optional[Ope
         logging.error(f"Failed to create OpenAI client: {e}")
         return None
 
+async def create_async_openai_client(config: Dict, budget_usd: Optional[float] = None) -> Optional[AsyncOpenAIClient]:
+    """
+    Create async OpenAI client with error handling
+    
+    Args:
+        config: Configuration dictionary
+        budget_usd: Budget limit in USD (default: openai.budget_limit_usd)
+    
+    Returns:
+        AsyncOpenAIClient instance or None if creation failed
+    """
+    try:
+        cost_tracker = create_cost_tracker_from_config(config, budget_usd)
+        client = AsyncOpenAIClient(config, cost_tracker)
+        
+        # Test connection
+        if await client.test_connection():
+            return client
+        else:
+            logging.error("Async OpenAI client connection test failed")
+            await client.aclose()
+            return None
+            
+    except Exception as e:
+        logging.error(f"Failed to create async OpenAI client: {e}")
+        return None
+
 # Module testing
 if __name__ == "__main__":
     print("🧪 OPENAI CLIENT TESTING")
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+OpenAI Stub Server - Local stand-in for the OpenAI API used in offline testing
+
+Implements the subset of endpoints the classification pipeline uses:
+- POST /v1/chat/completions
+- POST /v1/files, GET /v1/files/{id}/content
+- POST /v1/batches, GET /v1/batches/{id}
+
+Chat completions answer classification prompts by picking the first numbered
+triplet in the prompt (once per question id for batched prompts), so responses
+always pass validation, and report prompt prefixes shared with the previous
+request as cached tokens. Prompts asking for the compact answer format get only
+the line number and confidence, and subject-only prompts get the first listed
+subject. Batches complete after a configurable delay.
+With --rpm/--tpm, chat completions carry x-ratelimit-* headers and exceeding a
+limit returns 429 with Retry-After.
+
+Usage:
+    python openai_stub_server.py --port 8765
+    OPENAI_API_KEY=sk-stub OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python process_separated_excel.py --batch
+"""
+
+import json
+import os
+import re
+import sys
+import time
+import uuid
+import argparse
+import logging
+import threading
+from collections import deque
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+TRIPLET_LINE = re.compile(r"^\s*(\d+)\. (.+?) > (.+?) > (.+?)\s*$", re.MULTILINE)
+ECHO_REQUEST = re.compile(r"Respond with exactly: '([^']*)'")
+TRIPLET_LIST_HEADER = "AVAILABLE SUBJECT > TOPIC > SUBTOPIC COMBINATIONS"
+BATCH_IDS = re.compile(r"^Question ids: (.+)$", re.MULTILINE)
+COMPACT_ANSWER = "answer with ONLY"
+SUBJECT_LIST = re.compile(r"^AVAILABLE SUBJECTS.*\n- (.+)$", re.MULTILINE)
+
+
+def request_text(body: Dict) -> str:
+    """Concatenate the message contents of a chat completion request"""
+    return "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+
+
+def fake_completion(body: Dict, cached_tokens: int = 0) -> Dict:
+    """
+    Build a chat completion response for a request body
+
+    Args:
+        body: Chat completion request body
+        cached_tokens: Prompt tokens to report as served from the prompt cache
+
+    Returns:
+        Chat completion response dictionary
+    """
+    prompt = request_text(body)
+
+    # Only look inside the triplet list, not at the examples in the instructions
+    list_start = prompt.rfind(TRIPLET_LIST_HEADER)
+    echo = ECHO_REQUEST.search(prompt)
+    match = TRIPLET_LINE.search(prompt, max(list_start, 0))
+    subject = SUBJECT_LIST.search(prompt)
+    if echo:
+        content = echo.group(1)
+    elif subject and list_start < 0:
+        content = json.dumps({"subject": subject.group(1).strip(), "confidence": 0.9})
+    elif match:
+        line_number, subject, topic, subtopic = match.groups()
+        answer = {
+            "reasoning_steps": "Stub server: selected the first listed triplet.",
+            "line_number": int(line_number),
+            "triplet": f"{subject} > {topic} > {subtopic}",
+            "subject": subject,
+            "topic": topic,
+            "subtopic": subtopic,
+            "confidence": 0.9
+        }
+        if COMPACT_ANSWER in prompt:
+            # Compact answer format: only the line number and confidence
+            answer = {"line_number": answer["line_number"], "confidence": answer["confidence"]}
+        batch_ids = BATCH_IDS.search(prompt)
+        if batch_ids:
+            # Batched prompt: one answer per listed question id
+            content = json.dumps({"classifications": [
+                {"id": question_id, **answer} for question_id in re.findall(r'"([^"]+)"', batch_ids.group(1))
+            ]})
+        else:
+            content = json.dumps(answer)
+    else:
+        content = "{}"
+
+    prompt_tokens = len(prompt) // 4
+    completion_tokens = len(content) // 4
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o-mini"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": min(cached_tokens, prompt_tokens)}
+        }
+    }
+
+
+class StubState:
+    """In-memory files, batches and prompt cache shared by all request handlers"""
+
+    def __init__(self, batch_delay: float = 2.0, requests_per_minute: Optional[int] = None,
+                 tokens_per_minute: Optional[int] = None):
+        self.batch_delay = batch_delay
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.files: Dict[str, Dict] = {}
+        self.batches: Dict[str, Dict] = {}
+        self.last_prompt = ""
+        self.recent_requests = deque()  # (time, tokens) of chat completions in the last minute
+        self.lock = threading.Lock()
+
+    def check_rate_limit(self, tokens: int) -> Tuple[Dict[str, str], Optional[float]]:
+        """
+        Count a chat completion against the per-minute limits (sliding window)
+
+        Returns:
+            Tuple of (x-ratelimit-* headers, seconds to retry after or None if allowed)
+        """
+        if not (self.requests_per_minute or self.tokens_per_minute):
+            return {}, None
+
+        rpm = self.requests_per_minute or 10 ** 9
+        tpm = self.tokens_per_minute or 10 ** 12
+        with self.lock:
+            now = time.time()
+            while self.recent_requests and now - self.recent_requests[0][0] >= 60:
+                self.recent_requests.popleft()
+            used_requests = len(self.recent_requests)
+            used_tokens = sum(t for _, t in self.recent_requests)
+
+            retry_after = None
+            if used_requests + 1 > rpm or used_tokens + tokens > tpm:
+                retry_after = max(0.1, 60 - (now - self.recent_requests[0][0])) if self.recent_requests else 1.0
+            else:
+                self.recent_requests.append((now, tokens))
+                used_requests += 1
+                used_tokens += tokens
+
+        headers = {
+            "x-ratelimit-limit-requests": str(rpm),
+            "x-ratelimit-limit-tokens": str(tpm),
+            "x-ratelimit-remaining-requests": str(max(0, rpm - used_requests)),
+            "x-ratelimit-remaining-tokens": str(max(0, tpm - used_tokens))
+        }
+        return headers, retry_after
+
+    def cached_prefix_tokens(self, prompt: str) -> int:
+        """
+        Approximate OpenAI prompt caching: the prefix shared with the previous
+        prompt counts as cached once it reaches 1024 tokens, in 128-token steps
+        """
+        with self.lock:
+            shared = len(os.path.commonprefix([self.last_prompt, prompt])) // 4
+            self.last_prompt = prompt
+        return shared // 128 * 128 if shared >= 1024 else 0
+
+    def add_file(self, filename: str, purpose: str, content: bytes) -> Dict:
+        """Store an uploaded file and return its file object"""
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        file_object = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed"
+        }
+        with self.lock:
+            self.files[file_id] = {"object": file_object, "content": content}
+        return file_object
+
+    def create_batch(self, body: Dict) -> Optional[Dict]:
+        """Create a batch job for an uploaded input file"""
+        if body.get("input_file_id") not in self.files:
+            return None
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex[:24]}",
+            "object": "batch",
+            "endpoint": body.get("endpoint", "/v1/chat/completions"),
+            "input_file_id": body["input_file_id"],
+            "completion_window": body.get("completion_window", "24h"),
+            "status": "in_progress",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+            "metadata": body.get("metadata"),
+            "request_counts": {"total": 0, "completed": 0, "failed": 0}
+        }
+        with self.lock:
+            self.batches[batch["id"]] = batch
+        return batch
+
+    def get_batch(self, batch_id: str) -> Optional[Dict]:
+        """Return a batch, completing it once its delay has passed"""
+        with self.lock:
+            batch = self.batches.get(batch_id)
+            if batch and batch["status"] == "in_progress" and time.time() - batch["created_at"] >= self.batch_delay:
+                self._run_batch(batch)
+            return batch
+
+    def _run_batch(self, batch: Dict):
+        """Answer every request in a batch input file and store the output file"""
+        lines = self.files[batch["input_file_id"]]["content"].decode("utf-8").splitlines()
+        output = []
+        for line in lines:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            output.append(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex[:24]}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "request_id": uuid.uuid4().hex,
+                             "body": fake_completion(request["body"])},
+                "error": None
+            }))
+
+        output_id = f"file-{uuid.uuid4().hex[:24]}"
+        content = ("\n".join(output) + "\n").encode("utf-8")
+        self.files[output_id] = {"object": {
+            "id": output_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+            "filename": f"{batch['id']}_output.jsonl", "purpose": "batch_output", "status": "processed"
+        }, "content": content}
+
+        batch.update({
+            "status": "completed",
+            "output_file_id": output_id,
+            "completed_at": int(time.time()),
+            "request_counts": {"total": len(output), "completed": len(output), "failed": 0}
+        })
+        logger.info(f"Completed {batch['id']} with {len(output)} requests")
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """HTTP handler for the stub endpoints"""
+
+    protocol_version = "HTTP/1.1"
+    state: StubState = None
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def send_json(self, status: int, payload: Dict, headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_not_found(self):
+        self.send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+
+    def read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def parse_multipart(self, body: bytes) -> Tuple[Dict[str, str], Optional[Tuple[str, bytes]]]:
+        """Split a multipart/form-data upload into form fields and the file part"""
+        header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8")
+        message = BytesParser().parsebytes(header + body)
+        fields, upload = {}, None
+        for part in message.get_payload():
+            name = part.get_param("name", header="content-disposition")
+            filename = part.get_filename()
+            payload = part.get_payload(decode=True) or b""
+            if filename:
+                upload = (filename, payload)
+            else:
+                fields[name] = payload.decode("utf-8")
+        return fields, upload
+
+    def do_POST(self):
+        path = self.path.split("?")[0].rstrip("/")
+        body = self.read_body()
+
+        if path.endswith("/chat/completions"):
+            request = json.loads(body or b"{}")
+            prompt = request_text(request)
+            headers, retry_after = self.state.check_rate_limit(len(prompt) // 4 + request.get("max_tokens", 0))
+            if retry_after is not None:
+                headers["retry-after"] = f"{retry_after:.3f}"
+                self.send_json(429, {"error": {"message": "Rate limit reached for requests",
+                                               "type": "requests", "code": "rate_limit_exceeded"}}, headers)
+                return
+            cached_tokens = self.state.cached_prefix_tokens(prompt)
+            self.send_json(200, fake_completion(request, cached_tokens), headers)
+        elif path.endswith("/files"):
+            fields, upload = self.parse_multipart(body)
+            if not upload:
+                self.send_json(400, {"error": {"message": "Missing file", "type": "invalid_request_error"}})
+                return
+            self.send_json(200, self.state.add_file(upload[0], fields.get("purpose", "batch"), upload[1]))
+        elif path.endswith("/batches"):
+            batch = self.state.create_batch(json.loads(body or b"{}"))
+            if batch:
+                self.send_json(200, batch)
+            else:
+                self.send_json(400, {"error": {"message": "Unknown input_file_id", "type": "invalid_request_error"}})
+        else:
+            self.send_not_found()
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        parts = path.split("/")
+
+        if len(parts) >= 2 and parts[-2] == "batches":
+            batch = self.state.get_batch(parts[-1])
+            if batch:
+                self.send_json(200, batch)
+            else:
+                self.send_not_found()
+        elif path.endswith("/content") and parts[-2] in self.state.files:
+            content = self.state.files[parts[-2]]["content"]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        else:
+            self.send_not_found()
+
+
+def create_stub_server(host: str = "127.0.0.1", port: int = 8765, batch_delay: float = 2.0,
+                       requests_per_minute: Optional[int] = None,
+                       tokens_per_minute: Optional[int] = None) -> ThreadingHTTPServer:
+    """
+    Create a stub server (call serve_forever() to run it)
+
+    Args:
+        host: Interface to bind
+        port: Port to listen on (0 picks a free port)
+        batch_delay: Seconds before a submitted batch completes
+        requests_per_minute: Enforced request limit (None = unlimited, no headers)
+        tokens_per_minute: Enforced token limit (None = unlimited, no headers)
+
+    Returns:
+        ThreadingHTTPServer instance
+    """
+    state = StubState(batch_delay, requests_per_minute, tokens_per_minute)
+    handler = type("BoundStubRequestHandler", (StubRequestHandler,), {"state": state})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    """Run the stub server from the command line"""
+    parser = argparse.ArgumentParser(description='Local stand-in for the OpenAI API')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Interface to bind')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+    parser.add_argument('--batch-delay', type=float, default=2.0, help='Seconds before a batch completes')
+    parser.add_argument('--rpm', type=int, help='Enforce a requests-per-minute limit')
+    parser.add_argument('--tpm', type=int, help='Enforce a tokens-per-minute limit')
+    args = parser.parse_args()
+
+    server = create_stub_server(args.host, args.port, args.batch_delay, args.rpm, args.tpm)
+    print(f"OpenAI stub server listening on http://{args.host}:{server.server_port}/v1")
+    print(f"Use: OPENAI_API_KEY=sk-stub OPENAI_BASE_URL=http://{args.host}:{server.server_port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
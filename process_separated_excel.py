@@ -14,11 +14,15 @@ Workflow:
 
 import os
 import sys
+import json
+import argparse
 import logging
 import signal
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 # Import modules
 from config import get_config, validate_config
@@ -100,18 +104,58 @@ class SeparatedExcelProcessor:
         )
 
     def signal_handler(self, signum, frame):
-        """Handle shutdown signals gracefully"""
-        self.logger.info(f"\nReceived signal {signum}. Shutting down gracefully...")
+        """
+        Handle shutdown signals gracefully
+
+        Only stops new work: queued classifications are cancelled, the ones
+        already running are written back and journaled, and run() then saves
+        progress and prints the final statistics as usual. A second signal
+        exits at once (every journaled result is already flushed to the OS).
+        """
+        self.logger.info(f"\nReceived signal {signum}. Shutting down gracefully "
+                         f"(waiting for running requests; signal again to exit now)...")
         self.is_running = False
+        signal.signal(signum, signal.SIG_DFL)
 
-        # Save progress before exit
-        if self.excel_processor:
-            self.logger.info("Saving progress before shutdown...")
-            self.excel_processor.save_progress()
+    def initialize_excel_processor(self) -> bool:
+        """
+        Load the separated Excel file and replay its progress journal
 
-        # Print final statistics
-        self.print_final_statistics()
-        sys.exit(0)
+        Returns:
+            True if successful, False otherwise
+        """
+        # Initialize Excel processor
+        self.logger.info("Initializing Excel processor...")
+
+        # Find the single Excel file in output folder
+        import os, glob
+        output_folder = os.path.dirname(self.config["paths"]["separated_excel"])
+        excel_files = glob.glob(os.path.join(output_folder, "*.xlsx"))
+
+        if not excel_files:
+            self.logger.error(f"No Excel files found in {output_folder}")
+            return False
+
+        input_file = excel_files[0]  # Use the single Excel file
+        self.logger.info(f"Found separated file: {os.path.basename(input_file)}")
+
+        # Generate dynamic output filename based on input file
+        dynamic_filename = generate_result_filename(os.path.basename(input_file))
+        output_file = os.path.join(self.config["paths"]["result_folder"], dynamic_filename)
+
+        self.logger.info(f"Using dynamic result filename: {dynamic_filename}")
+
+        self.excel_processor = MultiTabExcelProcessor(
+            input_file,
+            output_file,
+            journal_sync_interval=self.config["processing"]["save_interval"]
+        )
+
+        if not self.excel_processor.load_excel_file():
+            self.logger.error("Failed to load Excel file")
+            return False
+
+        return True
 
     def initialize_components(self) -> bool:
         """
@@ -121,31 +165,7 @@ class SeparatedExcelProcessor:
             True if successful, False otherwise
         """
         try:
-            # Initialize Excel processor
-            self.logger.info("Initializing Excel processor...")
-            
-            # Find the single Excel file in output folder
-            import os, glob
-            output_folder = os.path.dirname(self.config["paths"]["separated_excel"])
-            excel_files = glob.glob(os.path.join(output_folder, "*.xlsx"))
-            
-            if not excel_files:
-                self.logger.error(f"No Excel files found in {output_folder}")
-                return False
-            
-            input_file = excel_files[0]  # Use the single Excel file
-            self.logger.info(f"Found separated file: {os.path.basename(input_file)}")
-            
-            # Generate dynamic output filename based on input file
-            dynamic_filename = generate_result_filename(os.path.basename(input_file))
-            output_file = os.path.join(self.config["paths"]["result_folder"], dynamic_filename)
-            
-            self.logger.info(f"Using dynamic result filename: {dynamic_filename}")
-
-            self.excel_processor = MultiTabExcelProcessor(input_file, output_file)
-
-            if not self.excel_processor.load_excel_file():
-                self.logger.error("Failed to load Excel file")
+            if not self.initialize_excel_processor():
                 return False
 
             if not self.excel_processor.create_backup():
@@ -156,14 +176,21 @@ class SeparatedExcelProcessor:
             self.logger.info("Initializing cost tracker...")
             budget = self.config["openai"]["budget_limit_usd"]
             cost_file = self.config["paths"]["cost_file"]
-            self.cost_tracker = CostTracker(budget, cost_file)
+            compact_every = self.config["openai"].get("cost_ledger_compact_every", 5000)
+            reservation_ttl = self.config["openai"].get("budget_reservation_ttl", 600)
+            self.cost_tracker = CostTracker(budget, cost_file, compact_every, reservation_ttl)
 
             # Initialize Ollama client if available
             if OLLAMA_AVAILABLE:
                 try:
-                    ollama_config = self.config["ollama"]
-                    self.ollama_client = OllamaClient(ollama_config)
-                    self.logger.info("Ollama client initialized")
+                    ollama_client = OllamaClient(self.config)
+                    # Also fills the client's model list cache
+                    if ollama_client.check_ollama_status():
+                        self.ollama_client = ollama_client
+                        self.ollama_client.preload()
+                        self.logger.info("Ollama client initialized")
+                    else:
+                        self.logger.warning("Ollama not reachable - continuing without local fallback")
                 except Exception as e:
                     self.logger.warning(f"Ollama client unavailable: {e}")
                     self.ollama_client = None
@@ -222,53 +249,111 @@ class SeparatedExcelProcessor:
             # Process each question
             save_interval = self.config["processing"]["save_interval"]
             backup_interval = self.config["processing"]["backup_interval"]
+            max_concurrent = max(1, self.config["processing"].get("max_concurrent", 1))
+            if self.config["processing"].get("adaptive_concurrency", True) and classifier.openai_client:
+                # Enough workers for the ceiling; the client's controller decides how many
+                # requests are actually in flight
+                initial = max_concurrent
+                max_concurrent = max(max_concurrent, self.config["processing"].get("max_concurrent_limit", 32))
+                self.logger.info(f"Classifying with adaptive concurrency "
+                                 f"(starting at {initial}, up to {max_concurrent} requests)")
+            else:
+                self.logger.info(f"Classifying with up to {max_concurrent} concurrent requests")
+
+            # Several questions per request share one copy of the triplet list
+            batch_size = max(1, self.config["processing"].get("batch_size", 1))
+            if batch_size > 1:
+                self.logger.info(f"Sending up to {batch_size} questions per classification request")
+
+            # Keep the workers busy with a window of queued classifications, but write
+            # results back strictly in row order by always waiting on the oldest one
+            window = max_concurrent * 2
+            in_flight = deque()
+            pending = deque()
+            completed = 0
+
+            with ThreadPoolExecutor(max_workers=max_concurrent,
+                                    thread_name_prefix=f"classify-{tab_name}") as executor:
+                rows = iter(unprocessed_rows)
+
+                while True:
+                    # On shutdown, drop queued classifications (their rows stay unprocessed
+                    # for the next run) and only drain the ones already running
+                    if not self.is_running:
+                        for _, future in in_flight:
+                            future.cancel()
+
+                    # Top up the window while we are still running
+                    while self.is_running and len(in_flight) < window:
+                        batch = [row for row in (next(rows, None) for _ in range(batch_size)) if row is not None]
+                        if not batch:
+                            break
+                        if batch_size > 1:
+                            future = executor.submit(
+                                classifier.classify_questions,
+                                [(row['question'], row['explanation']) for row in batch]
+                            )
+                        else:
+                            future = executor.submit(
+                                classifier.classify_question,
+                                batch[0]['question'],
+                                batch[0]['explanation']
+                            )
+                        in_flight.append((batch, future))
+
+                    if not pending:
+                        if not in_flight:
+                            if not self.is_running:
+                                self.logger.info("Processing interrupted by user")
+                            break
+
+                        batch, future = in_flight.popleft()
+                        if future.cancelled():
+                            continue
+                        try:
+                            results = future.result() if batch_size > 1 else [future.result()]
+                        except Exception as e:
+                            # Only this request's rows fail; the rest of the tab carries on
+                            self.logger.error(f"[{tab_name}] Classification raised for row(s) "
+                                              f"{', '.join(str(row['row_number']) for row in batch)}: {e}")
+                            results = [None] * len(batch)
+                        pending.extend(zip(batch, results))
+
+                    row_data, result = pending.popleft()
+                    completed += 1
+
+                    self.logger.info(f"\n[{tab_name}] Question {completed}/{tab_stats['total']} (Row: {row_data['row_number']})")
+
+                    if result:
+                        # Update Excel with classification
+                        success = self.excel_processor.update_row_classification(
+                            tab_name,
+                            row_data['index'],
+                            result['subject'],
+                            result['topic'],
+                            result['subtopic']
+                        )
+
+                        if success:
+                            tab_stats['successful'] += 1
+                            tab_stats['processed'] += 1
+                        else:
+                            tab_stats['failed'] += 1
+                            self.logger.error(f"Failed to update row {row_data['row_number']}")
+                    else:
+                        tab_stats['failed'] += 1
+                        self.logger.error(f"Classification failed for row {row_data['row_number']}")
 
-            for i, row_data in enumerate(unprocessed_rows, 1):
-                if not self.is_running:
-                    self.logger.info("Processing interrupted by user")
-                    break
-
-                self.logger.info(f"\n[{tab_name}] Question {i}/{tab_stats['total']} (Row: {row_data['row_number']})")
+                    # Every result is already journaled; sync it to disk periodically
+                    if completed % save_interval == 0:
+                        self.excel_processor.sync_journal()
 
-                # Classify question
-                result = classifier.classify_question(
-                    row_data['question'],
-                    row_data['explanation']
-                )
+                    # Optional full Excel snapshot (rewrites every tab, so off by default)
+                    if backup_interval and completed % backup_interval == 0:
+                        self.logger.info(f"Creating backup... ({completed}/{tab_stats['total']})")
+                        self.excel_processor.save_progress(backup=True)
 
-                if result:
-                    # Update Excel with classification
-                    success = self.excel_processor.update_row_classification(
-                        tab_name,
-                        row_data['index'],
-                        result['subject'],
-                        result['topic'],
-                        result['subtopic']
-                    )
-
-                    if success:
-                        tab_stats['successful'] += 1
-                        tab_stats['processed'] += 1
-                    else:
-                        tab_stats['failed'] += 1
-                        self.logger.error(f"Failed to update row {row_data['row_number']}")
-                else:
-                    tab_stats['failed'] += 1
-                    self.logger.error(f"Classification failed for row {row_data['row_number']}")
-
-                # Save progress periodically
-                if i % save_interval == 0:
-                    self.logger.info(f"Saving progress... ({i}/{tab_stats['total']})")
-                    self.excel_processor.save_progress()
-
-                # Create backup periodically
-                if i % backup_interval == 0:
-                    self.logger.info(f"Creating backup... ({i}/{tab_stats['total']})")
-                    self.excel_processor.save_progress(backup=True)
-
-            # Final save for this tab
-            self.logger.info(f"Saving final progress for {tab_name}...")
-            self.excel_processor.save_progress()
+            self.excel_processor.sync_journal()
 
             tab_stats['end_time'] = datetime.now()
             elapsed = (tab_stats['end_time'] - tab_stats['start_time']).total_seconds()
@@ -309,12 +394,201 @@ class SeparatedExcelProcessor:
                 self.overall_stats['successful_classifications'] += tab_stats['successful']
                 self.overall_stats['failed_classifications'] += tab_stats['failed']
 
+            # Write the workbook once, now that every tab is done
+            self.logger.info("Saving classifications to Excel...")
+            self.excel_processor.save_progress()
+
             return True
 
         except Exception as e:
             self.logger.error(f"Error processing tabs: {e}")
             return False
 
+    def get_batch_state_path(self, tab_name: str) -> str:
+        """Path of the file recording a tab's submitted batch"""
+        output_stem = os.path.splitext(os.path.basename(self.excel_processor.output_file_path))[0]
+        return os.path.join(self.config["batch"]["batch_folder"], f"{output_stem}_{tab_name}.json")
+
+    def submit_tab_batch(self, tab_name: str, tab_stats: Dict) -> Optional[Dict]:
+        """
+        Submit all unprocessed questions of a tab as one Batch API job
+
+        Rule-based matches and cached classifications are applied immediately
+        and never sent to the API.
+        If a batch for this tab was already submitted by an earlier run, it is
+        resumed instead of being submitted again.
+
+        Args:
+            tab_name: Name of the tab to process
+            tab_stats: Tab statistics dictionary to update
+
+        Returns:
+            Batch job dictionary, or None if nothing was submitted
+        """
+        classifier = self.classifiers[tab_name]
+        state_path = self.get_batch_state_path(tab_name)
+
+        unprocessed_rows = self.excel_processor.get_unprocessed_rows(tab_name)
+        tab_stats['total'] = len(unprocessed_rows)
+
+        # Rule-based matches and cache hits need no API call
+        rows_by_id = {}
+        for row_data in unprocessed_rows:
+            result = (classifier.classify_with_rules(row_data['question']) or
+                      classifier.classify_from_cache(row_data['question'], row_data['explanation']))
+            if result:
+                self.apply_batch_result(tab_name, row_data, result, tab_stats)
+            else:
+                rows_by_id[f"{tab_name}:{row_data['index']}"] = row_data
+
+        if os.path.exists(state_path):
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self.logger.info(f"[{tab_name}] Resuming previously submitted batch {state['batch_id']}")
+            return {'tab_name': tab_name, 'batch_id': state['batch_id'],
+                    'reservation_id': state.get('reservation_id'),
+                    'rows_by_id': rows_by_id, 'state_path': state_path}
+
+        self.logger.info(f"[{tab_name}] {len(rows_by_id)} questions to submit, "
+                         f"{tab_stats['successful']} classified by rules or cache")
+        if not rows_by_id:
+            return None
+
+        if not classifier.openai_client:
+            self.logger.error(f"[{tab_name}] Batch mode requires the OpenAI client")
+            tab_stats['failed'] += len(rows_by_id)
+            return None
+
+        to_send = [(custom_id, *classifier.build_request(row_data['question'], row_data['explanation']))
+                   for custom_id, row_data in rows_by_id.items()]
+
+        batch_file = os.path.splitext(state_path)[0] + "_input.jsonl"
+        classifier.openai_client.write_batch_file(to_send, batch_file, classifier.output_token_limit())
+        submitted = classifier.openai_client.submit_batch(
+            batch_file,
+            len(to_send),
+            completion_window=self.config["batch"]["completion_window"],
+            metadata={"tab": tab_name},
+            exam_type=classifier.exam_type
+        )
+        if not submitted:
+            return None
+        batch_id, reservation_id = submitted
+
+        # Remember the submission so an interrupted run does not pay for it twice
+        with open(state_path, 'w', encoding='utf-8') as f:
+            json.dump({'batch_id': batch_id, 'reservation_id': reservation_id, 'input_file': batch_file,
+                       'requests': len(to_send), 'submitted_at': datetime.now().isoformat()}, f, indent=2)
+
+        return {'tab_name': tab_name, 'batch_id': batch_id, 'reservation_id': reservation_id,
+                'rows_by_id': rows_by_id, 'state_path': state_path}
+
+    def apply_batch_result(self, tab_name: str, row_data: Dict, result: Optional[Dict], tab_stats: Dict):
+        """Write one classification back to the workbook and update tab statistics"""
+        if result and self.excel_processor.update_row_classification(
+                tab_name, row_data['index'], result['subject'], result['topic'], result['subtopic']):
+            tab_stats['successful'] += 1
+            tab_stats['processed'] += 1
+        else:
+            tab_stats['failed'] += 1
+            self.logger.error(f"Classification failed for row {row_data['row_number']}")
+
+    def complete_tab_batch(self, job: Dict, tab_stats: Dict):
+        """
+        Wait for a tab's batch job, then validate and write back its results
+
+        Args:
+            job: Batch job dictionary from submit_tab_batch
+            tab_stats: Tab statistics dictionary to update
+        """
+        tab_name = job['tab_name']
+        classifier = self.classifiers[tab_name]
+        batch_config = self.config["batch"]
+
+        batch = classifier.openai_client.wait_for_batch(
+            job['batch_id'],
+            poll_interval=batch_config["poll_interval"],
+            max_wait_seconds=batch_config["max_wait_hours"] * 3600,
+            should_stop=lambda: not self.is_running
+        )
+        if batch is None:
+            self.logger.error(f"[{tab_name}] Batch {job['batch_id']} did not complete; "
+                              f"re-run to resume polling")
+            return
+
+        responses = classifier.openai_client.get_batch_results(batch, job.get('reservation_id'))
+
+        # Write back in row order
+        for custom_id, row_data in job['rows_by_id'].items():
+            result = None
+            if responses.get(custom_id):
+                result = classifier.classify_from_response(responses[custom_id])
+                if result:
+                    classifier.store_in_cache(row_data['question'], row_data['explanation'], result)
+
+            if not result and batch_config.get("retry_failed_sync", True):
+                self.logger.info(f"[{tab_name}] Re-classifying row {row_data['row_number']} synchronously")
+                result = classifier.classify_question(row_data['question'], row_data['explanation'])
+
+            self.apply_batch_result(tab_name, row_data, result, tab_stats)
+
+        with open(job['state_path'], 'r', encoding='utf-8') as f:
+            input_file = json.load(f).get('input_file')
+        if input_file and os.path.exists(input_file):
+            os.remove(input_file)
+        os.remove(job['state_path'])
+
+    def process_all_tabs_batch(self) -> bool:
+        """
+        Process all tabs through the OpenAI Batch API
+
+        Every tab is submitted first so the batches run side by side, then
+        each one is awaited and written back.
+
+        Returns:
+            True if successful, False otherwise
+        """
+        try:
+            os.makedirs(self.config["batch"]["batch_folder"], exist_ok=True)
+            jobs = []
+
+            for tab_name in self.excel_processor.get_tab_list():
+                if not self.is_running:
+                    break
+
+                tab_stats = {
+                    'tab_name': tab_name,
+                    'total': 0,
+                    'processed': 0,
+                    'successful': 0,
+                    'failed': 0,
+                    'start_time': datetime.now()
+                }
+                self.overall_stats['by_tab'][tab_name] = tab_stats
+
+                job = self.submit_tab_batch(tab_name, tab_stats)
+                if job:
+                    jobs.append((job, tab_stats))
+
+            for job, tab_stats in jobs:
+                if not self.is_running:
+                    break
+                self.complete_tab_batch(job, tab_stats)
+
+            for tab_name, tab_stats in self.overall_stats['by_tab'].items():
+                tab_stats['end_time'] = datetime.now()
+                tab_stats['elapsed_seconds'] = (tab_stats['end_time'] - tab_stats['start_time']).total_seconds()
+                self.overall_stats['total_questions'] += tab_stats['total']
+                self.overall_stats['successful_classifications'] += tab_stats['successful']
+                self.overall_stats['failed_classifications'] += tab_stats['failed']
+
+            self.excel_processor.save_progress()
+            return True
+
+        except Exception as e:
+            self.logger.error(f"Error processing tabs in batch mode: {e}")
+            return False
+
     def print_final_statistics(self):
         """Print comprehensive final statistics"""
         print("\n" + "="*60)
@@ -353,6 +627,25 @@ class SeparatedExcelProcessor:
             print(f"  API requests: {session['requests']}")
             print(f"  Total tokens: {session['input_tokens'] + session['output_tokens']:,}")
 
+        # Ollama prompt evaluation: the per-question figures show whether the exam prefix was reused
+        if self.ollama_client and self.ollama_client.stats["total_requests"]:
+            ollama_stats = self.ollama_client.get_statistics()
+            print(f"\nOllama:")
+            print(f"  Requests: {ollama_stats['total_requests']}")
+            print(f"  Prefix warm-ups: {ollama_stats['prefix_warmups']} "
+                  f"({ollama_stats['prefix_eval_tokens']:,} tokens, {ollama_stats['prefix_eval_time']:.1f}s)")
+            # Early-stopped streams end before Ollama reports prompt eval; only time to first token covers them
+            measured = ollama_stats['prompt_evals']
+            if measured:
+                print(f"  Prompt eval per request: {ollama_stats['average_prompt_eval_tokens']:.0f} tokens, "
+                      f"{ollama_stats['average_prompt_eval_time'] * 1000:.0f}ms ({measured} requests)")
+                print(f"  Prefix cache misses: {ollama_stats['prefix_cache_misses']} (of {measured} requests)")
+            if ollama_stats['prompt_evals_unreported']:
+                print(f"  Early-stopped requests (no prompt eval reported): {ollama_stats['prompt_evals_unreported']}")
+            if ollama_stats['first_tokens']:
+                print(f"  Time to first token: {ollama_stats['average_first_token_time'] * 1000:.0f}ms "
+                      f"({ollama_stats['first_tokens']} streamed requests)")
+
         # Timing
         end_time = datetime.now()
         elapsed = (end_time - self.start_time).total_seconds()
@@ -367,10 +660,29 @@ class SeparatedExcelProcessor:
 
         print("="*60)
 
-    def run(self) -> bool:
+    def export_results(self) -> bool:
+        """
+        Write the output workbook from the progress journal without classifying anything
+
+        Returns:
+            True if successful, False otherwise
+        """
+        try:
+            if not self.initialize_excel_processor():
+                return False
+            return self.excel_processor.save_progress()
+        except Exception as e:
+            self.logger.error(f"Failed to export results: {e}")
+            return False
+
+    def run(self, batch_mode: bool = False) -> bool:
         """
         Run the complete classification process
 
+        Args:
+            batch_mode: Submit questions through the OpenAI Batch API instead of
+                classifying them one request at a time
+
         Returns:
             True if successful, False otherwise
         """
@@ -389,7 +701,10 @@ class SeparatedExcelProcessor:
             return False
 
         # Process all tabs
-        if not self.process_all_tabs():
+        if batch_mode:
+            if not self.process_all_tabs_batch():
+                return False
+        elif not self.process_all_tabs():
             return False
 
         # Print final statistics
@@ -400,6 +715,22 @@ class SeparatedExcelProcessor:
 
 def main():
     """Main entry point"""
+    parser = argparse.ArgumentParser(description='Classify separated questions with exam-specific taxonomies')
+    parser.add_argument('--batch', action='store_true',
+                        help='Submit all unprocessed questions through the OpenAI Batch API (half price, '
+                             'results within the completion window)')
+    parser.add_argument('--export', action='store_true',
+                        help='Only write the result workbook from the progress journal of earlier runs')
+    args = parser.parse_args()
+
+    if args.export:
+        processor = SeparatedExcelProcessor()
+        if processor.export_results():
+            print(f"Exported classifications to: {processor.excel_processor.output_file_path}")
+            return 0
+        print("FAILED! Check logs/processing_errors.log for details")
+        return 1
+
     print("="*60)
     print("EXAM-SPECIFIC QUESTION CLASSIFICATION")
     print("="*60)
@@ -413,7 +744,7 @@ def main():
     processor = SeparatedExcelProcessor()
 
     # Run processing
-    success = processor.run()
+    success = processor.run(batch_mode=args.batch)
 
     end_time = datetime.now()
     processing_time = (end_time - start_time).total_seconds()
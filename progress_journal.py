@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Progress Journal - Append-only write-ahead log of row classifications
+
+Every classification is appended as one JSON line the moment it is made, so
+progress survives crashes without rewriting the whole workbook. On startup the
+journal is replayed onto the freshly loaded tabs and processing resumes with
+the rows that are still missing.
+"""
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List
+
+
+class ProgressJournal:
+    """
+    JSONL journal of classified rows for one input workbook
+
+    The first line is a header with a fingerprint of the input file. If the
+    input changes, the old journal is set aside instead of being replayed
+    onto different rows.
+    """
+
+    def __init__(self, journal_path: str, sync_interval: int = 10):
+        """
+        Initialize the journal (nothing is opened until open() is called)
+
+        Args:
+            journal_path: JSONL file to append to
+            sync_interval: fsync after this many records (records are always
+                flushed to the OS, so only a power loss can drop unsynced ones)
+        """
+        self.journal_path = journal_path
+        self.sync_interval = max(1, sync_interval)
+        self.logger = logging.getLogger(__name__)
+
+        self._file = None
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self.records_written = 0
+
+    @staticmethod
+    def fingerprint(file_path: str) -> str:
+        """
+        Identify an input file by name, size and modification time
+
+        Args:
+            file_path: Input workbook path
+
+        Returns:
+            Fingerprint string
+        """
+        stat = os.stat(file_path)
+        return f"{os.path.basename(file_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    def open(self, source_fingerprint: str) -> List[Dict]:
+        """
+        Open the journal for appending and return the records to replay
+
+        Args:
+            source_fingerprint: Fingerprint of the input file being processed
+
+        Returns:
+            Journaled classification records, oldest first
+        """
+        directory = os.path.dirname(self.journal_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        records = []
+        if os.path.exists(self.journal_path):
+            header, records = self._read()
+            if not header or header.get("source") != source_fingerprint:
+                stale_path = f"{self.journal_path}.{datetime.now().strftime('%Y%m%d_%H%M%S')}.stale"
+                os.replace(self.journal_path, stale_path)
+                self.logger.warning(f"Input file changed since the journal was written; "
+                                    f"moved old journal to {stale_path}")
+                records = []
+
+        is_new = not os.path.exists(self.journal_path)
+        self._file = open(self.journal_path, 'a', encoding='utf-8')
+        if is_new:
+            self._write_line({"type": "header", "source": source_fingerprint,
+                              "created_at": datetime.now().isoformat()})
+            self.sync()
+
+        return records
+
+    def _read(self):
+        """Read the header and classification records, skipping damaged lines"""
+        header = None
+        records = []
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash mid-write leaves at most one partial line at the end
+                    self.logger.warning(f"Skipping damaged journal line {line_number}")
+                    continue
+                if entry.get("type") == "header":
+                    header = entry
+                else:
+                    records.append(entry)
+        return header, records
+
+    def _write_line(self, entry: Dict):
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def append(self, tab_name: str, row_index: int, row_no, subject: str, topic: str, subtopic: str):
+        """
+        Append one classification
+
+        Args:
+            tab_name: Tab the row belongs to
+            row_index: DataFrame index of the row
+            row_no: Value of the row's "Row No" column (checked on replay)
+            subject: Subject classification
+            topic: Topic classification
+            subtopic: Subtopic classification
+        """
+        entry = {
+            "tab": tab_name,
+            "index": int(row_index),
+            "row_no": str(row_no),
+            "subject": subject,
+            "topic": topic,
+            "subtopic": subtopic,
+            "ts": datetime.now().isoformat()
+        }
+        with self._lock:
+            if self._file is None:
+                raise RuntimeError("Progress journal is not open")
+            self._write_line(entry)
+            self.records_written += 1
+            self._unsynced += 1
+            if self._unsynced >= self.sync_interval:
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+
+    def sync(self):
+        """Force journaled records to disk"""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+
+    def close(self):
+        """Sync and close the journal"""
+        self.sync()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
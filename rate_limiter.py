@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Rate Limiter - Token-bucket limiter for requests and tokens per minute
+
+One limiter is shared by every OpenAI client in the process that talks to the
+same API and model, so several exam classifiers draw from one account quota
+instead of each assuming it has the whole limit.
+
+Both buckets refill continuously (no abrupt minute resets). Callers block (or
+await) exactly until enough capacity has refilled. The server's view wins:
+x-ratelimit-* response headers correct the limits and remaining capacity, and
+Retry-After on a 429 pauses every caller sharing the limiter.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, Mapping, Optional, Tuple
+
+
+def parse_retry_after(headers: Optional[Mapping]) -> Optional[float]:
+    """
+    Seconds to wait according to retry-after-ms / Retry-After headers
+
+    Args:
+        headers: Response headers (case-insensitive mapping)
+
+    Returns:
+        Seconds, or None if the headers do not say
+    """
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class TokenBucket:
+    """Continuously refilling bucket; the level may go negative when usage is settled late"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    @property
+    def rate(self) -> float:
+        """Refill rate per second"""
+        return self.capacity / 60.0
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available (after refill)"""
+        if self.level >= amount:
+            return 0.0
+        if self.rate <= 0:
+            return 60.0
+        return (amount - self.level) / self.rate
+
+
+class RateLimiter:
+    """
+    Request and token buckets with blocking and asyncio acquire
+
+    Features:
+    - Continuous refill, exact wait times instead of fixed polling
+    - Actual usage settled after each response
+    - Limits and remaining capacity corrected from x-ratelimit-* headers
+    - Retry-After pauses all callers
+    - Wait-time metrics
+    """
+
+    def __init__(self, requests_per_minute: float = 100, tokens_per_minute: float = 100000):
+        """
+        Initialize the limiter
+
+        Args:
+            requests_per_minute: Request limit
+            tokens_per_minute: Token limit (prompt plus completion tokens)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+        self.stats = {
+            "acquired": 0,
+            "waited": 0,
+            "total_wait_time": 0.0,
+            "max_wait_time": 0.0,
+            "header_updates": 0,
+            "retry_after_pauses": 0
+        }
+
+    def _try_acquire(self, tokens: int) -> float:
+        """Take one request and tokens if available; otherwise return seconds to wait"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            # A request larger than the whole bucket may go once the bucket is full
+            needed = min(tokens, self.tokens.capacity)
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(needed))
+            if wait > 0:
+                return wait
+
+            self.requests.level -= 1
+            self.tokens.level -= tokens
+            return 0.0
+
+    def _record_wait(self, waited: float):
+        with self._lock:
+            self.stats["acquired"] += 1
+            if waited > 0.001:
+                self.stats["waited"] += 1
+                self.stats["total_wait_time"] += waited
+                self.stats["max_wait_time"] = max(self.stats["max_wait_time"], waited)
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        Block until a request slot and tokens are available, then take them
+
+        Args:
+            tokens: Estimated tokens for the request
+
+        Returns:
+            Seconds spent waiting
+        """
+        start = time.monotonic()
+        while True:
+            wait = self._try_acquire(tokens)
+            if not wait:
+                break
+            time.sleep(wait)
+        waited = time.monotonic() - start
+        self._record_wait(waited)
+        return waited
+
+    async def acquire_async(self, tokens: int = 0) -> float:
+        """
+        Await a request slot and tokens without blocking the event loop
+
+        Args:
+            tokens: Estimated tokens for the request
+
+        Returns:
+            Seconds spent waiting
+        """
+        start = time.monotonic()
+        while True:
+            wait = self._try_acquire(tokens)
+            if not wait:
+                break
+            await asyncio.sleep(wait)
+        waited = time.monotonic() - start
+        self._record_wait(waited)
+        return waited
+
+    def time_until_available(self, tokens: int = 0) -> float:
+        """Seconds until a request with this many tokens could be sent (nothing is taken)"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            return max(self.requests.wait_time(1), self.tokens.wait_time(min(tokens, self.tokens.capacity)))
+
+    def settle(self, estimated_tokens: int, actual_tokens: int):
+        """
+        Replace a request's estimated tokens with its actual usage
+
+        Args:
+            estimated_tokens: Tokens taken by acquire()
+            actual_tokens: Prompt plus completion tokens reported by the API
+        """
+        with self._lock:
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + estimated_tokens - actual_tokens)
+
+    def update_from_headers(self, headers: Optional[Mapping]):
+        """
+        Align the buckets with the server's x-ratelimit-* headers
+
+        Args:
+            headers: Response headers (case-insensitive mapping)
+        """
+        if not headers:
+            return
+        updated = False
+        with self._lock:
+            now = time.monotonic()
+            for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+                limit = headers.get(f"x-ratelimit-limit-{kind}")
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                try:
+                    if limit is not None and float(limit) > 0 and float(limit) != bucket.capacity:
+                        self.logger.info(f"Server {kind} limit is {limit}/min (configured {bucket.capacity:.0f})")
+                        bucket.refill(now)
+                        bucket.capacity = float(limit)
+                        updated = True
+                    if remaining is not None:
+                        bucket.refill(now)
+                        bucket.level = min(bucket.level, float(remaining))
+                        updated = True
+                except ValueError:
+                    continue
+            if updated:
+                self.stats["header_updates"] += 1
+
+    def pause(self, seconds: float):
+        """
+        Stop all callers for a while (e.g. after a 429 with Retry-After)
+
+        Args:
+            seconds: Pause length
+        """
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.stats["retry_after_pauses"] += 1
+        self.logger.warning(f"Rate limited by server, pausing requests for {seconds:.1f}s")
+
+    def get_stats(self) -> Dict:
+        """Get limiter metrics and current bucket levels"""
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            return {
+                **self.stats,
+                "average_wait_time": (self.stats["total_wait_time"] / self.stats["waited"]
+                                      if self.stats["waited"] else 0.0),
+                "requests_per_minute": self.requests.capacity,
+                "tokens_per_minute": self.tokens.capacity,
+                "available_requests": round(self.requests.level, 2),
+                "available_tokens": round(self.tokens.level),
+                "paused_for": max(0.0, self.blocked_until - now)
+            }
+
+
+# One limiter per (API base URL, model) for the whole process
+_shared_limiters: Dict[Tuple[str, str], RateLimiter] = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_rate_limiter(base_url: Optional[str], model: str,
+                            requests_per_minute: float, tokens_per_minute: float) -> RateLimiter:
+    """
+    Get the process-wide limiter for an API endpoint and model
+
+    The first caller's limits are used; later headers from the server correct them.
+
+    Args:
+        base_url: API base URL (None for the SDK default)
+        model: Model name (OpenAI limits are per model)
+        requests_per_minute: Request limit
+        tokens_per_minute: Token limit
+
+    Returns:
+        Shared RateLimiter
+    """
+    key = (base_url or "default", model)
+    with _shared_lock:
+        if key not in _shared_limiters:
+            _shared_limiters[key] = RateLimiter(requests_per_minute, tokens_per_minute)
+        return _shared_limiters[key]
+
+
+# Module testing
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+
+    print("RATE LIMITER TESTING")
+    print("=" * 40)
+
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=60000)
+    start = time.monotonic()
+    for _ in range(620):
+        limiter.acquire(10)
+    print(f"620 requests at 600 RPM took {time.monotonic() - start:.2f}s (expected ~2s)")
+
+    limiter.update_from_headers({"x-ratelimit-limit-tokens": "30000", "x-ratelimit-remaining-tokens": "100"})
+    print(f"Wait for 1000 tokens after header update: {limiter.time_until_available(1000):.2f}s")
+
+    async def burst():
+        await asyncio.gather(*(limiter.acquire_async(500) for _ in range(5)))
+
+    asyncio.run(burst())
+    print(f"Stats: {limiter.get_stats()}")
+    print("\nRate limiter testing completed!")
@@ -10,6 +10,7 @@ Separates questions from input Excel into 3 tabs based on OptionE column:
 Output: output/SeparatedQuestions.xlsx with 3 tabs
 """
 
+import numpy as np
 import pandas as pd
 import os
 import sys
@@ -149,6 +150,28 @@ class ExamSeparator:
         # Rule 2: OptionE has content but NOT "Answer not known" → Banking
         return 'banking'
 
+    def classify_column(self, option_e: pd.Series) -> np.ndarray:
+        """
+        Classify every row at once - vectorized equivalent of classify_row
+
+        Args:
+            option_e: The OptionE column
+
+        Returns:
+            Array of 'tnpsc', 'banking', or 'ssc_railways' aligned with the column
+        """
+        stripped = option_e.astype(str).str.strip()
+
+        # Rule 3: null, or a string that is empty after stripping → SSC/Railways
+        # (non-string values such as numbers are never blank, as in is_option_e_blank)
+        is_string = option_e.map(lambda value: isinstance(value, str))
+        blank = option_e.isna() | (is_string & (stripped == ''))
+
+        # Rule 1: exactly "Answer not known" → TNPSC; Rule 2: anything else → Banking
+        tnpsc = ~blank & (stripped == "Answer not known")
+
+        return np.select([blank, tnpsc], ['ssc_railways', 'tnpsc'], default='banking')
+
     def separate_questions(self) -> bool:
         """
         Separate questions into three DataFrames based on classification
@@ -159,25 +182,26 @@ class ExamSeparator:
         try:
             logger.info("Starting question separation...")
 
-            # Initialize empty DataFrames for each exam type
-            self.separated_dfs = {
-                'tnpsc': pd.DataFrame(columns=self.expected_columns),
-                'banking': pd.DataFrame(columns=self.expected_columns),
-                'ssc_railways': pd.DataFrame(columns=self.expected_columns)
-            }
+            # Classify all rows in one pass over the OptionE column
+            categories = self.classify_column(self.df['OptionE'])
 
-            # Classify each row
-            for idx, row in self.df.iterrows():
-                exam_type = self.classify_row(row)
+            # Expected columns first, then any extra input columns in their original order
+            columns = self.expected_columns + [col for col in self.df.columns
+                                               if col not in self.expected_columns]
 
-                # Add row to appropriate DataFrame
-                self.separated_dfs[exam_type] = pd.concat(
-                    [self.separated_dfs[exam_type], row.to_frame().T],
-                    ignore_index=True
-                )
+            # Split with one boolean mask per exam type, keeping input row order
+            self.separated_dfs = {}
+            for exam_type in self.tab_names:
+                mask = categories == exam_type
+                count = int(mask.sum())
+
+                if count:
+                    self.separated_dfs[exam_type] = self.df.loc[mask, columns].reset_index(drop=True)
+                else:
+                    self.separated_dfs[exam_type] = pd.DataFrame(columns=self.expected_columns)
 
                 # Update statistics
-                self.stats[f'{exam_type}_count'] += 1
+                self.stats[f'{exam_type}_count'] += count
 
             # Log statistics
             logger.info(f"Separation complete:")
@@ -219,9 +243,7 @@ class ExamSeparator:
             with pd.ExcelWriter(self.output_file, engine='openpyxl') as writer:
                 # Write each DataFrame to a separate tab
                 for exam_type, tab_name in self.tab_names.items():
-                    df = self.separated_dfs[exam_type].copy()
-
-
+                    df = self.separated_dfs[exam_type]
                     df.to_excel(writer, sheet_name=tab_name, index=False)
                     logger.info(f"  Written tab '{tab_name}': {len(df)} rows")
 
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Token Estimator - Prompt and completion token estimates for budgeting and rate limiting
+
+Counts prompt tokens with tiktoken's BPE tokenizer when it is installed.
+Without it, tokens are estimated from the prompt length using the observed
+tokens-per-character ratio of recent requests for the same exam. Per-question
+estimates (for budget checks made before any prompt exists) come from the
+rolling mean of actual prompt and completion tokens, or from a sample prompt
+until the first responses arrive.
+"""
+
+import logging
+import threading
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+# Optional local BPE tokenizer
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+# Used before anything has been observed: ~4 characters per token for English text
+DEFAULT_TOKENS_PER_CHAR = 0.25
+
+# Chat formatting tokens added around the messages of a request
+REQUEST_OVERHEAD_TOKENS = 10
+
+
+class TokenEstimator:
+    """
+    Token counts for prompts, calibrated per exam from actual usage
+
+    Features:
+    - Exact prompt counts with tiktoken when available
+    - Rolling per-exam calibration from reported prompt_tokens otherwise
+    - Rolling per-exam means of prompt and completion tokens per question
+    """
+
+    def __init__(self, model: str = "gpt-4o-mini", window: int = 200,
+                 default_prompt_tokens: int = 12000, default_output_tokens: int = 150):
+        """
+        Initialize the estimator
+
+        Args:
+            model: Model whose tokenizer should be used
+            window: Number of recent requests per exam kept for calibration
+            default_prompt_tokens: Per-question prompt estimate before any sample or history
+            default_output_tokens: Per-question completion estimate before any history
+        """
+        self.model = model
+        self.window = max(1, window)
+        self.default_prompt_tokens = default_prompt_tokens
+        self.default_output_tokens = default_output_tokens
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._history: Dict[str, Dict[str, deque]] = {}
+        self._samples: Dict[str, int] = {}
+        self.encoding = self._load_encoding(model)
+
+    def _load_encoding(self, model: str):
+        """Get the tiktoken encoding for a model (None if unavailable)"""
+        if not TIKTOKEN_AVAILABLE:
+            return None
+        try:
+            try:
+                return tiktoken.encoding_for_model(model)
+            except KeyError:
+                return tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            # tiktoken downloads its BPE files on first use; offline that fails
+            self.logger.warning(f"tiktoken unavailable ({e}); estimating tokens from observed usage")
+            return None
+
+    def _series(self, key: str) -> Dict[str, deque]:
+        if key not in self._history:
+            self._history[key] = {
+                "prompt_tokens": deque(maxlen=self.window),
+                "output_tokens": deque(maxlen=self.window),
+                "tokens_per_char": deque(maxlen=self.window)
+            }
+        return self._history[key]
+
+    def _mean(self, key: str, series: str) -> Optional[float]:
+        """Rolling mean for an exam, falling back to all exams (caller holds the lock)"""
+        values = self._history[key][series] if key in self._history else None
+        if not values:
+            values = [v for h in self._history.values() for v in h[series]]
+        return sum(values) / len(values) if values else None
+
+    def tokens_per_char(self, key: str = "") -> float:
+        """
+        Observed prompt tokens per character
+
+        Args:
+            key: Exam type (or other calibration key)
+
+        Returns:
+            Rolling mean ratio, or the default before any observation
+        """
+        with self._lock:
+            ratio = self._mean(key, "tokens_per_char")
+        return ratio if ratio is not None else DEFAULT_TOKENS_PER_CHAR
+
+    def count_tokens(self, text: str, key: str = "") -> int:
+        """
+        Estimate the prompt tokens of a request
+
+        Args:
+            text: All message text of the request (system and user)
+            key: Exam type used for calibration when tiktoken is missing
+
+        Returns:
+            Estimated prompt tokens
+        """
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=())) + REQUEST_OVERHEAD_TOKENS
+        return int(len(text) * self.tokens_per_char(key)) + REQUEST_OVERHEAD_TOKENS
+
+    def observe(self, key: str, prompt_chars: int, prompt_tokens: int, output_tokens: int,
+                questions: int = 1):
+        """
+        Record the actual usage of a completed request
+
+        Args:
+            key: Exam type (or other calibration key)
+            prompt_chars: Characters of message text that were sent
+            prompt_tokens: prompt_tokens reported by the API
+            output_tokens: completion_tokens reported by the API
+            questions: Questions classified by the request (per-question means are divided by it)
+        """
+        if prompt_tokens <= 0:
+            return
+        questions = max(1, questions)
+        with self._lock:
+            series = self._series(key)
+            series["prompt_tokens"].append(prompt_tokens / questions)
+            series["output_tokens"].append(output_tokens / questions)
+            if prompt_chars > 0:
+                series["tokens_per_char"].append(prompt_tokens / prompt_chars)
+
+    def prime(self, key: str, sample_prompt: str):
+        """
+        Set the per-question estimate for an exam from a representative prompt
+
+        Used until actual usage has been observed for that exam.
+
+        Args:
+            key: Exam type
+            sample_prompt: Full message text of a typical request
+        """
+        tokens = self.count_tokens(sample_prompt, key)
+        with self._lock:
+            self._samples[key] = tokens
+        self.logger.debug(f"Primed token estimate for {key or 'default'}: {tokens} prompt tokens")
+
+    def expected_tokens(self, key: str = "") -> Tuple[int, int]:
+        """
+        Expected tokens for one question
+
+        Args:
+            key: Exam type ("" uses all exams)
+
+        Returns:
+            Tuple of (prompt_tokens, output_tokens)
+        """
+        with self._lock:
+            if key in self._history and self._history[key]["prompt_tokens"]:
+                prompt = self._mean(key, "prompt_tokens")
+            elif key in self._samples:
+                prompt = self._samples[key]
+            else:
+                # Unknown exam: other exams' history, else the largest sample
+                prompt = self._mean(key, "prompt_tokens")
+                if prompt is None and self._samples:
+                    prompt = max(self._samples.values())
+            output = self._mean(key, "output_tokens")
+
+        return (int(round(prompt)) if prompt is not None else self.default_prompt_tokens,
+                int(round(output)) if output is not None else self.default_output_tokens)
+
+    def get_stats(self) -> Dict:
+        """Get calibration state per exam"""
+        with self._lock:
+            stats = {
+                "tokenizer": "tiktoken" if self.encoding is not None else "calibrated",
+                "exams": {}
+            }
+            for key, series in self._history.items():
+                count = len(series["prompt_tokens"])
+                stats["exams"][key or "default"] = {
+                    "observations": count,
+                    "mean_prompt_tokens": round(sum(series["prompt_tokens"]) / count, 1) if count else None,
+                    "mean_output_tokens": round(sum(series["output_tokens"]) / count, 1) if count else None,
+                    "tokens_per_char": (round(sum(series["tokens_per_char"]) / len(series["tokens_per_char"]), 4)
+                                        if series["tokens_per_char"] else None)
+                }
+        return stats
+
+
+# Module testing
+if __name__ == "__main__":
+    print("TOKEN ESTIMATOR TESTING")
+    print("=" * 40)
+
+    estimator = TokenEstimator()
+    print(f"Tokenizer: {estimator.get_stats()['tokenizer']}")
+
+    prompt = "You are classifying a question for the TNPSC exam.\n" + "\n".join(
+        f"{i}. Subject {i % 7} > Topic {i % 31} > Subtopic {i}" for i in range(1, 601))
+    print(f"Estimate before calibration: {estimator.count_tokens(prompt, 'TNPSC')}")
+
+    estimator.prime("TNPSC", prompt)
+    print(f"Per-question estimate (primed): {estimator.expected_tokens('TNPSC')}")
+
+    for _ in range(5):
+        estimator.observe("TNPSC", len(prompt), int(len(prompt) / 3.1), 120)
+    print(f"Estimate after calibration: {estimator.count_tokens(prompt, 'TNPSC')}")
+    print(f"Per-question estimate (observed): {estimator.expected_tokens('TNPSC')}")
+    print(f"Stats: {estimator.get_stats()}")
+
+    print("\nToken estimator testing completed!")
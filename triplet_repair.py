@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Triplet Repair - Local nearest-triplet matching for near-miss classifications
+
+When an AI answer is not an exact taxonomy triplet, the cause is usually a
+small copying error (a typo, changed punctuation, "&" for "and") or a subject
+taken from a neighbouring line. Matching the answer against the taxonomy
+locally fixes those without resending the whole prompt. Only confident,
+unambiguous matches are accepted; anything else still goes back to the model.
+"""
+
+import re
+import logging
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Set, Tuple
+
+# Similarity weight of each triplet level; the subtopic is the most specific
+LEVEL_WEIGHTS = (0.2, 0.3, 0.5)
+
+
+def normalize(text: str) -> str:
+    """
+    Normalize a taxonomy name for comparison
+
+    Args:
+        text: Subject, topic or subtopic name
+
+    Returns:
+        Lowercase text with "&" spelled out and punctuation collapsed to spaces
+    """
+    text = str(text).lower().replace("&", " and ")
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+
+def token_similarity(a: Set[str], b: Set[str]) -> float:
+    """Dice coefficient of two token sets"""
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+class TripletRepairer:
+    """
+    Nearest-triplet index over the triplets of one exam
+
+    Features:
+    - Normalized names and token sets precomputed once per classifier
+    - Candidates gathered from a token index instead of scanning every triplet
+    - Per-level similarity (edit ratio or token overlap, whichever is higher)
+    - Threshold and margin checks so ambiguous answers are re-prompted
+    """
+
+    def __init__(self, triplets: List[str], min_similarity: float = 0.85, min_margin: float = 0.03):
+        """
+        Build the index
+
+        Args:
+            triplets: Triplets in "Subject > Topic > Subtopic" form
+            min_similarity: Weighted similarity a repair must reach (0-1)
+            min_margin: Lead the best match needs over the next distinct triplet
+        """
+        self.triplets = triplets
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self.logger = logging.getLogger(__name__)
+
+        # Normalized levels and token sets per triplet
+        self._levels: List[Tuple[str, str, str]] = []
+        self._tokens: List[Tuple[Set[str], Set[str], Set[str]]] = []
+        self._token_index: Dict[str, Set[int]] = {}
+        self._exact: Dict[Tuple[str, str, str], int] = {}
+
+        for index, triplet in enumerate(triplets):
+            parts = triplet.split(" > ", 2)
+            if len(parts) != 3:
+                parts = (parts + ["", ""])[:3]
+            levels = tuple(normalize(part) for part in parts)
+            tokens = tuple(set(level.split()) for level in levels)
+            self._levels.append(levels)
+            self._tokens.append(tokens)
+            self._exact.setdefault(levels, index)
+            for token in tokens[1] | tokens[2]:
+                self._token_index.setdefault(token, set()).add(index)
+
+        self.stats = {"attempts": 0, "repaired": 0, "rejected": 0}
+
+    def _candidates(self, topic_tokens: Set[str], subtopic_tokens: Set[str]) -> Set[int]:
+        """Triplets sharing a topic or subtopic token with the answer (all if none do)"""
+        candidates = set()
+        for token in topic_tokens | subtopic_tokens:
+            candidates |= self._token_index.get(token, set())
+        return candidates or set(range(len(self.triplets)))
+
+    def similarity(self, index: int, levels: Tuple[str, str, str],
+                   tokens: Tuple[Set[str], Set[str], Set[str]]) -> float:
+        """
+        Weighted similarity between an answer and one taxonomy triplet
+
+        Args:
+            index: Triplet index
+            levels: Normalized (subject, topic, subtopic) of the answer
+            tokens: Token sets of the answer levels
+
+        Returns:
+            Similarity between 0 and 1
+        """
+        score = 0.0
+        for weight, answer, answer_tokens, known, known_tokens in zip(
+                LEVEL_WEIGHTS, levels, tokens, self._levels[index], self._tokens[index]):
+            if answer == known:
+                score += weight
+                continue
+            ratio = SequenceMatcher(None, answer, known, autojunk=False).ratio()
+            score += weight * max(ratio, token_similarity(answer_tokens, known_tokens))
+        return score
+
+    def repair(self, subject: str, topic: str, subtopic: str,
+               line_number: Optional[int] = None) -> Optional[Tuple[int, float]]:
+        """
+        Find the taxonomy triplet an answer most likely meant
+
+        Args:
+            subject: Subject given by the model
+            topic: Topic given by the model
+            subtopic: Subtopic given by the model
+            line_number: Line number cited by the model, if any
+
+        Returns:
+            Tuple of (triplet index, similarity), or None if no confident repair exists
+        """
+        self.stats["attempts"] += 1
+        levels = (normalize(subject), normalize(topic), normalize(subtopic))
+
+        # Differences only in case, punctuation or "&" vs "and"
+        if levels in self._exact:
+            self.stats["repaired"] += 1
+            return self._exact[levels], 1.0
+
+        tokens = tuple(set(level.split()) for level in levels)
+
+        # A cited line that agrees with the answer text is the strongest evidence
+        if line_number is not None:
+            try:
+                cited = int(line_number) - 1
+            except (TypeError, ValueError):
+                cited = -1
+            if 0 <= cited < len(self.triplets):
+                score = self.similarity(cited, levels, tokens)
+                if score >= self.min_similarity:
+                    self.stats["repaired"] += 1
+                    return cited, score
+
+        scored = sorted(((self.similarity(index, levels, tokens), index)
+                         for index in self._candidates(tokens[1], tokens[2])), reverse=True)
+        if not scored:
+            self.stats["rejected"] += 1
+            return None
+
+        best_score, best_index = scored[0]
+        runner_up = scored[1][0] if len(scored) > 1 else 0.0
+        if best_score < self.min_similarity or best_score - runner_up < self.min_margin:
+            self.logger.debug(f"No confident repair (best {best_score:.2f}, runner-up {runner_up:.2f})")
+            self.stats["rejected"] += 1
+            return None
+
+        self.stats["repaired"] += 1
+        return best_index, best_score
+
+    def get_stats(self) -> Dict:
+        """Get repair counts"""
+        return dict(self.stats)
+
+
+# Module testing
+if __name__ == "__main__":
+    from taxonomy_constants import get_taxonomy_for_exam
+
+    print("TRIPLET REPAIR TESTING")
+    print("=" * 40)
+
+    triplets = get_taxonomy_for_exam("TNPSC")["triplets"]
+    repairer = TripletRepairer(triplets)
+    target = next(t for t in triplets if "Justice Party" in t)
+    subject, topic, subtopic = target.split(" > ")
+
+    cases = [
+        ("typo", (subject, topic, subtopic[:-1])),
+        ("ampersand", (subject.replace("&", "and"), topic, subtopic)),
+        ("mixed-up subject", ("History, Culture of India and Indian National Movement", topic, subtopic)),
+        ("invented", ("Sports", "Cricket", "World Cup Winners"))
+    ]
+    for name, answer in cases:
+        result = repairer.repair(*answer)
+        repaired = f"{triplets[result[0]]} ({result[1]:.2f})" if result else "not repaired"
+        print(f"{name}: {repaired}")
+
+    print(f"Stats: {repairer.get_stats()}")
+    print("\nTriplet repair testing completed!")
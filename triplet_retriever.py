@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Triplet Retriever - Local BM25 index over exam-specific taxonomy triplets
+
+Pre-selects the most relevant Subject > Topic > Subtopic triplets for a question
+so that classification prompts only need to carry a short candidate list instead
+of the full exam taxonomy (600+ triplets).
+"""
+
+import math
+import re
+import logging
+from collections import Counter
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Common English words that carry no topical signal
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "did", "do", "does",
+    "following", "for", "from", "has", "have", "how", "in", "into", "is", "it",
+    "its", "of", "on", "or", "so", "that", "the", "their", "there", "these",
+    "this", "those", "to", "was", "were", "what", "when", "where", "which", "who",
+    "whom", "why", "will", "with", "would", "you", "your", "not", "known",
+    "answer", "correct", "option", "options", "explanation", "statement",
+    "statements", "given", "choose", "select", "find", "above", "none", "all",
+    "both", "only", "one", "two", "three", "four", "etc"
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase, lightly stemmed terms
+
+    Args:
+        text: Text to tokenize
+
+    Returns:
+        List of terms with stopwords removed
+    """
+    terms = []
+    for token in re.findall(r"[a-z0-9]+", str(text).lower()):
+        if len(token) < 2 or token in STOPWORDS:
+            continue
+        # Light plural stemming so "rivers" matches "river"
+        if len(token) > 4 and token.endswith("ies"):
+            token = token[:-3] + "y"
+        elif len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        terms.append(token)
+    return terms
+
+
+class TripletRetriever:
+    """
+    BM25 retriever over the triplets of one exam
+
+    Features:
+    - Index built once per classifier, scoring is a few NumPy operations
+    - Subtopic terms weighted higher than subject terms
+    - Confidence check so callers can fall back to the full list
+    """
+
+    def __init__(self, triplets: List[str], k1: float = 1.5, b: float = 0.75,
+                 subtopic_weight: int = 2):
+        """
+        Build the index
+
+        Args:
+            triplets: Triplets in "Subject > Topic > Subtopic" form
+            k1: BM25 term frequency saturation
+            b: BM25 length normalization
+            subtopic_weight: How many times subtopic terms are counted
+        """
+        self.triplets = triplets
+        self.k1 = k1
+        self.b = b
+        self.logger = logging.getLogger(__name__)
+
+        # Build term postings: term -> (document indices, term frequencies)
+        doc_lengths = np.zeros(len(triplets), dtype=np.float64)
+        postings: Dict[str, Dict[int, int]] = {}
+
+        for doc_id, triplet in enumerate(triplets):
+            parts = triplet.split(" > ")
+            terms = tokenize(" ".join(parts[:-1]))
+            terms += tokenize(parts[-1]) * subtopic_weight
+            doc_lengths[doc_id] = len(terms)
+            for term, count in Counter(terms).items():
+                postings.setdefault(term, {})[doc_id] = count
+
+        # Triplets grouped by "Subject > Topic" so shortlists can include siblings
+        self._topic_groups: Dict[str, List[int]] = {}
+        for doc_id, triplet in enumerate(triplets):
+            self._topic_groups.setdefault(triplet.rsplit(" > ", 1)[0], []).append(doc_id)
+
+        num_docs = max(1, len(triplets))
+        avg_length = doc_lengths.mean() if len(triplets) else 1.0
+        self._length_norm = k1 * (1 - b + b * doc_lengths / max(avg_length, 1.0))
+
+        self._postings = {}
+        for term, docs in postings.items():
+            doc_ids = np.fromiter(docs.keys(), dtype=np.int64, count=len(docs))
+            freqs = np.fromiter(docs.values(), dtype=np.float64, count=len(docs))
+            idf = math.log(1 + (num_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            self._postings[term] = (doc_ids, freqs, idf)
+
+        self.logger.debug(f"Triplet index built: {len(triplets)} triplets, {len(self._postings)} terms")
+
+    def score(self, text: str) -> np.ndarray:
+        """
+        Score every triplet against the given text
+
+        Args:
+            text: Question (and explanation) text
+
+        Returns:
+            Array of BM25 scores aligned with the triplet list
+        """
+        scores = np.zeros(len(self.triplets), dtype=np.float64)
+        for term in set(tokenize(text)):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            doc_ids, freqs, idf = posting
+            scores[doc_ids] += idf * freqs * (self.k1 + 1) / (freqs + self._length_norm[doc_ids])
+        return scores
+
+    def shortlist(self, text: str, top_k: int = 40, min_top_score: float = 5.0,
+                  min_matched_terms: int = 2, min_candidates: int = 10) -> Optional[List[int]]:
+        """
+        Pick the top-K candidate triplets for a question
+
+        The best hits are expanded with their sibling subtopics (same subject
+        and topic) so the model can still choose a neighbouring subtopic.
+
+        Args:
+            text: Question (and explanation) text
+            top_k: Maximum number of candidates to return
+            min_top_score: Best score required to trust the shortlist
+            min_matched_terms: Distinct query terms that must exist in the index
+            min_candidates: Smallest shortlist worth sending
+
+        Returns:
+            Candidate indices in taxonomy order, or None when retrieval is
+            too uncertain and the full list should be used instead
+        """
+        if top_k <= 0 or top_k >= len(self.triplets):
+            return None
+
+        matched_terms = sum(1 for term in set(tokenize(text)) if term in self._postings)
+        if matched_terms < min_matched_terms:
+            return None
+
+        scores = self.score(text)
+        ranked = np.argsort(-scores, kind="stable")
+        if scores[ranked[0]] < min_top_score:
+            return None
+
+        candidates = []
+        seen = set()
+        for doc_id in ranked:
+            if scores[doc_id] <= 0 or len(candidates) >= top_k:
+                break
+            group = self._topic_groups[self.triplets[doc_id].rsplit(" > ", 1)[0]]
+            for member in [int(doc_id)] + group:
+                if member not in seen and len(candidates) < top_k:
+                    seen.add(member)
+                    candidates.append(member)
+
+        if len(candidates) < min_candidates:
+            return None
+
+        # Keep taxonomy order so related triplets stay grouped in the prompt
+        return sorted(candidates)